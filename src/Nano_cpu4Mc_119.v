@@ -13,13 +13,46 @@
 // 8/dic/2025
 //=============================================================================
 
+// Multiplier of UMUL/SMUL/UMAC/SMAC (xmul_exe), selected at build time:
+//    0: iterative, one bit of SR2 per clock (16 passes + result)
+//    1: radix 4, two bits of SR2 per clock (8 passes + result)
+//    2: single cycle, the whole product in one pass (1 pass + result)
+// Every mode leaves WR33, SR1, SR2, CNT and F as the iterative one.
+//
+// Shifter of SRACC/SRAACC/SLACC (sxacc_exe), selected at build time:
+//    0: iterative, one position per clock (A[5:0] passes + result)
+//    1: barrel, all the positions in one pass (1 pass + result, or only
+//       the result when A[5:0] is 0)
+// Both modes leave WR33, CNT, R and F with the same values.
+//
+// Operand prefetch, selected at build time:
+//    0: one operand byte per clock from `code`
+//    1: the state that reads the first byte of a two bytes operand (address,
+//       constant or immediate and port of OUTK) also takes the second one
+//       from `code_nxt` (code byte at code_add+1), saving one clock in
+//       JMP/CALL, the taken conditional jumps, MOVK*, the direct and indirect
+//       memory moves and OUTK.
+// Both modes leave the registers with the same values at every fetch_decode.
+`ifndef NANO_MUL_MODE
+`define NANO_MUL_MODE 0
+`endif
+`ifndef NANO_SHIFT_MODE
+`define NANO_SHIFT_MODE 0
+`endif
+`ifndef NANO_PREFETCH
+`define NANO_PREFETCH 0
+`endif
+
 module Nano_cpu
+   #(parameter MUL_MODE = `NANO_MUL_MODE,
+     parameter SHIFT_MODE = `NANO_SHIFT_MODE,
+     parameter PREFETCH = `NANO_PREFETCH)
    (
     input wire clk, reset,
     input wire run,
     output wire [7:0] state, flags,
     output wire [11:0] code_add,
-    input wire [7:0] code,
+    input wire [7:0] code, code_nxt,
     output wire [10:0] data_add,
     input wire [15:0] din,
     output wire [15:0] dout,
@@ -335,6 +368,15 @@ module Nano_cpu
    // Temporal bus
    wire [11:0] IP_bak;
 
+   // Multiplier partial products (MUL_MODE 1) and products (MUL_MODE 2)
+   wire [32:0] mul_pp0, mul_pp1;
+   wire [31:0] mul_u;
+   wire signed [31:0] mul_s;
+
+   // Barrel shifter results (SHIFT_MODE 1)
+   wire [32:0] shift_r, shift_l;
+   wire signed [31:0] shift_ra;
+
    // body
    // FSMD state & data registers
    always @(posedge clk, posedge reset)
@@ -896,7 +938,13 @@ module Nano_cpu
           begin	
             IP_next = IP_reg + 1;
             H_next = code;
-            state_next = load_la_jmp;
+            if (PREFETCH == 1)
+             begin
+               L_next = code_nxt;
+               state_next = load_ip;
+             end
+            else
+               state_next = load_la_jmp;
           end	
          load_la_jmp :
           begin	
@@ -1038,9 +1086,18 @@ module Nano_cpu
 		end
          load_ha_call : 
           begin	
-               IP_next = IP_reg + 1;
                H_next = code;
-               state_next = load_la_call;
+               if (PREFETCH == 1)
+                begin
+                  IP_next = IP_reg + 2;
+                  L_next = code_nxt;
+                  state_next = push_ip;
+                end
+               else
+                begin
+                  IP_next = IP_reg + 1;
+                  state_next = load_la_call;
+                end
           end	
          load_la_call :
           begin	
@@ -1145,9 +1202,31 @@ module Nano_cpu
           end	
          load_khx : 
           begin	
-               IP_next = IP_reg + 1;
                H_next = code;
-               state_next = load_klx;
+               if (PREFETCH == 1)
+                begin
+                  IP_next = IP_reg + 2;
+                  L_next = code_nxt;
+                  case (instruction_reg)
+                       movka_code :
+                           state_next = store_ka;
+                       movkb_code :
+                           state_next = store_kb;
+                       movki_code :
+                           state_next = store_ki;
+                       movkj_code :
+                           state_next = store_kj;
+                       movkn_code :
+                           state_next = store_kn;
+                       default :
+                           state_next = store_km;
+                  endcase
+                end
+               else
+                begin
+                  IP_next = IP_reg + 1;
+                  state_next = load_klx;
+                end
           end	
          load_klx :
           begin	
@@ -1206,9 +1285,18 @@ module Nano_cpu
           end	
          load_hi_movxm : 
           begin	
-               IP_next = IP_reg + 1;
                H_next = code;
-               state_next = load_li_movxm;
+               if (PREFETCH == 1)
+                begin
+                  IP_next = IP_reg + 2;
+                  L_next = code_nxt;
+                  state_next = load_dp_movxm;
+                end
+               else
+                begin
+                  IP_next = IP_reg + 1;
+                  state_next = load_li_movxm;
+                end
           end	
          load_li_movxm :
           begin	
@@ -1240,9 +1328,18 @@ module Nano_cpu
                state_next = fetch_decode;
          load_hi_movmx : 
           begin	
-               IP_next = IP_reg + 1;
                H_next = code;
-               state_next = load_li_movmx;
+               if (PREFETCH == 1)
+                begin
+                  IP_next = IP_reg + 2;
+                  L_next = code_nxt;
+                  state_next = load_dp_movmx;
+                end
+               else
+                begin
+                  IP_next = IP_reg + 1;
+                  state_next = load_li_movmx;
+                end
           end	
          load_li_movmx :
           begin	
@@ -1301,9 +1398,18 @@ module Nano_cpu
 		end
          load_hi_movi : 
           begin	
-              IP_next = IP_reg + 1;
               H_next = code;
-              state_next = load_li_movi;
+              if (PREFETCH == 1)
+               begin
+                 IP_next = IP_reg + 2;
+                 L_next = code_nxt;
+                 state_next = load_dp_movi;
+               end
+              else
+               begin
+                 IP_next = IP_reg + 1;
+                 state_next = load_li_movi;
+               end
           end	
          load_li_movi :
           begin	
@@ -1504,18 +1610,46 @@ module Nano_cpu
           begin	
               if (CNT_reg < 16)
 	       begin	
-                if (SR2_reg[0])
+                if (MUL_MODE == 2)
+                 begin
                     if ((instruction_reg==umul_code) || (instruction_reg==umac_code))
-                        WR33_next = WR33_reg + SR1_reg;
+                        WR33_next = {1'b0, mul_u};
                     else
-                        if (CNT_reg == 15)
-                            WR33_next = WR33_reg + ~SR1_reg + 1;
+                        WR33_next = {mul_s[31], mul_s};
+
+                    CNT_next = 16;
+                    SR1_next = {SR1_reg[16:0], 16'b0000000000000000};
+                    SR2_next = {16'b0000000000000000, SR2_reg[32:16]};
+                 end
+                else if (MUL_MODE == 1)
+                 begin
+                    if ((instruction_reg==umul_code) || (instruction_reg==umac_code))
+                        WR33_next = WR33_reg + mul_pp0 + mul_pp1;
+                    else
+                        if (CNT_reg == 14)
+                            WR33_next = WR33_reg + mul_pp0 + ~mul_pp1 + 1;
                         else
+                            WR33_next = WR33_reg + mul_pp0 + mul_pp1;
+
+                    CNT_next = CNT_reg + 2;
+                    SR1_next = {SR1_reg[30:0], 2'b00};
+                    SR2_next = {2'b00, SR2_reg[32:2]};
+                 end
+                else
+                 begin
+                    if (SR2_reg[0])
+                        if ((instruction_reg==umul_code) || (instruction_reg==umac_code))
                             WR33_next = WR33_reg + SR1_reg;
-                    
-                CNT_next = CNT_reg + 1;
-                SR1_next = {SR1_reg[31:0], 1'b0}; 
-                SR2_next = {1'b0, SR2_reg[32:1]}; 
+                        else
+                            if (CNT_reg == 15)
+                                WR33_next = WR33_reg + ~SR1_reg + 1;
+                            else
+                                WR33_next = WR33_reg + SR1_reg;
+
+                    CNT_next = CNT_reg + 1;
+                    SR1_next = {SR1_reg[31:0], 1'b0}; 
+                    SR2_next = {1'b0, SR2_reg[32:1]}; 
+                 end
                 state_next = xmul_exe;
 	       end	
               else
@@ -1591,6 +1725,19 @@ module Nano_cpu
                 R_next = WR33_reg[31:0];
                 state_next = fetch_decode;
 	       end
+              else if (SHIFT_MODE == 1)
+	       begin
+                if (instruction_reg == sracc_code)
+                    WR33_next = shift_r;
+                else
+                    if (instruction_reg == sraacc_code)
+                        WR33_next = {shift_ra[31], shift_ra};
+                    else
+                        WR33_next = shift_l;
+
+                  CNT_next = 0;
+                  state_next = sxacc_exe;
+	       end
               else
 	       begin
                 if ((instruction_reg == sracc_code) || (instruction_reg == sraacc_code))
@@ -1652,9 +1799,18 @@ module Nano_cpu
           end	
          load_iok : 
           begin	
-               IP_next = IP_reg + 1;
                H_next = code;
-               state_next = ld_ioadd4k;
+               if (PREFETCH == 1)
+                begin
+                  IP_next = IP_reg + 2;
+                  PP_next = code_nxt;
+                  state_next = outk_exe;
+                end
+               else
+                begin
+                  IP_next = IP_reg + 1;
+                  state_next = ld_ioadd4k;
+                end
           end	
          ld_ioadd4k : 
           begin	
@@ -1848,6 +2004,13 @@ module Nano_cpu
 
    //interconnection:
    assign IP_bak = IP_reg-1;
+   assign mul_pp0 = SR2_reg[0] ? SR1_reg : 33'h000000000;
+   assign mul_pp1 = SR2_reg[1] ? {SR1_reg[31:0], 1'b0} : 33'h000000000;
+   assign mul_u = A_reg * B_reg;
+   assign mul_s = $signed(A_reg) * $signed(B_reg);
+   assign shift_r = WR33_reg >> CNT_reg;
+   assign shift_l = WR33_reg << CNT_reg;
+   assign shift_ra = $signed(WR33_reg[31:0]) >>> CNT_reg;
    
    //outputs
    assign state = state_reg;
@@ -20,8 +20,19 @@
 //=============================================================================
 //////////////////////////////////////////////////////////////////////////////////
 
+// Latch de observacion de R y F, seleccionado al sintetizar:
+//    0: OUT_CTRL 4..7 presentan R_reg y F_reg en vivo
+//    1: R_reg y F_reg se capturan en cada reloj con OUT_CTRL[2]=0 y se
+//       congelan mientras OUT_CTRL[2]=1, asi OUT_CTRL 4..7 presentan la
+//       copia tomada en el ultimo reloj con OUT_CTRL 0..3, coherente con el
+//       State_reg leido antes de ese reloj, aunque el CPU siga corriendo.
+// OUT_CTRL 0..3 presentan siempre los registros en vivo.
+`ifndef NANO_OUT_LATCH
+`define NANO_OUT_LATCH 0
+`endif
 
 module Nano_mcsys_4Tiny
+   #(parameter OUT_LATCH = `NANO_OUT_LATCH)
 (
     input CLK,NRST,RUN,MODE,
     input [2:0] OUT_CTRL,
@@ -59,6 +70,7 @@ module Nano_mcsys_4Tiny
     
     wire [7:0] spi2rom_dout;
     wire [7:0] cpu2rom_dout;
+    wire [7:0] cpu2rom_nxt;
 
     wire [7:0] spi2rom_din;
     wire [7:0] mxd_rom_din;
@@ -66,6 +78,7 @@ module Nano_mcsys_4Tiny
     wire [11:0] spi2rom_add;
     wire [11:0] cpu2rom_add;
     wire [11:0] mxd_rom_add;
+    wire [11:0] nxt_rom_add;
 
     wire spi2rom_we;
     wire mxd_rom_we;
@@ -87,22 +100,31 @@ module Nano_mcsys_4Tiny
     wire [7:0] state_byte;
     wire [7:0] flags_byte;
     wire [31:0] R_word;
+    wire [7:0] obs_flags;
+    wire [31:0] obs_R;
+    reg [7:0] snap_flags;
+    reg [31:0] snap_R;
 
     wire cs_top_rom;
     wire top_rom_we;
     wire bottom_rom_we;
     wire [7:0] top_rom_dout;
     wire [7:0] bottom_rom_dout;
+    wire cs_top_nxt;
+    wire [7:0] top_rom_nxt;
+    wire [7:0] bottom_rom_nxt;
 
     //instantiations:
     sync_ram #(.DATA_WIDTH(16), .ADD_WIDTH(5)) my_ram
     (.clk(mxd_mem_clk), .we(mxd_ram_we), .datain(mxd_ram_din), .address(mxd_ram_add[4:0]), .dataout(cpu2ram_dout));
 
-    sync_ram #(.DATA_WIDTH(8), .ADD_WIDTH(7)) my_top_rom
-    (.clk(mxd_mem_clk), .we(top_rom_we), .datain(mxd_rom_din), .address(mxd_rom_add[6:0]), .dataout(top_rom_dout));
+    sync_ram_2r #(.DATA_WIDTH(8), .ADD_WIDTH(7)) my_top_rom
+    (.clk(mxd_mem_clk), .we(top_rom_we), .datain(mxd_rom_din), .address(mxd_rom_add[6:0]), .dataout(top_rom_dout),
+     .address_b(nxt_rom_add[6:0]), .dataout_b(top_rom_nxt));
 
-    sync_ram #(.DATA_WIDTH(8), .ADD_WIDTH(7)) my_bottom_rom
-    (.clk(mxd_mem_clk), .we(bottom_rom_we), .datain(mxd_rom_din), .address(mxd_rom_add[6:0]), .dataout(bottom_rom_dout));
+    sync_ram_2r #(.DATA_WIDTH(8), .ADD_WIDTH(7)) my_bottom_rom
+    (.clk(mxd_mem_clk), .we(bottom_rom_we), .datain(mxd_rom_din), .address(mxd_rom_add[6:0]), .dataout(bottom_rom_dout),
+     .address_b(nxt_rom_add[6:0]), .dataout_b(bottom_rom_nxt));
 
     sync_ram #(.DATA_WIDTH(16), .ADD_WIDTH(4)) my_stack
     (.clk(mem_clk), .we(cpu2stk_we), .datain(cpu2stk_din), .address(cpu2stk_add[3:0]), .dataout(cpu2stk_dout));
@@ -130,6 +152,7 @@ module Nano_mcsys_4Tiny
     .flags(flags_byte),
     .code_add(cpu2rom_add),
     .code(cpu2rom_dout),
+    .code_nxt(cpu2rom_nxt),
     .data_add(cpu2ram_add),
     .din(cpu2ram_dout),
     .dout(cpu2ram_din),
@@ -196,13 +219,31 @@ module Nano_mcsys_4Tiny
     assign mxd_rom_we = (MODE) ? 1'b0 :  spi2rom_we;
     assign mxd_mem_clk = (MODE) ? mem_clk :  prog_clk;
   
+   //Observation latch of R and F (OUT_LATCH=1):
+     always @(posedge CLK, posedge loc_rst)
+     begin
+        if (loc_rst)
+           begin
+              snap_R <= 32'h00000000;
+              snap_flags <= 8'h00;
+           end
+        else if (~OUT_CTRL[2])
+           begin
+              snap_R <= R_word;
+              snap_flags <= flags_byte;
+           end
+     end
+
+     assign obs_R = (OUT_LATCH == 1) ? snap_R : R_word;
+     assign obs_flags = (OUT_LATCH == 1) ? snap_flags : flags_byte;
+
    //8 to 1 multiplexor for OUT8B:
-     assign OUT8B = (OUT_CTRL[2] ? (OUT_CTRL[1] ? (OUT_CTRL[0] ? R_word[31:24] : R_word[23:16]) : (OUT_CTRL[0] ? R_word[15:8] : R_word[7:0])) 
+     assign OUT8B = (OUT_CTRL[2] ? (OUT_CTRL[1] ? (OUT_CTRL[0] ? obs_R[31:24] : obs_R[23:16]) : (OUT_CTRL[0] ? obs_R[15:8] : obs_R[7:0])) 
                               :
                              (OUT_CTRL[1] ? (OUT_CTRL[0] ? state_byte : state_byte) : (OUT_CTRL[0] ? state_byte : state_byte)));
 
    //8 to 1 multiplexor for OUT4B:
-     assign OUT4B = (OUT_CTRL[2] ? (OUT_CTRL[1] ? (OUT_CTRL[0] ? flags_byte[7:4] : flags_byte[7:4]) : (OUT_CTRL[0] ? flags_byte[3:0] : flags_byte[3:0])) 
+     assign OUT4B = (OUT_CTRL[2] ? (OUT_CTRL[1] ? (OUT_CTRL[0] ? obs_flags[7:4] : obs_flags[7:4]) : (OUT_CTRL[0] ? obs_flags[3:0] : obs_flags[3:0])) 
                               :
                              (OUT_CTRL[1] ? (OUT_CTRL[0] ? R_word[15:12] : R_word[11:8]) : (OUT_CTRL[0] ? R_word[7:4] : R_word[3:0])));
     
@@ -210,6 +251,11 @@ module Nano_mcsys_4Tiny
     //2 to 1 multiplexor for cpu2rom_dout:
      assign cpu2rom_dout = (cs_top_rom ? top_rom_dout : bottom_rom_dout);
 
+    //Code byte after code_add (second read port, for the prefetch of Nano_cpu):
+     assign nxt_rom_add = cpu2rom_add + 1;
+     assign cs_top_nxt = nxt_rom_add[11] & nxt_rom_add[10] & nxt_rom_add[9] & nxt_rom_add[8] & nxt_rom_add[7];
+     assign cpu2rom_nxt = (cs_top_nxt ? top_rom_nxt : bottom_rom_nxt);
+
     //CS logic:
      assign cs_top_rom = mxd_rom_add[11] & mxd_rom_add[10] & mxd_rom_add[9] & mxd_rom_add[8] & mxd_rom_add[7];
      assign top_rom_we =  mxd_rom_we & cs_top_rom;
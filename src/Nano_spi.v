@@ -9,6 +9,27 @@
 // La expresion para calcular la velocidad de SCK es la siguiente:
 // f_sck= clk/8
 //
+// Modo rafaga (burst): con el bit 13 de la direccion en 1 (bit 29 de la
+// palabra, espacios 0x2000-0x2FFF de codigo y 0x6000-0x67FF de datos) la
+// trama de 32 bits es solo el encabezado de una rafaga. Mientras CS siga en
+// bajo, cada palabra adicional de 16 bits va a la siguiente localidad:
+//    escritura: el dato del encabezado y cada palabra siguiente se escriben
+//               en localidades consecutivas (dos bytes de codigo por palabra,
+//               el de la direccion menor en los bits [15:8]),
+//    lectura:   la respuesta de 32 bits (encabezado y primera palabra) sigue
+//               con palabras de 16 bits de las localidades siguientes.
+// Entre las palabras de una rafaga SCK debe quedar en alto al menos 8
+// ciclos de reloj adicionales (tiempo de acceso a la memoria), y despues de
+// una rafaga (o de un comando de lectura en rafaga) CS debe quedar en alto
+// esos 8 ciclos adicionales.
+//
+// Lecturas encadenadas: durante la trama de respuesta de una lectura simple
+// el esclavo recibe MOSI. Si la palabra recibida es otro comando de lectura
+// (simple o en rafaga) se ejecuta como si llegara en una trama propia y la
+// siguiente trama es su respuesta, asi n lecturas simples ocupan n+1 tramas
+// en lugar de 2n. La palabra 0xFFFFFFFF (MOSI en alto, direccion 0x7FFF
+// reservada) no es un comando y termina la cadena.
+//
 //=============================================================================
 // *Codigo para el componente slave_spi4nano*
 // Version validada con OpenLane e iVerilog/cocotb
@@ -71,6 +92,9 @@ module slave_spi4nano
    reg cwe_buf_reg, cwe_buf_next;
    reg dwe_buf_reg, dwe_buf_next;
    reg pclk_buf_reg, pclk_buf_next;
+   reg Bst_reg, Bst_next;     // Burst command in progress
+   reg Lob_reg, Lob_next;     // Low byte of a code word of the burst
+   reg Nxt_reg, Nxt_next;     // Burst read past its response frame
    
 
    // body
@@ -90,6 +114,9 @@ module slave_spi4nano
          	cwe_buf_reg <= 1'b0;
          	dwe_buf_reg <= 1'b0;
          	pclk_buf_reg <= 1'b0;
+         	Bst_reg <= 1'b0;
+         	Lob_reg <= 1'b0;
+         	Nxt_reg <= 1'b0;
          end
       else
          begin
@@ -105,6 +132,9 @@ module slave_spi4nano
          	cwe_buf_reg <= cwe_buf_next;
          	dwe_buf_reg <= dwe_buf_next;
          	pclk_buf_reg <= pclk_buf_next;
+         	Bst_reg <= Bst_next;
+         	Lob_reg <= Lob_next;
+         	Nxt_reg <= Nxt_next;
          end
 
    // FSMD next-state logic
@@ -118,6 +148,9 @@ module slave_spi4nano
       cout_buf_next = cout_buf_reg;
       dadd_buf_next = dadd_buf_reg;
       dout_buf_next = dout_buf_reg;
+      Bst_next = Bst_reg;
+      Lob_next = Lob_reg;
+      Nxt_next = Nxt_reg;
 
       case (state_reg)
          idle1 :
@@ -129,6 +162,9 @@ module slave_spi4nano
             
             SRi_next = 0;
             Cnt_next = 0;
+            Bst_next = 1'b0;
+            Lob_next = 1'b0;
+            Nxt_next = 1'b0;
           end
           
          wait_low_i :
@@ -153,7 +189,10 @@ module slave_spi4nano
             if (~CS)
                if (SCK)
                 begin
-                  SRi_next = {SRi_reg[30 : 0],  MOSI};
+                  if (Bst_reg)
+                     SRi_next = {SRi_reg[31 : 16], SRi_reg[14 : 0],  MOSI};
+                  else
+                     SRi_next = {SRi_reg[30 : 0],  MOSI};
                   
                   if (Cnt_reg == 31)
                      state_next = do_state;
@@ -173,6 +212,7 @@ module slave_spi4nano
 
          do_state :
           begin	
+            Bst_next = SRi_reg[29];
             if (SRi_reg[31])
                if (SRi_reg[30]) 
                 begin
@@ -188,14 +228,19 @@ module slave_spi4nano
              begin
                if (SRi_reg[30]) 
                 begin
-                  dadd_buf_next = SRi_reg[26 : 16];
+                  if (~Bst_reg)
+                     dadd_buf_next = SRi_reg[26 : 16];
                   dout_buf_next =  SRi_reg[15 : 0];
                   state_next = ini_write_ram;
                 end
                else
                 begin
-                  cadd_buf_next = SRi_reg[27 : 16];
-                  cout_buf_next =  SRi_reg[7 : 0];
+                  if (~Bst_reg)
+                     cadd_buf_next = SRi_reg[27 : 16];
+                  if (SRi_reg[29])
+                     cout_buf_next =  SRi_reg[15 : 8];
+                  else
+                     cout_buf_next =  SRi_reg[7 : 0];
                   state_next = ini_write_rom;
                 end
                SRo_next = SRi_reg;
@@ -210,8 +255,34 @@ module slave_spi4nano
             
          read_rom :
           begin	         
-            SRo_next = {SRi_reg[31 : 16], 8'b00000000, cin_prg};
-            state_next = end2;
+            if (~Bst_reg)
+             begin
+               SRo_next = {SRi_reg[31 : 16], 8'b00000000, cin_prg};
+               state_next = end2;
+             end
+            else if (~Lob_reg)
+             begin
+               SRo_next = {SRi_reg[31 : 16], cin_prg, 8'b00000000};
+               cadd_buf_next = cadd_buf_reg + 1;
+               Lob_next = 1'b1;
+               state_next = ini_read_rom;
+             end
+            else
+             begin
+               if (Nxt_reg)
+                begin
+                  SRo_next = {SRo_reg[15 : 8], cin_prg, 16'h0000};
+                  Cnt_next = 16;
+                  state_next = wait_low_o;
+                end
+               else
+                begin
+                  SRo_next = {SRo_reg[31 : 8], cin_prg};
+                  state_next = end2;
+                end
+               cadd_buf_next = cadd_buf_reg + 1;
+               Lob_next = 1'b0;
+             end
           end
            
          ini_read_ram :
@@ -222,8 +293,19 @@ module slave_spi4nano
             
          read_ram :
           begin	         
-            SRo_next = {SRi_reg[31 : 16], din_prg};
-            state_next = end2;
+            if (Nxt_reg)
+             begin
+               SRo_next = {din_prg, 16'h0000};
+               Cnt_next = 16;
+               state_next = wait_low_o;
+             end
+            else
+             begin
+               SRo_next = {SRi_reg[31 : 16], din_prg};
+               state_next = end2;
+             end
+            if (Bst_reg)
+               dadd_buf_next = dadd_buf_reg + 1;
           end
            
          ini_write_rom :
@@ -235,7 +317,24 @@ module slave_spi4nano
          write_rom :
           begin	         
             SRo_next = SRi_reg;
-            state_next = end1;
+            if (~Bst_reg)
+               state_next = end1;
+            else
+             begin
+               cadd_buf_next = cadd_buf_reg + 1;
+               if (~Lob_reg)
+                begin
+                  cout_buf_next = SRi_reg[7 : 0];
+                  Lob_next = 1'b1;
+                  state_next = ini_write_rom;
+                end
+               else
+                begin
+                  Lob_next = 1'b0;
+                  Cnt_next = 16;
+                  state_next = wait_low_i;
+                end
+             end
           end
            
          ini_write_ram :
@@ -247,7 +346,14 @@ module slave_spi4nano
          write_ram :
           begin	         
             SRo_next = SRi_reg;
-            state_next = end1;
+            if (~Bst_reg)
+               state_next = end1;
+            else
+             begin
+               dadd_buf_next = dadd_buf_reg + 1;
+               Cnt_next = 16;
+               state_next = wait_low_i;
+             end
           end
            
          end1 :
@@ -288,14 +394,30 @@ module slave_spi4nano
                        
          wait_high_o :
             if (~CS)
-               if (SCK)                  
+               if (SCK)
+                begin
+                  if (~Bst_reg)
+                     SRi_next = {SRi_reg[30 : 0],  MOSI};
+
                   if (Cnt_reg == 31)
-                     state_next = end1;
+                     if (Bst_reg)
+                      begin
+                        Nxt_next = 1'b1;
+                        if (SRi_reg[30])
+                           state_next = ini_read_ram;
+                        else
+                           state_next = ini_read_rom;
+                      end
+                     else if (SRi_reg[30] & (SRi_reg[29 : 15] != 15'h7FFF))
+                        state_next = do_state;     // Read command chained in the response frame
+                     else
+                        state_next = end1;
                   else
                    begin
                      Cnt_next = Cnt_reg+1;
                      state_next = wait_low_o;
                    end
+                end
                else
                   state_next = wait_high_o;
                
@@ -35,3 +35,32 @@ module sync_ram
   assign dataout = ram[address];
 
 endmodule
+
+//==========================================================
+// sync_ram with a second read-only port (address_b/dataout_b),
+// for the instruction prefetch of Nano_cpu (PREFETCH=1)
+//==========================================================
+
+module sync_ram_2r
+   #(parameter DATA_WIDTH=8, ADD_WIDTH=8)
+   (
+    input wire clk,we, 
+    input wire [DATA_WIDTH-1:0] datain,
+    input wire [ADD_WIDTH-1:0] address, address_b,
+    output wire [DATA_WIDTH-1:0] dataout, dataout_b
+   );
+   
+   // signal declaration
+  reg [DATA_WIDTH-1:0] ram[(2**ADD_WIDTH)-1:0];
+
+   // body
+   always @(posedge clk)
+      if (we)
+        ram[address]<= datain;
+        
+   
+   // output logic
+  assign dataout = ram[address];
+  assign dataout_b = ram[address_b];
+
+endmodule
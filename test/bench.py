@@ -0,0 +1,178 @@
+#bench.py
+#=============================================================================
+# Pruebas de rendimiento de la simulacion (make bench)
+#=============================================================================
+#
+# Cocotb module with the simulation benchmarks of the Nano system. It measures
+# wall-clock time only, and only through the pins (programs are loaded by SPI
+# and the end of a run is seen on uo_out), so it runs on the RTL and on the
+# gate level netlist (GATES=yes):
+#
+#     clock_rate     simulated clocks per wall second, CPU running a loop
+#     spi_word       wall seconds per SPI command word through slave_spi4nano
+#     spi_burst      wall seconds per 16 bits word of an SPI burst
+#     ins_<class>    wall seconds per executed instruction of a class (ALU,
+#                    xmul_exe multiply, sxacc_exe shifts, jumps, stack), from
+#                    a loop whose body repeats instructions of that class
+#
+# The results are written to $BENCH_OUTPUT (JSON) and compared with
+# bench_baseline.json by bench_check.py. $BENCH_SCALE multiplies the loop
+# counts (default 1) and every run is repeated $BENCH_REPEAT times (default 3)
+# keeping the fastest one, to filter out the noise of the machine.
+#=============================================================================
+
+import json
+import os
+import time
+
+import cocotb
+
+from nano_asm import assemble
+from nano_isa import rtl_build
+from nano_iss import NanoISS
+from nano_pins import MSK_MODE_TO_ON, MSK_RUN_TO_ON, reset_nano
+from nano_spi import NanoSpiMaster
+from nano_waits import NanoWaits
+
+SCALE = float(os.environ.get("BENCH_SCALE", "1"))
+REPEAT = max(1, int(os.environ.get("BENCH_REPEAT", "3")))
+OUTPUT = os.environ.get("BENCH_OUTPUT", "bench_results.json")
+
+_LOOP = """
+        movki 0
+        movkn {count}
+        movka 0x1234
+        movkb 0x5678
+loop:
+{body}
+        incir
+        cmpin
+        jnz16 loop
+        stop
+sub:    ret
+"""
+
+#Body of the loop of every instruction class ({i}: repetition) and the
+#instructions counted for the class
+CLASSES = {
+    "alu": ("        uadd\n        sadd\n        and\n        xor\n        or\n        ac",
+            {"uadd", "sadd", "and", "xor", "or", "ac"}),
+    "mul": ("        umul\n        smul\n        umac\n        smac",
+            {"umul", "smul", "umac", "smac"}),
+    "shift": ("        sracc\n        sraacc\n        slacc",
+              {"sracc", "sraacc", "slacc"}),
+    "jumps": ("        jmp a{i}\na{i}:    jnco16 b{i}\nb{i}:    jnco32 c{i}\nc{i}:",
+              {"jmp", "jnco16", "jnco32"}),
+    "stack": ("        pusha\n        pushb\n        popb\n        popa\n        call sub",
+              {"pusha", "pushb", "popb", "popa", "call", "ret"}),
+}
+
+#Repetitions of the body in the loop and loop counts
+_REPEAT = 8
+_COUNT = 40
+
+metrics = {}
+
+
+def _metric(name, value, unit, better):
+    metrics[name] = {"value": value, "unit": unit, "better": better}
+    cocotb.log.info(f"{name}: {value:.6g} {unit}")
+    with open(OUTPUT, "w") as f:
+        json.dump({
+            "sim": cocotb.SIM_NAME.lower(),
+            "build": "gl" if os.environ.get("GATES") == "yes" else rtl_build(),
+            "metrics": metrics,
+        }, f, indent=1)
+
+
+def class_program(name, count=None):
+    body, _ = CLASSES[name]
+    count = count if count is not None else max(1, int(_COUNT * SCALE))
+    return _LOOP.format(count=count, body="\n".join(body.format(i=i) for i in range(_REPEAT)))
+
+
+async def load_and_run(dut, image, spi):
+    """Load an image by SPI bursts and run it REPEAT times.
+
+    Returns the clocks of a run and the wall seconds of the fastest one.
+    """
+    await spi.load(image.rom, image.ram)
+    waits = NanoWaits(dut, clk_period=10, unit="us")
+    dut.ui_in.value = MSK_MODE_TO_ON
+    await waits.wait_state(0x00, timeout_cycles=16)
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        dut.ui_in.value = MSK_MODE_TO_ON | MSK_RUN_TO_ON
+        await waits.wait_state_change(timeout_cycles=16)
+        dut.ui_in.value = MSK_MODE_TO_ON
+        clocks = await waits.wait_until_stop()
+        wall = time.perf_counter() - start
+        best = wall if best is None else min(best, wall)
+    dut.ui_in.value = 0
+    return clocks, best
+
+
+def iss_profile(image):
+    iss = NanoISS()
+    iss.load(image.rom, image.ram)
+    cycles = iss.run()
+    return cycles, iss.profile
+
+
+@cocotb.test()
+async def bench_clock_rate(dut):
+    await reset_nano(dut)
+    spi = NanoSpiMaster(dut, clk_period=10, unit="us")
+    await spi.idle()
+    image = assemble(class_program("alu", max(1, int(20 * _COUNT * SCALE))))
+    cycles, _ = iss_profile(image)
+    clocks, wall = await load_and_run(dut, image, spi)
+    assert clocks == cycles
+    _metric("clock_rate", clocks / wall, "clocks/s", "higher")
+
+
+@cocotb.test()
+async def bench_spi_word(dut):
+    await reset_nano(dut)
+    spi = NanoSpiMaster(dut, clk_period=10, unit="us")
+    await spi.idle()
+    words = max(1, int(64 * SCALE))
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        for address in range(words):
+            await spi.write_ram(address % 32, address)
+        wall = time.perf_counter() - start
+        best = wall if best is None else min(best, wall)
+    _metric("spi_word", best / words, "s/word", "lower")
+
+
+@cocotb.test()
+async def bench_spi_burst(dut):
+    await reset_nano(dut)
+    spi = NanoSpiMaster(dut, clk_period=10, unit="us")
+    await spi.idle()
+    words = max(1, int(64 * SCALE))
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        for address in range(0, words, 32):
+            await spi.write_ram_words(0, range(address, min(address + 32, words)))
+        wall = time.perf_counter() - start
+        best = wall if best is None else min(best, wall)
+    _metric("spi_burst", best / words, "s/word", "lower")
+
+
+@cocotb.test()
+async def bench_instruction_classes(dut):
+    await reset_nano(dut)
+    spi = NanoSpiMaster(dut, clk_period=10, unit="us")
+    await spi.idle()
+    for name, (_, counted) in CLASSES.items():
+        image = assemble(class_program(name))
+        cycles, profile = iss_profile(image)
+        clocks, wall = await load_and_run(dut, image, spi)
+        assert clocks == cycles, name
+        executed = sum(profile[ins][0] for ins in counted if ins in profile)
+        _metric(f"ins_{name}", wall / executed, "s/instruction", "lower")
@@ -0,0 +1,88 @@
+#bench_check.py
+#=============================================================================
+# Comparacion de los resultados de bench.py con la linea base
+#=============================================================================
+#
+# bench_baseline.json holds one set of metrics per simulator and build
+# ("icarus-rtl", "verilator-gl", ...). A metric is a regression when it is
+# worse than its baseline by more than the threshold (a fraction, 0.25 by
+# default) in the direction given by its "better" field:
+#
+#     python bench_check.py bench_results_icarus_rtl.json [--threshold 0.25]
+#     python bench_check.py bench_results_icarus_rtl.json --update
+#
+# The exit status is 1 if some metric regressed, and 2 if there is no baseline
+# for the simulator and build or for some of its metrics (store one with
+# --update, e.g. make bench BENCH_UPDATE=1), so the check never passes without
+# comparing.
+#=============================================================================
+
+import argparse
+import json
+import os
+import sys
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+
+def compare(results, baseline, threshold):
+    """Rows (name, value, base, change, regressed) of the metrics of `results`."""
+    rows = []
+    for name, metric in sorted(results["metrics"].items()):
+        value = metric["value"]
+        base = baseline.get(name)
+        if base is None:
+            rows.append((name, value, None, None, False))
+            continue
+        change = (value - base) / base
+        worse = -change if metric["better"] == "higher" else change
+        rows.append((name, value, base, change, worse > threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check bench.py results against the baseline")
+    parser.add_argument("results")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--update", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    with open(args.results) as f:
+        results = json.load(f)
+    key = f"{results['sim']}-{results['build']}"
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+
+    if args.update:
+        baselines[key] = {name: metric["value"] for name, metric in results["metrics"].items()}
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=1, sort_keys=True)
+            f.write("\n")
+        print(f"baseline {key} updated in {args.baseline}")
+        return 0
+
+    rows = compare(results, baselines.get(key, {}), args.threshold)
+    print(f"{key} (threshold {args.threshold:.0%})")
+    print(f"{'metric':<16}{'value':>14}{'baseline':>14}{'change':>9}")
+    for name, value, base, change, regressed in rows:
+        unit = results["metrics"][name]["unit"]
+        base_text = f"{base:14.6g}" if base is not None else f"{'-':>14}"
+        change_text = f"{change:+9.1%}" if change is not None else f"{'-':>9}"
+        print(f"{name:<16}{value:14.6g}{base_text}{change_text}  {unit}{'  REGRESSION' if regressed else ''}")
+    if any(row[4] for row in rows):
+        return 1
+    missing = [name for name, _, base, _, _ in rows if base is None]
+    if key not in baselines:
+        print(f"no baseline for {key} in {args.baseline} (run with --update)")
+        return 2
+    if missing:
+        print(f"no baseline for {', '.join(missing)} in {key} of {args.baseline} (run with --update)")
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
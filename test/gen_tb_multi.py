@@ -0,0 +1,94 @@
+#gen_tb_multi.py
+#=============================================================================
+# Generador del testbench con N copias de tt_um_galaguna_NanoSys_fit
+#=============================================================================
+#
+# Writes tb_multi.v: the toplevel tb_multi with a common clk and N instances
+# slot0 .. slot<N-1> of tb_slot, and tb_slot with the pins of tb.v (rst_n,
+# ena, ui_in, uio_in, uo_out, uio_out, uio_oe, clk) around its own copy of
+# the project (user_project). A slot handle looks like the dut of tb.v to the
+# cocotb helpers (NanoMemory, NanoWaits, NanoSpiMaster, ...), so one simulator
+# process runs N independent Nano systems (see nano_multi.py):
+#
+#     python gen_tb_multi.py 8 -o sim_build/rtl_multi8/tb_multi.v
+#
+# The Makefile does it with make MULTI=8.
+#=============================================================================
+
+import argparse
+
+_SLOT = """\
+// Pins of tb.v around one copy of the project
+module tb_slot (
+    input wire clk
+);
+
+  reg rst_n;
+  reg ena;
+  reg [7:0] ui_in;
+  reg [7:0] uio_in;
+  wire [7:0] uo_out;
+  wire [7:0] uio_out;
+  wire [7:0] uio_oe;
+`ifdef GL_TEST
+  wire VPWR = 1'b1;
+  wire VGND = 1'b0;
+`endif
+
+  tt_um_galaguna_NanoSys_fit user_project (
+
+      // Include power ports for the Gate Level test:
+`ifdef GL_TEST
+      .VPWR(VPWR),
+      .VGND(VGND),
+`endif
+
+      .ui_in  (ui_in),    // Dedicated inputs
+      .uo_out (uo_out),   // Dedicated outputs
+      .uio_in (uio_in),   // IOs: Input path
+      .uio_out(uio_out),  // IOs: Output path
+      .uio_oe (uio_oe),   // IOs: Enable path (active high: 0=input, 1=output)
+      .ena    (ena),      // enable - goes high when design is selected
+      .clk    (clk),      // clock
+      .rst_n  (rst_n)     // not reset
+  );
+
+endmodule
+"""
+
+
+def tb_multi(instances):
+    """Verilog source of tb_multi with `instances` slots."""
+    if instances < 1:
+        raise ValueError(f"{instances} instances")
+    slots = "\n".join(f"  tb_slot slot{n} (.clk(clk));" for n in range(instances))
+    return f"""\
+`default_nettype none
+`timescale 1ns / 1ps
+
+/* Generated by gen_tb_multi.py: {instances} copies of tt_um_galaguna_NanoSys_fit
+   on a common clock, each with its own pins (slot0 .. slot{instances - 1}).
+*/
+
+{_SLOT}
+module tb_multi ();
+
+  reg clk;
+
+{slots}
+
+endmodule
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the testbench with N copies of the project")
+    parser.add_argument("instances", type=int)
+    parser.add_argument("-o", "--output", default="tb_multi.v")
+    args = parser.parse_args()
+    with open(args.output, "w") as f:
+        f.write(tb_multi(args.instances))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+#nano_asm.py
+#=============================================================================
+# Ensamblador para el CPU Nano (119 instrucciones) con cache de imagenes
+#=============================================================================
+#
+# Mnemonics are the `*_code` localparam names of src/Nano_cpu4Mc_119.v without
+# the suffix (nop, jmp, jz16, call, movka, movam, uadd, smac, sracc, outk,
+# stop, ...), see nano_isa.py. Operands are separated by commas:
+#
+#     jmp/call/j<cc> target    12 bits code address (label or number)
+#     movk{a,b,i,j,n,m} k      16 bits constant
+#     lduspk k                 8 bits constant
+#     mov{a,b,rl,rh}m a,       11 bits data address (label or number)
+#     mov{ma,mb,ai,...} a,
+#     incmpm/decmpm a
+#     outa/ina port            8 bits port
+#     outk k, port             8 bits constant and port
+#
+# Directives:
+#
+#     label:                   current address of the current section
+#     NAME = expr / .equ NAME, expr
+#     .code / .data            select the ROM (bytes) or RAM (words) section
+#     .org expr                set the address of the current section
+#     .db expr, ...            bytes (code section only)
+#     .dw expr, ...            16 bits words (high byte first in code)
+#     .int0/.int1/.int2 label  `jmp label` at the vector 0x0FFD/0x0FFA/0x0FF7
+#
+# Expressions are numbers (123, 0x7B, 0b1111011) and symbols joined by + and -.
+# Comments start with ';' or '//'. disassemble() does the reverse for one
+# instruction of a code image.
+#
+# Assembled images are cached by the SHA-256 of the source text (plus the
+# opcode table and the assembler version), in memory and as JSON files in
+# $NANO_ASM_CACHE (default test/.asm_cache, empty string disables it).
+#=============================================================================
+
+import hashlib
+import json
+import os
+import re
+import sys
+
+from nano_isa import CODE_SPACE, DATA_SPACE, OPERAND_SIZE, get_isa, is_rom_address
+
+ASM_VERSION = 2
+
+_DEFAULT_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".asm_cache")
+_memo = {}
+
+_LIMITS = {
+    "caddr": (0, CODE_SPACE - 1),
+    "daddr": (0, DATA_SPACE - 1),
+    "imm16": (-0x8000, 0xFFFF),
+    "imm8": (-0x80, 0xFF),
+    "port": (0, 0xFF),
+}
+
+
+class AsmError(ValueError):
+    def __init__(self, message, line=None, text=None):
+        where = f"line {line}: " if line is not None else ""
+        super().__init__(where + message + (f"\n    {text}" if text else ""))
+        self.line = line
+
+
+class NanoImage:
+    """Result of an assembly: ROM bytes, RAM words, symbols, code labels and listing."""
+
+    def __init__(self, rom=None, ram=None, symbols=None, listing=None, labels=None):
+        self.rom = rom if rom is not None else {}
+        self.ram = ram if ram is not None else {}
+        self.symbols = symbols if symbols is not None else {}
+        self.listing = listing if listing is not None else []
+        self.labels = labels if labels is not None else {}
+
+    def copy(self):
+        return NanoImage(dict(self.rom), dict(self.ram), dict(self.symbols), list(self.listing),
+                         dict(self.labels))
+
+    def rom_bytes(self, start, end, fill=0x00):
+        return bytes(self.rom.get(a, fill) for a in range(start, end))
+
+    def to_json(self):
+        return json.dumps({
+            "rom": {f"{a:03x}": v for a, v in sorted(self.rom.items())},
+            "ram": {f"{a:03x}": v for a, v in sorted(self.ram.items())},
+            "symbols": self.symbols,
+            "listing": self.listing,
+            "labels": self.labels,
+        })
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        return cls(
+            {int(a, 16): v for a, v in data["rom"].items()},
+            {int(a, 16): v for a, v in data["ram"].items()},
+            data["symbols"],
+            [tuple(item) for item in data["listing"]],
+            data.get("labels", {}),
+        )
+
+    def format_listing(self):
+        lines = []
+        for section, address, values, text in self.listing:
+            width = 2 if section == "code" else 4
+            data = " ".join(f"{v:0{width}X}" for v in values)
+            lines.append(f"{'C' if section == 'code' else 'D'}:{address:03X}  {data:<12} {text}")
+        return "\n".join(lines)
+
+
+def _strip(line):
+    return re.split(r";|//", line, maxsplit=1)[0].strip()
+
+
+def _split_args(text):
+    return [arg.strip() for arg in text.split(",")] if text.strip() else []
+
+
+class NanoAssembler:
+    def __init__(self, isa=None):
+        self.isa = isa if isa is not None else get_isa()
+
+    def _eval(self, expr, symbols, lineno, text, final):
+        tokens = re.findall(r"\s*([+-]?)\s*([A-Za-z_.][\w.]*|0[xX][0-9A-Fa-f]+|0[bB][01]+|\d+)", expr)
+        if not tokens or "".join(s + t for s, t in tokens) != re.sub(r"\s+", "", expr):
+            raise AsmError(f"bad expression '{expr}'", lineno, text)
+        value = 0
+        for sign, token in tokens:
+            if token[0].isdigit():
+                term = int(token, 0)
+            elif token in symbols:
+                term = symbols[token]
+            elif final:
+                raise AsmError(f"undefined symbol '{token}'", lineno, text)
+            else:
+                term = 0
+            value = value - term if sign == "-" else value + term
+        return value
+
+    def _operand(self, kind, expr, symbols, lineno, text):
+        value = self._eval(expr, symbols, lineno, text, True)
+        low, high = _LIMITS[kind]
+        if not low <= value <= high:
+            raise AsmError(f"{kind} operand out of range: {value:#x}", lineno, text)
+        value &= 0xFFFF if OPERAND_SIZE[kind] == 2 else 0xFF
+        return [value >> 8, value & 0xFF] if OPERAND_SIZE[kind] == 2 else [value]
+
+    def _pass(self, lines, symbols, final):
+        isa = self.isa
+        section = "code"
+        pc = {"code": 0, "data": 0}
+        rom, ram, listing, labels = {}, {}, [], {}
+
+        def emit(values, lineno, text, address=None):
+            sec = section if address is None else "code"
+            start = pc[sec] if address is None else address
+            if final:
+                mem = rom if sec == "code" else ram
+                for i, value in enumerate(values):
+                    a = start + i
+                    if sec == "code" and not is_rom_address(a):
+                        raise AsmError(f"code address {a:#05x} has no physical ROM (0x000-0x07F, 0xF80-0xFFF)", lineno, text)
+                    if sec == "data" and not 0 <= a < DATA_SPACE:
+                        raise AsmError(f"data address {a:#x} out of range", lineno, text)
+                    if a in mem:
+                        raise AsmError(f"{sec} address {a:#05x} written twice", lineno, text)
+                    mem[a] = value
+                listing.append((sec, start, list(values), text.strip()))
+            if address is None:
+                pc[sec] += len(values)
+
+        for lineno, text in lines:
+            line = _strip(text)
+            while True:
+                match = re.match(r"([A-Za-z_.][\w.]*)\s*:(.*)$", line)
+                if not match:
+                    break
+                label, line = match.group(1), match.group(2).strip()
+                if not final and label in symbols:
+                    raise AsmError(f"symbol '{label}' defined twice", lineno, text)
+                symbols[label] = pc[section]
+                if section == "code":
+                    labels[label] = pc["code"]
+            if not line:
+                continue
+            match = re.match(r"([A-Za-z_][\w]*)\s*=\s*(.+)$", line)
+            if match:
+                symbols[match.group(1)] = self._eval(match.group(2), symbols, lineno, text, final)
+                continue
+            word, _, rest = line.replace("\t", " ").partition(" ")
+            word = word.lower()
+            args = _split_args(rest)
+            if word == ".code" or word == ".data":
+                section = word[1:]
+            elif word == ".org":
+                pc[section] = self._eval(rest, symbols, lineno, text, True)
+            elif word == ".equ":
+                if len(args) != 2:
+                    raise AsmError(".equ needs a name and a value", lineno, text)
+                symbols[args[0]] = self._eval(args[1], symbols, lineno, text, final)
+            elif word == ".db":
+                if section != "code":
+                    raise AsmError(".db is only valid in the code section", lineno, text)
+                emit([self._eval(a, symbols, lineno, text, final) & 0xFF for a in args], lineno, text)
+            elif word == ".dw":
+                values = [self._eval(a, symbols, lineno, text, final) & 0xFFFF for a in args]
+                if section == "code":
+                    values = [b for v in values for b in (v >> 8, v & 0xFF)]
+                emit(values, lineno, text)
+            elif word in (".int0", ".int1", ".int2"):
+                if len(args) != 1:
+                    raise AsmError(f"{word} needs one target", lineno, text)
+                target = self._operand("caddr", args[0], symbols, lineno, text) if final else [0, 0]
+                emit([isa.opcodes["jmp"]] + target, lineno, text, address=isa.vectors[int(word[4])])
+            elif word in isa.opcodes:
+                if section != "code":
+                    raise AsmError("instructions are only valid in the code section", lineno, text)
+                kinds = isa.operands[word]
+                if len(args) != len(kinds):
+                    raise AsmError(f"'{word}' expects {len(kinds)} operand(s)", lineno, text)
+                values = [isa.opcodes[word]]
+                for kind, arg in zip(kinds, args):
+                    values += self._operand(kind, arg, symbols, lineno, text) if final else [0] * OPERAND_SIZE[kind]
+                emit(values, lineno, text)
+            else:
+                raise AsmError(f"unknown instruction or directive '{word}'", lineno, text)
+        return rom, ram, listing, labels
+
+    def assemble(self, source):
+        lines = list(enumerate(source.splitlines(), 1))
+        symbols = {}
+        self._pass(lines, symbols, False)
+        rom, ram, listing, labels = self._pass(lines, symbols, True)
+        return NanoImage(rom, ram, symbols, listing, labels)
+
+
+def disassemble(read, address, isa=None):
+    """Text and size in bytes of the instruction at `address`.
+
+    `read(address)` returns the code byte at an address, e.g. NanoISS.read_rom.
+    """
+    isa = isa if isa is not None else get_isa()
+    code = read(address)
+    name = isa.names.get(code)
+    if name is None:
+        return f".db {code:#04x}", 1
+    args = []
+    a = address + 1
+    for kind in isa.operands[name]:
+        if OPERAND_SIZE[kind] == 2:
+            value = (read(a & 0xFFF) << 8) | read((a + 1) & 0xFFF)
+            args.append(f"{value & _LIMITS[kind][1]:#05x}" if kind != "imm16" else f"{value:#06x}")
+        else:
+            args.append(f"{read(a & 0xFFF):#04x}")
+        a += OPERAND_SIZE[kind]
+    return name + (" " + ", ".join(args) if args else ""), a - address
+
+
+def cache_key(source, isa=None):
+    isa = isa if isa is not None else get_isa()
+    text = f"{ASM_VERSION}\n{isa.digest}\n{source}"
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def assemble(source, cache_dir=None):
+    """Assemble `source`, reusing a cached image when the source is unchanged.
+
+    Every call returns its own copy of the image, that the caller may modify.
+    """
+    key = cache_key(source)
+    if key in _memo:
+        return _memo[key].copy()
+    if cache_dir is None:
+        cache_dir = os.environ.get("NANO_ASM_CACHE", _DEFAULT_CACHE)
+    path = os.path.join(cache_dir, key + ".json") if cache_dir else None
+    if path and os.path.exists(path):
+        with open(path) as f:
+            image = NanoImage.from_json(f.read())
+    else:
+        image = NanoAssembler().assemble(source)
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                f.write(image.to_json())
+            os.replace(tmp, path)
+    _memo[key] = image
+    return image.copy()
+
+
+def assemble_file(path, cache_dir=None):
+    with open(path) as f:
+        return assemble(f.read(), cache_dir)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("usage: python nano_asm.py program.asm")
+    try:
+        print(assemble_file(sys.argv[1]).format_listing())
+    except AsmError as e:
+        sys.exit(f"{sys.argv[1]}: {e}")
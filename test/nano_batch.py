@@ -0,0 +1,531 @@
+#nano_batch.py
+#=============================================================================
+# Simulador vectorizado (NumPy) para ejecutar lotes de programas de Nano_cpu
+#=============================================================================
+#
+# NanoBatch keeps the architectural state of Nano_mcsys_4Tiny (A, B, I, J, N,
+# M, R, ACC, F, IP, SP, USP, the int_ctrl registers, 256x8 ROM, 32x16 RAM and
+# 16x16 stack) as NumPy arrays with one row per program, and executes one
+# whole instruction of every running program per step: the programs are
+# grouped by opcode and every group is updated with array operations.
+#
+# The clocks charged to every instruction are the FSM states that
+# src/Nano_cpu4Mc_119.v goes through (see nano_iss.py, the cycle accurate
+# reference), including the data dependent ones:
+#
+#     conditional jumps   5 if taken, 2 if not
+#     sracc/sraacc/slacc  A[5:0] + 2, or 3 (2 for A[5:0] = 0) with
+#                         SHIFT_MODE 1
+#     umul/smul           18 (fetch_decode + 17 xmul_exe), 10 or 3 with
+#                         MUL_MODE 1 or 2
+#     umac/smac           19, 11 or 4
+#
+# and with PREFETCH 1 one clock less for the instructions with a two bytes
+# operand (jmp, call, taken jumps, movk*, memory moves, incmpm/decmpm, outk).
+#
+# The EINT pins are held low, so no interrupt is taken by itself. A program
+# that writes a nonzero value in the interrupt flags (port 1) would enter the
+# interrupt service in the RTL: it is halted with status IRQ, to be replayed
+# with NanoISS. Reading an I/O port other than 0 or 1 returns 0.
+#
+#     batch = NanoBatch(10000)
+#     batch.load(image.rom, image.ram)       # same program in every row
+#     batch.ram[:, 0x10] = np.arange(10000)  # a parameter sweep
+#     batch.run()
+#     batch.cycles, batch.status, batch.R, batch.ram ...
+#=============================================================================
+
+import numpy as np
+
+from nano_isa import (MUL_STEPS, RAM_SIZE, ROM_BOTTOM_SIZE, SHIFT_STEPS, STACK_SIZE, get_isa, is_rom_address,
+                      rtl_option)
+
+#Program status:
+RUNNING = 0
+STOPPED = 1
+IRQ = 2
+TIMEOUT = 3
+
+_MASK32 = 0xFFFFFFFF
+_MASK33 = (1 << 33) - 1
+
+#Registers kept per program:
+REGISTERS = ("A", "B", "I", "J", "N", "M", "R", "ACC", "F", "IP", "SP", "USP", "En", "Flg")
+
+#Conditional jumps: flag bit and level that takes the jump
+_JUMPS = {
+    "jz16": (0, 1), "jn16": (1, 1), "jo16": (2, 1), "jco16": (3, 1),
+    "jz32": (4, 1), "jn32": (5, 1), "jo32": (6, 1), "jco32": (7, 1),
+    "jnz16": (0, 0), "jp16": (1, 0), "jno16": (2, 0), "jnco16": (3, 0),
+    "jnz32": (4, 0), "jp32": (5, 0), "jno32": (6, 0), "jnco32": (7, 0),
+}
+
+
+def _sext33(word):
+    return np.where(word & 0x8000, word | 0x1FFFF0000, word)
+
+
+def _rom_index(address):
+    #Row index of the 256 bytes ROM: my_bottom_rom then my_top_rom
+    return np.where((address >> 7) == 0x1F, ROM_BOTTOM_SIZE, 0) + (address & 0x7F)
+
+
+def _result_flags(w, f3, f7):
+    #Flags of add_result, cmp_result, xmul_exe and sxacc_exe
+    return (
+        ((w & 0xFFFF) == 0).astype(np.int64)
+        | ((w >> 15) & 1) << 1
+        | ((w >> 16) & 1) << 2
+        | f3 << 3
+        | ((w & _MASK32) == 0).astype(np.int64) << 4
+        | ((w >> 31) & 1) << 5
+        | ((w >> 32) & 1) << 6
+        | f7 << 7
+    )
+
+
+def _add_overflow(a, b, w, bit):
+    #F[3]/F[7] of add_result: operands of the same sign and result bit of other sign
+    a15, b15, wb = (a >> 15) & 1, (b >> 15) & 1, (w >> bit) & 1
+    return ((a15 & b15 & (wb ^ 1)) | ((a15 ^ 1) & (b15 ^ 1) & wb)).astype(np.int64)
+
+
+def _mul_overflow(a, b, w, bit):
+    #F[3]/F[7] of xmul_exe: operands of the same sign and result bit set
+    a15, b15, wb = (a >> 15) & 1, (b >> 15) & 1, (w >> bit) & 1
+    return (((a15 & b15) | ((a15 ^ 1) & (b15 ^ 1))) & wb).astype(np.int64)
+
+
+class NanoBatch:
+    """Lockstep simulator of `size` independent Nano_mcsys_4Tiny systems."""
+
+    def __init__(self, size, isa=None, mul_mode=None, shift_mode=None, prefetch=None):
+        self.isa = isa if isa is not None else get_isa()
+        self.mul_mode = mul_mode if mul_mode is not None else rtl_option("MUL_MODE")
+        if self.mul_mode not in MUL_STEPS:
+            raise ValueError(f"MUL_MODE {self.mul_mode} not in {sorted(MUL_STEPS)}")
+        self.shift_mode = shift_mode if shift_mode is not None else rtl_option("SHIFT_MODE")
+        if self.shift_mode not in SHIFT_STEPS:
+            raise ValueError(f"SHIFT_MODE {self.shift_mode} not in {sorted(SHIFT_STEPS)}")
+        self.prefetch = prefetch if prefetch is not None else rtl_option("PREFETCH")
+        if self.prefetch not in (0, 1):
+            raise ValueError(f"PREFETCH {self.prefetch} not in [0, 1]")
+        self.size = size
+        self.rom = np.zeros((size, 2 * ROM_BOTTOM_SIZE), np.int64)
+        self.ram = np.zeros((size, RAM_SIZE), np.int64)
+        self.stack = np.zeros((size, STACK_SIZE), np.int64)
+        self._handlers = self._handler_table()
+        self.reset()
+
+    def reset(self):
+        """Reset every CPU (the memories are kept)."""
+        for name in REGISTERS:
+            setattr(self, name, np.zeros(self.size, np.int64))
+        self.cycles = np.zeros(self.size, np.int64)
+        self.instructions = np.zeros(self.size, np.int64)
+        self.status = np.full(self.size, STOPPED, np.int8)
+
+    def load(self, rom=None, ram=None, rows=slice(None)):
+        """Load {address: value} images (e.g. a NanoImage) in the selected rows."""
+        for address, byte in (rom or {}).items():
+            if not is_rom_address(address):
+                raise ValueError(f"ROM address {address:#05x} has no physical location (0x000-0x07F, 0xF80-0xFFF)")
+            self.rom[rows, _rom_index(address)] = byte & 0xFF
+        for address, word in (ram or {}).items():
+            if not 0 <= address < RAM_SIZE:
+                raise ValueError(f"RAM address {address:#x} out of range (32 words)")
+            self.ram[rows, address] = word & 0xFFFF
+
+    def registers(self, row):
+        """Registers of one program, as in NanoISS.registers()."""
+        return {name: int(getattr(self, name)[row]) for name in REGISTERS}
+
+    #-------------------------------------------------------------------------
+    # Execution
+    #-------------------------------------------------------------------------
+    def start(self, rows=slice(None)):
+        """Run pulse: stop -> start (1 clock) -> fetch_decode at IP=0."""
+        self.IP[rows] = 0
+        self.SP[rows] = 0
+        self.cycles[rows] = 1
+        self.instructions[rows] = 0
+        self.status[rows] = RUNNING
+
+    def step(self):
+        """Execute one instruction of every running program, return how many ran."""
+        rows = np.flatnonzero(self.status == RUNNING)
+        if rows.size == 0:
+            return 0
+        ip = self.IP[rows]
+        rom = self.rom
+        op = rom[rows, _rom_index(ip)]
+        b1 = rom[rows, _rom_index((ip + 1) & 0xFFF)]
+        b2 = rom[rows, _rom_index((ip + 2) & 0xFFF)]
+        handlers = self._handlers
+        if (op == op[0]).all():
+            #Every program on the same opcode (e.g. a parameter sweep)
+            handlers.get(int(op[0]), self._stop)(rows, b1, b2)
+        else:
+            order = np.argsort(op, kind="stable")
+            codes, first = np.unique(op[order], return_index=True)
+            bounds = list(first[1:]) + [order.size]
+            for code, begin, end in zip(codes, first, bounds):
+                sel = order[begin:end]
+                handlers.get(int(code), self._stop)(rows[sel], b1[sel], b2[sel])
+        self.instructions[rows] += 1
+        return rows.size
+
+    def run(self, max_cycles=1000000, rows=slice(None)):
+        """Start the selected programs and step until all of them stop.
+
+        Programs still running after `max_cycles` clocks get status TIMEOUT.
+        """
+        self.start(rows)
+        while self.step():
+            late = (self.status == RUNNING) & (self.cycles >= max_cycles)
+            self.status[late] = TIMEOUT
+        return self.cycles
+
+    #-------------------------------------------------------------------------
+    # Instruction groups, each one vectorized over the rows `r`
+    #-------------------------------------------------------------------------
+    def _next(self, r, size, clocks):
+        self.IP[r] = (self.IP[r] + size) & 0xFFF
+        self.cycles[r] += clocks
+
+    def _stop(self, r, b1, b2):
+        #stop_code and undefined opcodes: fetch_decode -> stop
+        self._next(r, 1, 1)
+        self.status[r] = STOPPED
+
+    def _io_write(self, r, port, value):
+        en = port == 0
+        self.En[r[en]] = value[en]
+        flg = port == 1
+        self.Flg[r[flg]] = value[flg]
+        self.status[r[flg & ((value & 0x7) != 0)]] = IRQ
+
+    def _io_read(self, r, port):
+        return np.where(port == 0, self.En[r], np.where(port == 1, self.Flg[r] & 0x7, 0))
+
+    def _handler_table(self):
+        s = self
+        ops = self.isa.opcodes
+        #Clock saved by the two bytes operands with PREFETCH 1
+        pf = 1 if self.prefetch else 0
+
+        def reg(name):
+            return getattr(s, name)
+
+        def single(target, source, mask=0xFFFF):
+            #Register transfers done in fetch_decode (1 clock)
+            def handler(r, b1, b2):
+                reg(target)[r] = source(r) & mask
+                s._next(r, 1, 1)
+            return handler
+
+        def acc_half(high, src):
+            def handler(r, b1, b2):
+                value = reg(src)[r]
+                acc = s.ACC[r]
+                s.ACC[r] = (value << 16) | (acc & 0xFFFF) if high else (acc & 0xFFFF0000) | value
+                s._next(r, 1, 1)
+            return handler
+
+        def nop(r, b1, b2):
+            s._next(r, 1, 1)
+
+        def caddr(b1, b2):
+            return ((b1 & 0xF) << 8) | b2
+
+        def daddr(b1, b2):
+            return ((b1 & 0x7) << 8) | b2
+
+        def jmp(r, b1, b2):
+            s.IP[r] = caddr(b1, b2)
+            s.cycles[r] += 4 - pf
+
+        def jump(bit, level):
+            def handler(r, b1, b2):
+                taken = ((s.F[r] >> bit) & 1) == level
+                s.IP[r] = np.where(taken, caddr(b1, b2), (s.IP[r] + 3) & 0xFFF)
+                s.cycles[r] += np.where(taken, 5 - pf, 2)
+            return handler
+
+        def call(r, b1, b2):
+            s.stack[r, s.SP[r] & 0xF] = (s.IP[r] + 3) & 0xFFF
+            s.SP[r] = (s.SP[r] + 1) & 0xFF
+            s.IP[r] = caddr(b1, b2)
+            s.cycles[r] += 5 - pf
+
+        def ret(r, b1, b2):
+            s.SP[r] = (s.SP[r] - 1) & 0xFF
+            s.IP[r] = s.stack[r, s.SP[r] & 0xF] & 0xFFF
+            s.cycles[r] += 3
+
+        def reti(r, b1, b2):
+            #Outside an interrupt service (FDI=0) reti goes to stop
+            s._next(r, 1, 2)
+            s.status[r] = STOPPED
+
+        def push(src):
+            def handler(r, b1, b2):
+                s.stack[r, s.SP[r] & 0xF] = reg(src)[r]
+                s.SP[r] = (s.SP[r] + 1) & 0xFF
+                s._next(r, 1, 2)
+            return handler
+
+        def pop(dst):
+            def handler(r, b1, b2):
+                s.SP[r] = (s.SP[r] - 1) & 0xFF
+                reg(dst)[r] = s.stack[r, s.SP[r] & 0xF]
+                s._next(r, 1, 4)
+            return handler
+
+        def movk(dst):
+            def handler(r, b1, b2):
+                reg(dst)[r] = (b1 << 8) | b2
+                s._next(r, 3, 4 - pf)
+            return handler
+
+        def lduspk(r, b1, b2):
+            s.USP[r] = b1
+            s._next(r, 2, 2)
+
+        def source(name):
+            #dout of the *_exe states that write the RAM
+            if name == "RL":
+                return lambda r: s.R[r] & 0xFFFF
+            if name == "RH":
+                return lambda r: s.R[r] >> 16
+            return lambda r: reg(name)[r]
+
+        def store(src):
+            #movam, movbm, movrhm (movrlm_exe does not assert ramwe)
+            def handler(r, b1, b2):
+                if src is not None:
+                    s.ram[r, daddr(b1, b2) & 0x1F] = source(src)(r)
+                s._next(r, 3, 5 - pf)
+            return handler
+
+        def load(dst):
+            def handler(r, b1, b2):
+                reg(dst)[r] = s.ram[r, daddr(b1, b2) & 0x1F]
+                s._next(r, 3, 5 - pf)
+            return handler
+
+        def cmp_flags(r, w):
+            s.F[r] = _result_flags(w, 0, 0)
+            s.R[r] = w & _MASK32
+
+        def incmpm(delta):
+            def handler(r, b1, b2):
+                a = daddr(b1, b2)
+                x = (s.ram[r, a & 0x1F] + delta) & 0xFFFF
+                s.ram[r, a & 0x1F] = x
+                y = s.ram[r, (a + 1) & 0x1F]
+                cmp_flags(r, (x - y) & _MASK33)
+                s._next(r, 3, 9 - pf)
+            return handler
+
+        def indirect(kind, name):
+            #load_dp_movi/load_ix: DP = DPB = a, DP = UDP = RAM[a]
+            def handler(r, b1, b2):
+                a = daddr(b1, b2)
+                p = s.ram[r, a & 0x1F] & 0x7FF
+                if kind == "store":
+                    if name is not None:
+                        s.ram[r, p & 0x1F] = source(name)(r)
+                    s._next(r, 3, 6 - pf)
+                elif kind == "load":
+                    reg(name)[r] = s.ram[r, p & 0x1F]
+                    s._next(r, 3, 6 - pf)
+                elif kind == "store++":
+                    s.ram[r, p & 0x1F] = source(name)(r)
+                    s.ram[r, a & 0x1F] = (p + 1) & 0x7FF
+                    s._next(r, 3, 8 - pf)
+                elif kind == "load++":
+                    reg(name)[r] = s.ram[r, p & 0x1F]
+                    s.ram[r, a & 0x1F] = (p + 1) & 0x7FF
+                    s._next(r, 3, 8 - pf)
+                else:
+                    p = (p - 1) & 0x7FF
+                    reg(name)[r] = s.ram[r, p & 0x1F]
+                    s.ram[r, a & 0x1F] = p
+                    s._next(r, 3, 9 - pf)
+            return handler
+
+        def to_user_stack(src):
+            def handler(r, b1, b2):
+                s.stack[r, s.USP[r] & 0xF] = source(src)(r)
+                s._next(r, 1, 2)
+            return handler
+
+        def from_user_stack(dst):
+            def handler(r, b1, b2):
+                reg(dst)[r] = s.stack[r, s.USP[r] & 0xF]
+                s._next(r, 1, 2)
+            return handler
+
+        def add(kind):
+            def handler(r, b1, b2):
+                a, b = s.A[r], s.B[r]
+                if kind == "uadd":
+                    w = a + b
+                elif kind == "sadd":
+                    w = (_sext33(a) + _sext33(b)) & _MASK33
+                else:
+                    w = s.R[r] + s.ACC[r]
+                s.F[r] = _result_flags(w, _add_overflow(a, b, w, 15), _add_overflow(a, b, w, 31))
+                if kind == "ac":
+                    s.ACC[r] = w & _MASK32
+                else:
+                    s.R[r] = w & _MASK32
+                s._next(r, 1, 2)
+            return handler
+
+        #fetch_decode and the passes of xmul_exe
+        mul_clocks = 2 + 16 // MUL_STEPS[self.mul_mode]
+
+        def mul(signed, mac):
+            def handler(r, b1, b2):
+                a, b = s.A[r], s.B[r]
+                sr1 = _sext33(a) if signed else a.copy()
+                sr2 = _sext33(b) if signed else b.copy()
+                w = np.zeros_like(a)
+                #The 16 passes of xmul_exe
+                for cnt in range(16):
+                    bit = (sr2 & 1).astype(bool)
+                    if signed and cnt == 15:
+                        w = np.where(bit, (w + (~sr1 & _MASK33) + 1) & _MASK33, w)
+                    else:
+                        w = np.where(bit, (w + sr1) & _MASK33, w)
+                    sr1 = (sr1 & _MASK32) << 1
+                    sr2 = sr2 >> 1
+                if mac:
+                    w = (w + s.ACC[r]) & _MASK33
+                    s.F[r] = _result_flags(w, _add_overflow(a, b, w, 15), _add_overflow(a, b, w, 31))
+                    s.ACC[r] = w & _MASK32
+                    s._next(r, 1, mul_clocks + 1)
+                else:
+                    s.F[r] = _result_flags(w, _mul_overflow(a, b, w, 15), _mul_overflow(a, b, w, 31))
+                    s.R[r] = w & _MASK32
+                    s._next(r, 1, mul_clocks)
+            return handler
+
+        #Positions of sxacc_exe per pass
+        shift_steps = SHIFT_STEPS[self.shift_mode]
+
+        def shift(kind):
+            def handler(r, b1, b2):
+                n = s.A[r] & 0x3F
+                acc = s.ACC[r]
+                if kind == "sracc":
+                    w = acc >> n
+                elif kind == "slacc":
+                    #Bits shifted beyond bit 32 are lost (kept inside 64 bits)
+                    w = (acc & ((1 << np.maximum(33 - n, 0)) - 1)) << n
+                else:
+                    signed = acc - ((acc & 0x80000000) << 1)
+                    negative = ((acc >> 31) & 1).astype(bool) & (n > 0)
+                    w = np.where(negative, ((signed >> n) & _MASK32) | (1 << 32), acc >> n)
+                cmp_flags(r, w)
+                s._next(r, 1, 2 - (-n // shift_steps))
+            return handler
+
+        def logic(op):
+            def handler(r, b1, b2):
+                w = op(s.A[r], s.B[r]) & 0xFFFF
+                z = (w == 0).astype(np.int64)
+                s.F[r] = z | z << 4
+                s.R[r] = w
+                s._next(r, 1, 2)
+            return handler
+
+        def compare(x, y):
+            def handler(r, b1, b2):
+                cmp_flags(r, (reg(x)[r] - reg(y)[r]) & _MASK33)
+                s._next(r, 1, 2)
+            return handler
+
+        def outa(r, b1, b2):
+            s._io_write(r, b1, s.A[r] & 0xFF)
+            s._next(r, 2, 3)
+
+        def ina(r, b1, b2):
+            s.A[r] = s._io_read(r, b1)
+            s._next(r, 2, 3)
+
+        def outk(r, b1, b2):
+            s._io_write(r, b2, b1)
+            s._next(r, 3, 4 - pf)
+
+        R = lambda r: s.R[r]
+        RH = lambda r: s.R[r] >> 16
+        handlers = {
+            "nop": nop, "jmp": jmp, "call": call, "ret": ret, "reti": reti,
+            "movba": single("A", lambda r: s.B[r]),
+            "movira": single("A", lambda r: s.I[r]),
+            "movjra": single("A", lambda r: s.J[r]),
+            "movrla": single("A", R),
+            "movrha": single("A", RH),
+            "movab": single("B", lambda r: s.A[r]),
+            "movrlb": single("B", R),
+            "movrhb": single("B", RH),
+            "movracc": single("ACC", R, _MASK32),
+            "movaaccl": acc_half(False, "A"), "movbaccl": acc_half(False, "B"),
+            "movaacch": acc_half(True, "A"), "movbacch": acc_half(True, "B"),
+            "movaccla": single("A", lambda r: s.ACC[r]),
+            "movacclb": single("B", lambda r: s.ACC[r]),
+            "movaccha": single("A", lambda r: s.ACC[r] >> 16),
+            "movacchb": single("B", lambda r: s.ACC[r] >> 16),
+            "stospa": single("A", lambda r: s.SP[r]),
+            "stospb": single("B", lambda r: s.SP[r]),
+            "stouspa": single("A", lambda r: s.USP[r]),
+            "stouspb": single("B", lambda r: s.USP[r]),
+            "ldusp": single("USP", lambda r: s.SP[r], 0xFF),
+            "lduspa": single("USP", lambda r: s.A[r], 0xFF),
+            "lduspb": single("USP", lambda r: s.B[r], 0xFF),
+            "lduspr": single("USP", R, 0xFF),
+            "lduspk": lduspk,
+            "incusp": single("USP", lambda r: s.USP[r] + 1, 0xFF),
+            "decusp": single("USP", lambda r: s.USP[r] - 1, 0xFF),
+            "incir": single("I", lambda r: s.I[r] + 1),
+            "incjr": single("J", lambda r: s.J[r] + 1),
+            "decir": single("I", lambda r: s.I[r] - 1),
+            "decjr": single("J", lambda r: s.J[r] - 1),
+            "movam": store("A"), "movbm": store("B"), "movrlm": store(None), "movrhm": store("RH"),
+            "movma": load("A"), "movmb": load("B"),
+            "incmpm": incmpm(1), "decmpm": incmpm(-1),
+            "movai": indirect("store", "A"), "movbi": indirect("store", "B"),
+            "movrli": indirect("store", None), "movrhi": indirect("store", "RH"),
+            "movia": indirect("load", "A"), "movib": indirect("load", "B"),
+            "movaipp": indirect("store++", "A"), "movbipp": indirect("store++", "B"),
+            "movrlipp": indirect("store++", "RL"), "movrhipp": indirect("store++", "RH"),
+            "movippa": indirect("load++", "A"), "movippb": indirect("load++", "B"),
+            "movmmia": indirect("--load", "A"), "movmmib": indirect("--load", "B"),
+            "movas": to_user_stack("A"), "movbs": to_user_stack("B"),
+            "movrls": to_user_stack("RL"), "movrhs": to_user_stack("RH"),
+            "movsa": from_user_stack("A"), "movsb": from_user_stack("B"),
+            "uadd": add("uadd"), "sadd": add("sadd"), "ac": add("ac"),
+            "umul": mul(False, False), "smul": mul(True, False),
+            "umac": mul(False, True), "smac": mul(True, True),
+            "sracc": shift("sracc"), "sraacc": shift("sraacc"), "slacc": shift("slacc"),
+            "nota": logic(lambda a, b: ~a), "notb": logic(lambda a, b: ~b),
+            "and": logic(lambda a, b: a & b), "or": logic(lambda a, b: a | b),
+            "xor": logic(lambda a, b: a ^ b),
+            "cmpin": compare("I", "N"), "cmpjm": compare("J", "M"),
+            "outa": outa, "ina": ina, "outk": outk,
+            "stop": s._stop,
+        }
+        for name, (bit, level) in _JUMPS.items():
+            handlers[name] = jump(bit, level)
+        for reg_name in "ABIJNM":
+            handlers[f"push{reg_name.lower()}"] = push(reg_name)
+            handlers[f"pop{reg_name.lower()}"] = pop(reg_name)
+            handlers[f"movk{reg_name.lower()}"] = movk(reg_name)
+
+        missing = set(ops) - set(handlers)
+        if missing:
+            raise ValueError(f"opcodes without model: {sorted(missing)}")
+        return {ops[name]: handler for name, handler in handlers.items()}
@@ -0,0 +1,109 @@
+#nano_checkpoint.py
+#=============================================================================
+# Puntos de control (checkpoint/restore) del estado completo de NanoCpuSys
+#=============================================================================
+#
+# NanoCheckpoint takes every register of the Nano system and the contents of
+# its memories, and puts them back later by deposits, both in zero simulated
+# time. Tests that share a prefix (reset, SPI load, MODE, RUN ...) run it
+# once and fork every variant from the checkpoint:
+#
+#     checkpoints = NanoCheckpoint(dut)
+#     ... reset, SPI load, MODE=1 ...
+#     await FallingEdge(dut.clk)
+#     warm = checkpoints.take()
+#     for variant in variants:
+#         await FallingEdge(dut.clk)
+#         checkpoints.restore(warm)
+#         ... change the variant, RUN, wait for stop ...
+#
+# The state is:
+#
+#     my_cpu          state_reg and the registers of NanoISS (IP_reg ...
+#                     ISF_reg, FDI_reg) plus ramwe_reg, stkwe_reg, iowe_reg
+#     my_NanoSPI      the FSM of slave_spi4nano and its shift registers,
+#                     counters and buffers
+#     my_intctrl      En_reg and Flg_reg (Reg0 and Reg1)
+#     my_edge_det0..2 the edge detectors of EINT0..2
+#     my_pulse        the RUN pulse generator
+#     my_NanoSys      snap_R and snap_flags (OUT_LATCH)
+#     ROM, RAM, stack through NanoMemory
+#     pins            rst_n, ena, ui_in and uio_in of tb.v
+#
+# The registers change at the rising edges of clk and the memories of the
+# CPU at the falling ones (mem_clk), so take() and restore() are meant for a
+# time step just after a falling edge of clk. A checkpoint is a plain dict of
+# ints, with no handle in it, and can be restored in any instance of the
+# same RTL build. Only the RTL model has these signals (not GATES=yes).
+#=============================================================================
+
+from cocotb.handle import Immediate
+
+from nano_iss import REGISTERS
+from nano_mem import NanoMemory
+
+#Registers of every submodule of my_NanoSys ("" is my_NanoSys itself)
+STATE = {
+    "my_cpu": ("state_reg",) + tuple(name + "_reg" for name, _ in REGISTERS)
+              + ("ramwe_reg", "stkwe_reg", "iowe_reg"),
+    "my_NanoSPI": ("state_reg", "SRi_reg", "SRo_reg", "Cnt_reg", "Bst_reg", "Lob_reg", "Nxt_reg",
+                   "MISO_buf_reg", "pclk_buf_reg", "cadd_buf_reg", "cout_buf_reg", "cwe_buf_reg",
+                   "dadd_buf_reg", "dout_buf_reg", "dwe_buf_reg"),
+    "my_intctrl.Reg0": ("q",),
+    "my_intctrl.Reg1": ("q",),
+    "my_edge_det0": ("state_reg",),
+    "my_edge_det1": ("state_reg",),
+    "my_edge_det2": ("state_reg",),
+    "my_pulse": ("state_reg",),
+    "": ("snap_R", "snap_flags"),
+}
+
+PINS = ("rst_n", "ena", "ui_in", "uio_in")
+
+
+def _scope(root, path):
+    for name in path.split(".") if path else ():
+        root = getattr(root, name)
+    return root
+
+
+class NanoCheckpoint:
+    """Checkpoints of registers, memories and input pins of the Nano system."""
+
+    def __init__(self, dut):
+        nano = dut.user_project.my_NanoSys
+        self.dut = dut
+        self.mem = NanoMemory(dut)
+        self.registers = {}
+        for path, names in STATE.items():
+            scope = _scope(nano, path)
+            for name in names:
+                self.registers[f"{path}.{name}" if path else name] = getattr(scope, name)
+        self.pins = {name: getattr(dut, name) for name in PINS}
+
+    def take(self):
+        """The current state, as {"registers", "pins", "rom", "ram", "stack"}."""
+        return {
+            "registers": {name: int(handle.value) for name, handle in self.registers.items()},
+            "pins": {name: int(handle.value) for name, handle in self.pins.items()},
+            "rom": self.mem.dump_rom(),
+            "ram": self.mem.dump_ram(),
+            "stack": self.mem.dump_stack(),
+        }
+
+    def restore(self, checkpoint):
+        """Deposit a state returned by take()."""
+        for name, value in checkpoint["pins"].items():
+            self.pins[name].value = Immediate(value)
+        self.mem.load_rom(checkpoint["rom"])
+        self.mem.load_ram(checkpoint["ram"])
+        self.mem.load_stack(checkpoint["stack"])
+        for name, value in checkpoint["registers"].items():
+            self.registers[name].value = Immediate(value)
+
+    def differences(self, checkpoint):
+        """Names of the registers, pins and memories that differ from a checkpoint."""
+        current = self.take()
+        names = [name for part in ("registers", "pins")
+                 for name, value in current[part].items() if checkpoint[part][name] != value]
+        return names + [part for part in ("rom", "ram", "stack") if current[part] != checkpoint[part]]
@@ -0,0 +1,183 @@
+#nano_cosim.py
+#=============================================================================
+# Co-simulacion en lockstep del RTL de Nano_cpu contra NanoISS, comparando en
+# las fronteras de instruccion
+#=============================================================================
+#
+# NanoCosim watches `state_reg` and `IP_reg` of my_cpu and wakes only when one
+# of them changes (never on every clock). An instruction boundary is a clock
+# that leaves the CPU in `fetch_decode` (entered from another state, or a new
+# IP after a one clock instruction) or in `stop`. At every boundary the
+# reference NanoISS is stepped by one instruction and IP, A, B, R, ACC and F,
+# the state and the clocks spent are compared with the RTL.
+#
+# The model takes over the RTL each time the CPU leaves `stop` (RUN or an
+# interrupt): registers, int_ctrl, edge detectors and the four memories are
+# copied through the cocotb handles, so programs loaded by SPI or by
+# NanoMemory are both followed. The EINT0..2 pins are recorded when uio_in
+# changes and replayed to the model with the clock they were sampled at.
+#
+# The first divergent instruction is logged with its address, disassembly,
+# simulation time and the differing values; checking stops there because
+# every later instruction would differ too. `check()` raises it:
+#
+#     cosim = NanoCosim(dut)
+#     cosim.start()
+#     ... run the program ...
+#     cosim.check()
+#=============================================================================
+
+from bisect import bisect_left
+
+import cocotb
+from cocotb.triggers import First, ReadOnly
+from cocotb.utils import get_sim_steps, get_sim_time
+
+from nano_asm import disassemble
+from nano_iss import REGISTERS, NanoISS
+from nano_mem import NanoMemory
+from nano_pins import MSK_EINT0, MSK_EINT1, MSK_EINT2
+
+#Registers compared at every instruction boundary:
+COMPARED = ("IP", "A", "B", "R", "ACC", "F")
+
+_EINT = (MSK_EINT0, MSK_EINT1, MSK_EINT2)
+
+
+class NanoCosim:
+    """Lockstep checker of my_cpu against NanoISS, one instruction at a time."""
+
+    def __init__(self, dut, iss=None, registers=COMPARED, clk_period=10, unit="us"):
+        nano = dut.user_project.my_NanoSys
+        self.dut = dut
+        self.cpu = nano.my_cpu
+        self.intctrl = nano.my_intctrl
+        self.edge_detectors = (nano.my_edge_det0, nano.my_edge_det1, nano.my_edge_det2)
+        self.mem = NanoMemory(dut)
+        self.iss = iss if iss is not None else NanoISS()
+        self.compared = tuple(registers)
+        self.period = get_sim_steps(clk_period, unit)
+        self.instructions = 0
+        self.syncs = 0
+        self.divergence = None
+        self._handles = {name: getattr(self.cpu, name + "_reg") for name in self.compared}
+        self._fetch = self.iss.isa.states["fetch_decode"]
+        self._stop = self.iss.isa.states["stop"]
+        self._eint_times = []
+        self._eint_levels = []
+        self._tasks = []
+        self._anchor = None
+
+    #-------------------------------------------------------------------------
+    def start(self):
+        self._eint_times = [get_sim_time("step")]
+        self._eint_levels = [self._eint_pins()]
+        self._tasks = [cocotb.start_soon(self._watch_state()), cocotb.start_soon(self._watch_eint())]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def check(self):
+        """Stop the checker and raise AssertionError at the first divergence."""
+        self.stop()
+        assert self.divergence is None, self.divergence
+
+    #-------------------------------------------------------------------------
+    # RTL side
+    #-------------------------------------------------------------------------
+    def _eint_pins(self):
+        value = self.dut.uio_in.value
+        if not value.is_resolvable:
+            return 0
+        value = value.to_unsigned()
+        return sum(1 << n for n, mask in enumerate(_EINT) if value & mask)
+
+    async def _watch_eint(self):
+        pins = self.dut.uio_in
+        while True:
+            await pins.value_change
+            level = self._eint_pins()
+            if level != self._eint_levels[-1]:
+                self._eint_times.append(get_sim_time("step"))
+                self._eint_levels.append(level)
+
+    async def _watch_state(self):
+        state_reg = self.cpu.state_reg
+        ip_reg = self.cpu.IP_reg
+        state = int(state_reg.value)
+        ip = int(ip_reg.value)
+        while self.divergence is None:
+            await First(state_reg.value_change, ip_reg.value_change)
+            await ReadOnly()
+            previous, state = state, int(state_reg.value)
+            changed, ip = ip != int(ip_reg.value), int(ip_reg.value)
+            if previous == self._stop:
+                if state != self._stop:
+                    self._sync(state)
+            elif state == self._stop or (state == self._fetch and (previous != self._fetch or changed)):
+                self._compare(state)
+
+    def _sync(self, state):
+        #The CPU has just left stop: copy it into the model
+        iss = self.iss
+        cpu = self.cpu
+        registers = {name: int(getattr(cpu, name + "_reg").value) for name, _ in REGISTERS}
+        edges = sum(int(det.state_reg.value) << n for n, det in enumerate(self.edge_detectors))
+        for address, byte in self.mem.dump_rom().items():
+            iss.write_rom(address, byte)
+        iss.ram = self.mem.dump_ram()
+        iss.stack = self.mem.dump_stack()
+        iss.set_state(iss.isa.state_names[state], registers,
+                      int(self.intctrl.Reg0.q.value), int(self.intctrl.Reg1.q.value), edges)
+        self._anchor = (get_sim_time("step"), iss.cycles)
+        self.syncs += 1
+
+    #-------------------------------------------------------------------------
+    # Model side
+    #-------------------------------------------------------------------------
+    def _eint_at(self, time):
+        #Level of the pins sampled by the rising edge at `time`
+        return self._eint_levels[bisect_left(self._eint_times, time) - 1]
+
+    def _compare(self, state):
+        iss = self.iss
+        if self._anchor is None:
+            return
+        now = get_sim_time("step")
+        origin, first = self._anchor
+        rtl_cycles = first + (now - origin) // self.period
+        address = iss.IP
+        text = disassemble(iss.read_rom, address, iss.isa)[0] if iss.state == "fetch_decode" else iss.state
+        irqs = iss.profile.get("irq", (0, 0))[0]
+        cycles = iss.cycles
+        instructions = iss.instructions
+        while True:
+            iss.eint = self._eint_at(origin + (iss.cycles + 1 - first) * self.period)
+            iss.clock()
+            if iss.state == "fetch_decode" or iss.state == "stop" or iss.cycles >= rtl_cycles:
+                break
+        self.instructions += iss.instructions - instructions
+
+        errors = []
+        rtl_state = iss.isa.state_names.get(state, f"{state:#04x}")
+        if iss.state != rtl_state:
+            errors.append(f"state: RTL {rtl_state}, model {iss.state}")
+        if iss.cycles != rtl_cycles:
+            errors.append(f"clocks: RTL {rtl_cycles - cycles}, model {iss.cycles - cycles}")
+        for name, handle in self._handles.items():
+            rtl = int(handle.value)
+            model = getattr(iss, name)
+            if rtl != model:
+                errors.append(f"{name}: RTL {rtl:#x}, model {model:#x}")
+        if iss.profile.get("irq", (0, 0))[0] != irqs:
+            text += " (interrupted)"
+        if errors:
+            self.divergence = (
+                f"RTL and model diverge at instruction {self.instructions}, "
+                f"{address:#05x}: {text} (t={get_sim_time('ns'):.0f} ns)\n    " + "\n    ".join(errors))
+            self.dut._log.error(self.divergence)
+        #Pin levels sampled before this boundary are no longer needed
+        keep = max(bisect_left(self._eint_times, now) - 1, 0)
+        del self._eint_times[:keep], self._eint_levels[:keep]
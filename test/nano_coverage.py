@@ -0,0 +1,371 @@
+#nano_coverage.py
+#=============================================================================
+# Cobertura de opcodes, estados y transiciones de las FSM de NanoCpuSys,
+# acumulable entre corridas
+#=============================================================================
+#
+# NanoCoverage watches `state_reg` of my_cpu and of my_NanoSPI (and
+# `instruction_reg`, which is the only change of the one clock opcodes that
+# go from fetch_decode back to fetch_decode) and counts, waking only when one
+# of them changes:
+#
+#     opcodes           executed opcodes
+#     states            CPU states entered
+#     opcode_states     (opcode, state): the states every opcode went through,
+#                       with "irq" for the interrupt entry and "start" for RUN
+#     transitions       (state, next) of the CPU, self-loops not included
+#     flags             (opcode, bit, value) of F_reg after the opcodes that
+#                       write the flags
+#     branches          (jump, "taken" | "not_taken") of the conditional jumps
+#     spi_states        states of slave_spi4nano entered
+#     spi_transitions   (state, next) of slave_spi4nano
+#
+# The bins that can be reached (CoverageSpace) come from the RTL: the CPU
+# ones from running every opcode on NanoISS under the conditions of
+# nano_cycles.py (plus the interrupt entries and RUN), the SPI ones from the
+# `case (state_reg)` of src/Nano_spi.v. With `path`, the counts are written to
+# a compact JSON file when the collector stops (or its test ends), so every
+# shard of run_shards.py leaves one, and the files are merged into one report
+# of the bins not covered:
+#
+#     coverage = NanoCoverage(path="coverage.json")
+#     coverage.start(dut)
+#     ... run programs ...
+#     coverage.stop()
+#     dut._log.info(coverage.report())
+#
+#     python nano_coverage.py merge all.json shard0.json shard1.json ...
+#     python nano_coverage.py report all.json
+#
+# A one clock opcode repeated back to back (nop / nop) leaves instruction_reg
+# unchanged, so only the first one is counted, and an instruction that ends
+# in the time step of a reset is not counted. Only the RTL model has these
+# signals (not GATES=yes).
+#=============================================================================
+
+import argparse
+import json
+
+import cocotb
+from cocotb.triggers import First, ReadOnly
+
+from nano_cycles import _AT, _CONDITIONS, _TARGET, _measure
+from nano_isa import get_isa, rtl_option, spi_states, spi_transitions
+from nano_iss import NanoISS
+
+#Bin categories, in the order of the reports
+CATEGORIES = ("opcodes", "states", "opcode_states", "transitions", "flags", "branches",
+              "spi_states", "spi_transitions")
+
+_spaces = {}
+
+
+class CoverageSpace:
+    """Reachable bins of every category, and what the collector needs to classify them."""
+
+    def __init__(self, isa, modes):
+        self.opcodes = set(isa.opcodes)
+        self.states = set(isa.states)
+        self.opcode_states = set()
+        self.transitions = set()
+        self.flags = set()
+        self.branches = set()
+        self.spi_states = set(spi_states())
+        self.spi_transitions = spi_transitions()
+        self.flag_bits = {}     #Opcodes that write F_reg: bits written
+        self.taken = {}         #Conditional jumps: first state of the taken path
+
+        for name in isa.opcodes:
+            paths = {}
+            bits = 0
+            for conditions in ({},) + _CONDITIONS:
+                _, states, iss, _ = _measure(isa, modes, name, **conditions)
+                self._path(name, states, iss.state)
+                bits |= iss.F ^ conditions.get("F", 0)
+                paths[iss.IP == _TARGET] = states
+            if bits:
+                self.flag_bits[name] = bits
+                self.flags |= {(name, bit, value) for bit in range(8) if bits >> bit & 1 for value in (0, 1)}
+            if "caddr" in isa.operands[name] and name not in ("jmp", "call"):
+                self.taken[name] = next(s for s in paths[True] if s not in paths[False])
+                self.branches |= {(name, "taken"), (name, "not_taken")}
+
+        #Interrupt entries from fetch_decode and from stop, and RUN
+        for origin in ("fetch_decode", "stop"):
+            for n in range(3):
+                iss = NanoISS(isa, *modes)
+                iss.set_state(origin, {"IP": _AT, "SP": 4}, En=1 << n, Flg=1 << n)
+                states = [origin]
+                iss.clock()
+                while iss.state != "fetch_decode":
+                    states.append(iss.state)
+                    iss.clock()
+                self._path("irq", tuple(states), iss.state)
+        self._path("start", ("stop", "start"), "fetch_decode")
+
+    def _path(self, name, states, final):
+        states = states + (final,)
+        self.transitions |= {(a, b) for a, b in zip(states, states[1:]) if a != b}
+        self.opcode_states |= {(name, s) for s in states[1:] if s != "fetch_decode"}
+
+    def bins(self, category):
+        return getattr(self, category)
+
+
+def coverage_space(isa=None, mul_mode=None, shift_mode=None, prefetch=None):
+    """CoverageSpace of the RTL (cached per source and build options)."""
+    isa = isa if isa is not None else get_isa()
+    mul_mode = mul_mode if mul_mode is not None else rtl_option("MUL_MODE")
+    shift_mode = shift_mode if shift_mode is not None else rtl_option("SHIFT_MODE")
+    prefetch = prefetch if prefetch is not None else rtl_option("PREFETCH")
+    key = (isa.digest, mul_mode, shift_mode, prefetch)
+    if key not in _spaces:
+        _spaces[key] = CoverageSpace(isa, key[1:])
+    return _spaces[key]
+
+
+def _nest(counts):
+    #{(a, b, ...): n} -> {a: {b: ... n}}, the form of the JSON file
+    nested = {}
+    for key, n in counts.items():
+        if not isinstance(key, tuple):
+            nested[key] = n
+            continue
+        level = nested
+        for part in key[:-1]:
+            level = level.setdefault(str(part), {})
+        level[str(key[-1])] = n
+    return nested
+
+
+def _flat(nested, prefix=()):
+    counts = {}
+    for part, value in nested.items():
+        key = prefix + (int(part) if part.isdigit() else part,)
+        if isinstance(value, dict):
+            counts.update(_flat(value, key))
+        else:
+            counts[key if len(key) > 1 else key[0]] = value
+    return counts
+
+
+def _name(category, key):
+    if category.endswith("transitions"):
+        return f"{key[0]} -> {key[1]}"
+    if category == "flags":
+        return f"{key[0]} F[{key[1]}]={key[2]}"
+    return " ".join(key) if isinstance(key, tuple) else key
+
+
+class NanoCoverage:
+    """Opcode, FSM state and transition coverage of the Nano system, mergeable across runs."""
+
+    def __init__(self, isa=None, path=None, mul_mode=None, shift_mode=None, prefetch=None):
+        self.isa = isa if isa is not None else get_isa()
+        self.path = path
+        self.modes = {
+            "MUL_MODE": mul_mode if mul_mode is not None else rtl_option("MUL_MODE"),
+            "SHIFT_MODE": shift_mode if shift_mode is not None else rtl_option("SHIFT_MODE"),
+            "PREFETCH": prefetch if prefetch is not None else rtl_option("PREFETCH"),
+        }
+        self._task = None
+        self.clear()
+
+    @property
+    def space(self):
+        return coverage_space(self.isa, *self.modes.values())
+
+    def clear(self):
+        self.runs = 0
+        for category in CATEGORIES:
+            setattr(self, category, {})
+
+    def start(self, dut):
+        self.stop()
+        self.runs += 1
+        self._task = cocotb.start_soon(self._watch(dut.user_project.my_NanoSys))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self._save()
+
+    #-------------------------------------------------------------------------
+    async def _watch(self, nano):
+        cpu, spi = nano.my_cpu, nano.my_NanoSPI
+        space = self.space
+        names = self.isa.names
+        cpu_names = self.isa.state_names
+        spi_names = {code: name for name, code in spi_states().items()}
+        fetch = "fetch_decode"
+        state = instruction = spi_state = None
+        current, taken = None, False    #Opcode being executed, taken path seen
+        try:
+            while True:
+                await First(cpu.state_reg.value_change, cpu.instruction_reg.value_change,
+                            spi.state_reg.value_change)
+                await ReadOnly()
+                previous, state = state, cpu_names.get(_read(cpu.state_reg))
+                code = _read(cpu.instruction_reg)
+                changed, instruction = code != instruction, code
+                spi_previous, spi_state = spi_state, spi_names.get(_read(spi.state_reg))
+                if spi_state != spi_previous and spi_state is not None:
+                    _count(self.spi_states, spi_state)
+                    if spi_previous is not None:
+                        _count(self.spi_transitions, (spi_previous, spi_state))
+                if state is None:
+                    continue
+                if _read(cpu.reset):
+                    #Reset: back to stop without an instruction or a transition
+                    state, current = "stop", None
+                    continue
+                if state == previous:
+                    if state == fetch and changed:
+                        #One clock opcode
+                        _count(self.opcodes, names.get(instruction, "illegal"))
+                    continue
+                _count(self.states, state)
+                if previous is None:
+                    continue
+                _count(self.transitions, (previous, state))
+                if state == "ini_iss":
+                    current, taken = "irq", False
+                elif state == "start":
+                    current, taken = "start", False
+                elif previous == fetch:
+                    current, taken = names.get(instruction, "illegal"), False
+                    _count(self.opcodes, current)
+                if current is None:
+                    continue
+                if state != fetch:
+                    _count(self.opcode_states, (current, state))
+                    taken = taken or space.taken.get(current) == state
+                if state == fetch or state == "stop":
+                    if current in space.taken:
+                        _count(self.branches, (current, "taken" if taken else "not_taken"))
+                    bits = space.flag_bits.get(current)
+                    if bits:
+                        F = _read(cpu.F_reg)
+                        for bit in range(8):
+                            if bits >> bit & 1 and F is not None:
+                                _count(self.flags, (current, bit, F >> bit & 1))
+                    current = None
+        finally:
+            self._save()
+
+    def _save(self):
+        if self.path is not None:
+            self.save(self.path)
+
+    #-------------------------------------------------------------------------
+    # Files and merging
+    #-------------------------------------------------------------------------
+    def to_json(self):
+        data = {"digest": self.isa.digest, "modes": self.modes, "runs": self.runs}
+        data.update({category: _nest(getattr(self, category)) for category in CATEGORIES})
+        return json.dumps(data, separators=(",", ":"))
+
+    def save(self, path):
+        with open(path, "w") as f:
+            f.write(self.to_json() + "\n")
+
+    @classmethod
+    def load(cls, path, isa=None):
+        """Collector with the counts of a file written by save()."""
+        with open(path) as f:
+            data = json.load(f)
+        modes = data["modes"]
+        coverage = cls(isa, mul_mode=modes["MUL_MODE"], shift_mode=modes["SHIFT_MODE"],
+                       prefetch=modes["PREFETCH"])
+        if data["digest"] != coverage.isa.digest:
+            raise ValueError(f"{path} was collected with another Nano_cpu source")
+        coverage.runs = data["runs"]
+        for category in CATEGORIES:
+            setattr(coverage, category, _flat(data[category]))
+        return coverage
+
+    def merge(self, other):
+        """Add the counts of another collector (same RTL source and options)."""
+        if other.isa.digest != self.isa.digest or other.modes != self.modes:
+            raise ValueError(f"coverage of another RTL build: {other.modes} vs {self.modes}")
+        self.runs += other.runs
+        for category in CATEGORIES:
+            counts = getattr(self, category)
+            for key, n in getattr(other, category).items():
+                counts[key] = counts.get(key, 0) + n
+        return self
+
+    #-------------------------------------------------------------------------
+    # Results
+    #-------------------------------------------------------------------------
+    def uncovered(self):
+        """{category: bins of the space never hit}."""
+        space = self.space
+        return {category: sorted(set(space.bins(category)) - set(getattr(self, category)), key=str)
+                for category in CATEGORIES}
+
+    def unexpected(self):
+        """{category: bins hit that are not in the space} (resets, deposits ...)."""
+        space = self.space
+        return {category: sorted(set(getattr(self, category)) - set(space.bins(category)), key=str)
+                for category in CATEGORIES}
+
+    def report(self, uncovered=True):
+        """Covered bins per category and, with `uncovered`, the list of the missing ones."""
+        space = self.space
+        missing = self.uncovered()
+        unexpected = self.unexpected()
+        lines = [f"{self.runs} runs, {' '.join(f'{k}={v}' for k, v in self.modes.items())}",
+                 f"{'bins':<17}{'covered':>8}{'total':>7}{'share':>8}"]
+        for category in CATEGORIES:
+            total = len(space.bins(category))
+            covered = total - len(missing[category])
+            line = f"{category:<17}{covered:>8}{total:>7}{covered / max(total, 1):>8.1%}"
+            if unexpected[category]:
+                line += f"  ({len(unexpected[category])} outside the space)"
+            lines.append(line)
+        for category in CATEGORIES if uncovered else ():
+            if missing[category]:
+                lines.append(f"uncovered {category}:")
+                line = "   "
+                for key in missing[category]:
+                    item = " " + _name(category, key) + ","
+                    if len(line) + len(item) > 100:
+                        lines.append(line)
+                        line = "   "
+                    line += item
+                lines.append(line.rstrip(","))
+        return "\n".join(lines)
+
+
+def _read(handle):
+    value = handle.value
+    return int(value) if value.is_resolvable else None
+
+
+def _count(counts, key):
+    counts[key] = counts.get(key, 0) + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge and report Nano coverage files")
+    commands = parser.add_subparsers(dest="command", required=True)
+    merge = commands.add_parser("merge", help="merge coverage files into one")
+    merge.add_argument("output")
+    merge.add_argument("inputs", nargs="+")
+    report = commands.add_parser("report", help="covered and uncovered bins of a coverage file")
+    report.add_argument("input")
+    args = parser.parse_args()
+    if args.command == "merge":
+        coverage = NanoCoverage.load(args.inputs[0])
+        for path in args.inputs[1:]:
+            coverage.merge(NanoCoverage.load(path))
+        coverage.save(args.output)
+    else:
+        coverage = NanoCoverage.load(args.input)
+    print(coverage.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,564 @@
+#nano_cycles.py
+#=============================================================================
+# Estimacion estatica de los ciclos de reloj de los programas de Nano, sin
+# simulacion
+#=============================================================================
+#
+# The clocks of every opcode are taken from the FSM of src/Nano_cpu4Mc_119.v
+# by running it once on NanoISS (which executes one FSM state per clock),
+# under the conditions that change its path: a conditional jump taken and not
+# taken, reti returning to the program or to stop, and the shift count A[5:0]
+# of sracc/sraacc/slacc (measured for the 64 counts: one clock of sxacc_exe
+# per position with the iterative shifter, one pass for any nonzero count
+# with SHIFT_MODE 1). xmul_exe takes a fixed number of clocks (17 with the
+# iterative multiplier, 9 or 2 with MUL_MODE 1 or 2), so the multiplies have
+# one cost. PREFETCH 1 takes one clock from the instructions with two bytes
+# operands.
+#
+# NanoCycles splits the code of an image in basic blocks (from the reset
+# address and the INT0..2 vectors), finds the loops of every routine and
+# gives (low, high) clocks for blocks, loop iterations, routines and
+# interrupt handlers. A, I, J, N and M are followed as constants inside the
+# routines, so a shift after `movka` has its exact cost and a loop closed by
+#
+#         movki 0 / movkn 20 ... loop: ... incir ... cmpin / jnz16 loop
+#
+# (or cmpjm with J and M) gets its iteration count. The count of other loops
+# is given with `bounds` (times the loop header runs, by label or address);
+# without it the high bound is UNBOUNDED:
+#
+#     cycles = NanoCycles(image, bounds={"wait": 10})
+#     low, high = cycles.program()        #start state to stop, as NanoISS.run()
+#     low, high = cycles.handler(0)       #INT0: interrupt entry, vector and ISR
+#     print(cycles.report())
+#
+# This module does not import cocotb and can be used outside the simulator:
+#
+#     python nano_cycles.py program.asm [label=iterations ...]
+#=============================================================================
+
+import math
+import sys
+
+from nano_isa import get_isa, rtl_option
+from nano_iss import NanoISS
+
+UNBOUNDED = math.inf
+
+#Registers followed as constants (shift counts and loop counters)
+TRACKED = ("A", "I", "J", "N", "M")
+
+#Loop counters: compare instruction -> (counter, limit)
+_COUNTERS = {"cmpin": ("I", "N"), "cmpjm": ("J", "M")}
+_STEPS = {"incir": ("I", 1), "decir": ("I", -1), "incjr": ("J", 1), "decjr": ("J", -1)}
+
+#Where the opcodes are measured: instruction, jump target and return address
+_AT = 0x010
+_TARGET = 0x040
+_RETURN = 0x030
+
+#Conditions measured besides the default one: shift counts, jumps taken and
+#not taken, reti to stop
+_CONDITIONS = ({"A": 63}, {"A": 0x5A5A}, {"F": 0xFF}, {"FDI": 0})
+
+_costs = {}
+
+
+class OpCost:
+    """Clocks of one opcode in the FSM of Nano_cpu."""
+
+    def __init__(self, name, size, clocks, states, taken=None, by_count=None, low=None, high=None, writes=()):
+        self.name = name
+        self.size = size
+        self.clocks = clocks            #Not taken jump, zero shift count, reti to the program
+        self.states = states            #FSM states of that path
+        self.taken = taken              #Conditional jumps: clocks when taken
+        self.by_count = by_count        #Shifts: clocks for every value of A[5:0]
+        self.low = clocks if low is None else low
+        self.high = clocks if high is None else high
+        self.writes = frozenset(writes)  #TRACKED registers it may change
+
+    def cost(self, A=None):
+        """(low, high) clocks, exact for a shift with a known A."""
+        if self.by_count and A is not None:
+            clocks = self.by_count[A & 0x3F]
+            return clocks, clocks
+        return self.low, self.high
+
+
+def _measure(isa, modes, name, A=0, F=0, FDI=1):
+    #One instruction at _AT on a fresh model: clocks, states, model
+    iss = NanoISS(isa, *modes)
+    iss.write_rom(_AT, isa.opcodes[name])
+    operands = (_TARGET >> 8, _TARGET & 0xFF, 0x01)
+    for i in range(isa.size(name) - 1):
+        iss.write_rom(_AT + 1 + i, operands[i])
+    iss.ram = [0xA5A5] * len(iss.ram)
+    iss.stack = [_RETURN] * len(iss.stack)
+    iss.set_state("fetch_decode", {"IP": _AT, "A": A, "B": 0x0101, "F": F, "FDI": FDI, "ISF": FDI,
+                                   "SP": 4, "USP": 2, "I": 0x10, "J": 0x20, "N": 0x30, "M": 0x40})
+    before = {reg: getattr(iss, reg) for reg in TRACKED}
+    states = []
+    while True:
+        states.append(iss.state)
+        iss.clock()
+        if iss.state == "fetch_decode" or iss.state == "stop":
+            break
+    writes = {reg for reg in TRACKED if getattr(iss, reg) != before[reg]}
+    return len(states), tuple(states), iss, writes
+
+
+def opcode_costs(isa=None, mul_mode=None, shift_mode=None, prefetch=None):
+    """{name: OpCost} of every opcode, measured on the FSM (cached per RTL source)."""
+    isa = isa if isa is not None else get_isa()
+    mul_mode = mul_mode if mul_mode is not None else rtl_option("MUL_MODE")
+    shift_mode = shift_mode if shift_mode is not None else rtl_option("SHIFT_MODE")
+    prefetch = prefetch if prefetch is not None else rtl_option("PREFETCH")
+    modes = (mul_mode, shift_mode, prefetch)
+    key = (isa.digest,) + modes
+    if key in _costs:
+        return _costs[key]
+    table = {}
+    for name in isa.opcodes:
+        clocks, states, iss, writes = _measure(isa, modes, name)
+        runs = [(clocks, iss)]
+        for conditions in _CONDITIONS:
+            c, _, other, w = _measure(isa, modes, name, **conditions)
+            runs.append((c, other))
+            writes |= w
+        low = min(c for c, _ in runs)
+        high = max(c for c, _ in runs)
+        taken = by_count = None
+        if "caddr" in isa.operands[name] and name not in ("jmp", "call"):
+            #Conditional jump: the run that reached the target is the taken one
+            paths = {other.IP == _TARGET: c for c, other in runs}
+            taken, clocks = paths.get(True), paths.get(False, clocks)
+        elif runs[1][0] != clocks:
+            #Cost driven by A[5:0]: measured for every count
+            by_count = tuple(_measure(isa, modes, name, A=count)[0] for count in range(64))
+            low, high = min(by_count), max(by_count)
+        table[name] = OpCost(name, isa.size(name), clocks, states, taken, by_count, low, high, writes)
+    _costs[key] = table
+    return table
+
+
+def irq_entry(isa=None, from_stop=False):
+    """Clocks from the fetch_decode (or stop) that takes an interrupt to the vector."""
+    isa = isa if isa is not None else get_isa()
+    iss = NanoISS(isa)
+    iss.set_state("stop" if from_stop else "fetch_decode", {"IP": _AT, "SP": 4}, En=1, Flg=1)
+    return iss.step()
+
+
+def _add(a, b):
+    return a[0] + b[0], a[1] + b[1]
+
+
+def _meet(states):
+    #Constants that every path agrees on
+    states = [s for s in states if s is not None]
+    if not states:
+        return None
+    first = states[0]
+    return {reg: v for reg, v in first.items() if all(s.get(reg) == v for s in states[1:])}
+
+
+class Block:
+    """Basic block: instructions, clocks and successors."""
+
+    def __init__(self, start):
+        self.start = start
+        self.instructions = []      #(address, name, operand)
+        self.successors = []        #Code addresses (None: leaves the routine)
+        self.body = (0, 0)          #Clocks of all but the last instruction
+        self.edges = {}             #Successor -> clocks of the last instruction to it
+        self.callee = None          #Routine called by the last instruction
+        self.known = None           #Constants at the start of the block
+
+
+class Loop:
+    """Natural loop of a routine: header, blocks, clocks per iteration and count."""
+
+    def __init__(self, header, blocks, iteration, iterations, exits):
+        self.header = header
+        self.blocks = blocks
+        self.iteration = iteration      #(low, high) clocks of one pass back to the header
+        self.iterations = iterations    #(low, high) runs of the header, or None
+        self.exits = exits              #Exit target -> (low, high) clocks of the whole loop
+
+
+class NanoCycles:
+    """Static (low, high) clocks of the blocks, loops and routines of an image."""
+
+    def __init__(self, image, bounds=None, isa=None, mul_mode=None, shift_mode=None, prefetch=None):
+        self.isa = isa if isa is not None else get_isa()
+        self.costs = opcode_costs(self.isa, mul_mode, shift_mode, prefetch)
+        self.labels = dict(getattr(image, "labels", {}))
+        self._iss = NanoISS(self.isa)
+        rom = image.rom if hasattr(image, "rom") else image
+        for address, byte in rom.items():
+            self._iss.write_rom(address, byte)
+        self.bounds = {}
+        for key, count in (bounds or {}).items():
+            address = self.labels[key] if isinstance(key, str) else key
+            self.bounds[address] = count if isinstance(count, tuple) else (count, count)
+        start = NanoISS(self.isa)
+        start.set_state("start")
+        self.start_clocks = start.step()
+        self.blocks = {}
+        self.loops = {}
+        self._routines = {}
+        self._active = set()
+        self._from_stop = False
+        jmp = self.isa.opcodes["jmp"]
+        self.entries = [0] + [v for _, v in sorted(self.isa.vectors.items()) if self._iss.read_rom(v) == jmp]
+        self._build(self.entries)
+
+    #-------------------------------------------------------------------------
+    # Control flow graph
+    #-------------------------------------------------------------------------
+    def _decode(self, address):
+        read = self._iss.read_rom
+        name = self.isa.names.get(read(address))
+        if name is None:
+            return None, 1, None
+        operand = None
+        if self.isa.size(name) == 3:
+            operand = (read((address + 1) & 0xFFF) << 8) | read((address + 2) & 0xFFF)
+            if "caddr" in self.isa.operands[name]:
+                operand &= 0xFFF
+        elif self.isa.size(name) == 2:
+            operand = read((address + 1) & 0xFFF)
+        return name, self.isa.size(name), operand
+
+    def _flow(self, address, name, size, operand):
+        #(successors in the routine, called routine) of an instruction
+        following = (address + size) & 0xFFF
+        if name is None or name in ("stop", "ret", "reti"):
+            return [None], None
+        if name == "jmp":
+            return [operand], None
+        if name == "call":
+            return [following], operand
+        cost = self.costs[name]
+        if cost.taken is not None:
+            return [operand, following], None
+        return [following], None
+
+    def _build(self, entries):
+        #Leaders: entries, jump targets and the instructions after a branch or call
+        leaders = set(entries)
+        seen = set()
+        work = list(entries)
+        while work:
+            address = work.pop()
+            while address not in seen:
+                seen.add(address)
+                name, size, operand = self._decode(address)
+                successors, callee = self._flow(address, name, size, operand)
+                if callee is not None:
+                    leaders.add(callee)
+                    work.append(callee)
+                if successors != [(address + size) & 0xFFF] or callee is not None:
+                    for s in successors:
+                        if s is not None:
+                            leaders.add(s)
+                            work.append(s)
+                    break
+                address = successors[0]
+        for start in sorted(leaders):
+            block = self.blocks[start] = Block(start)
+            address = start
+            while True:
+                name, size, operand = self._decode(address)
+                block.instructions.append((address, name or "illegal", operand))
+                successors, callee = self._flow(address, name, size, operand)
+                following = (address + size) & 0xFFF
+                if successors != [following] or callee is not None or following in leaders:
+                    block.successors = successors
+                    block.callee = callee
+                    break
+                address = following
+
+    #-------------------------------------------------------------------------
+    # Costs
+    #-------------------------------------------------------------------------
+    def _instruction(self, name, known):
+        cost = self.costs.get(name)
+        if cost is None:
+            return (1, 1)
+        if name == "reti":
+            #Back to the interrupted program (FDI) or to stop
+            clocks = cost.low if self._from_stop else cost.clocks
+            return clocks, clocks
+        return cost.cost(known.get("A"))
+
+    def _transfer(self, name, operand, known, known_out):
+        #Next constants after an instruction
+        cost = self.costs.get(name)
+        if cost is None:
+            return
+        for reg in cost.writes:
+            known_out.pop(reg, None)
+        if name.startswith("movk") and name[4:].upper() in TRACKED:
+            known_out[name[4:].upper()] = operand & 0xFFFF
+        elif name in _STEPS:
+            reg, delta = _STEPS[name]
+            if reg in known:
+                known_out[reg] = (known[reg] + delta) & 0xFFFF
+
+    def _scan(self, block, known):
+        #Body and edge clocks of a block and the constants at its end
+        body = (0, 0)
+        known = dict(known or {})
+        for address, name, operand in block.instructions[:-1]:
+            body = _add(body, self._instruction(name, known))
+            after = dict(known)
+            self._transfer(name, operand, known, after)
+            known = after
+        address, name, operand = block.instructions[-1]
+        edges = {}
+        cost = self.costs.get(name)
+        for successor in block.successors:
+            if cost is None:
+                edges[successor] = (1, 1)
+            elif cost.taken is not None:
+                clocks = cost.taken if successor == operand else cost.clocks
+                if operand == (address + cost.size) & 0xFFF:
+                    clocks = (min(cost.clocks, cost.taken), max(cost.clocks, cost.taken))
+                edges[successor] = clocks if isinstance(clocks, tuple) else (clocks, clocks)
+            else:
+                edges[successor] = self._instruction(name, known)
+        after = dict(known)
+        self._transfer(name, operand, known, after)
+        if block.callee is not None:
+            callee = self.routine(block.callee)
+            for successor in edges:
+                edges[successor] = _add(edges[successor], callee)
+            after = {}
+        return body, edges, after
+
+    #-------------------------------------------------------------------------
+    # Routines and loops
+    #-------------------------------------------------------------------------
+    def routine(self, entry):
+        """(low, high) clocks from `entry` to the ret, reti or stop that leaves it."""
+        key = (entry, self._from_stop)
+        if key in self._routines:
+            return self._routines[key]
+        if key in self._active or entry not in self.blocks:
+            return (0, UNBOUNDED)
+        self._active.add(key)
+        result = self._routine(entry)
+        self._active.discard(key)
+        self._routines[key] = result
+        return result
+
+    def _routine(self, entry):
+        #Blocks of the routine in reverse postorder
+        order, seen = [], set()
+
+        def visit(start):
+            seen.add(start)
+            for s in self.blocks[start].successors:
+                if s is not None and s not in seen:
+                    visit(s)
+            order.append(start)
+        visit(entry)
+        order.reverse()
+        preds = {start: [] for start in order}
+        for start in order:
+            for s in self.blocks[start].successors:
+                if s is not None:
+                    preds[s].append(start)
+
+        #Dominators
+        index = {start: i for i, start in enumerate(order)}
+        dom = {start: set(order) for start in order}
+        dom[entry] = {entry}
+        changed = True
+        while changed:
+            changed = False
+            for start in order[1:]:
+                new = set.intersection(*(dom[p] for p in preds[start])) | {start}
+                if new != dom[start]:
+                    dom[start], changed = new, True
+        back = {(u, h) for u in order for h in self.blocks[u].successors if h is not None and h in dom[u]}
+        irreducible = any(index[h] <= index[u] and (u, h) not in back
+                          for u in order for h in self.blocks[u].successors if h is not None)
+
+        #Constants (forward, to a fixed point) and the clocks of the blocks
+        out = {}
+        for _ in range(len(order) + 2):
+            changed = False
+            for start in order:
+                block = self.blocks[start]
+                known = {} if start == entry else _meet(out.get(p) for p in preds[start])
+                block.known = known
+                block.body, block.edges, after = self._scan(block, known)
+                if out.get(start) != after:
+                    out[start], changed = after, True
+            if not changed:
+                break
+
+        #Natural loops, innermost first, collapsed into their headers
+        loops = {}
+        for u, h in back:
+            body, work = {h}, [u]
+            while work:
+                n = work.pop()
+                if n not in body:
+                    body.add(n)
+                    work += preds[n]
+            loops.setdefault(h, set()).update(body)
+        node_body = {start: self.blocks[start].body for start in order}
+        node_edges = {start: dict(self.blocks[start].edges) for start in order}
+        rep = {start: start for start in order}
+        for header in sorted(loops, key=lambda h: len(loops[h])):
+            nodes = {rep[n] for n in loops[header]}
+            iteration, exits = self._collapse(header, nodes, node_body, node_edges)
+            iterations = self.bounds.get(header) or self._count(header, loops[header], dom, preds, out)
+            total = {}
+            for target, (low, high) in exits.items():
+                if iterations is None:
+                    total[target] = (low, UNBOUNDED)
+                else:
+                    total[target] = (low + (iterations[0] - 1) * iteration[0],
+                                     high + (iterations[1] - 1) * iteration[1])
+            self.loops[header] = Loop(header, sorted(loops[header]), iteration, iterations, total)
+            node_body[header] = (0, 0)
+            node_edges[header] = total
+            for n in loops[header]:
+                rep[n] = header
+        if irreducible:
+            return (0, UNBOUNDED)
+        _, exits = self._collapse(entry, {rep[n] for n in order}, node_body, node_edges, whole=True)
+        return exits.get(None, (UNBOUNDED, UNBOUNDED))
+
+    def _collapse(self, header, nodes, node_body, node_edges, whole=False):
+        #Longest and shortest paths from the header over the forward edges:
+        #clocks of one iteration (back to the header) and to every exit
+        order, seen = [], set()
+
+        def visit(n):
+            seen.add(n)
+            for t in node_edges[n]:
+                if t in nodes and t != header and t not in seen:
+                    visit(t)
+            order.append(n)
+        visit(header)
+        order.reverse()
+        dist = {header: node_body[header]}
+        iteration = None
+        exits = {}
+        for n in order:
+            if n not in dist:
+                continue
+            for t, clocks in node_edges[n].items():
+                reached = _add(dist[n], clocks)
+                if t == header and not whole:
+                    iteration = reached if iteration is None else (min(iteration[0], reached[0]),
+                                                                   max(iteration[1], reached[1]))
+                elif t in nodes and t != header:
+                    reached = _add(reached, node_body[t])
+                    old = dist.get(t)
+                    dist[t] = reached if old is None else (min(old[0], reached[0]), max(old[1], reached[1]))
+                else:
+                    old = exits.get(t)
+                    exits[t] = reached if old is None else (min(old[0], reached[0]), max(old[1], reached[1]))
+        return iteration or (0, 0), exits
+
+    def _count(self, header, body, dom, preds, out):
+        #Iterations of a loop closed by cmpin/cmpjm and a jump back to the header
+        for latch in body:
+            block = self.blocks[latch]
+            if header not in block.successors or len(block.instructions) < 2:
+                continue
+            (_, compare, _), (_, jump, target) = block.instructions[-2:]
+            if compare not in _COUNTERS or jump not in ("jnz16", "jz16"):
+                continue
+            if (jump == "jnz16") != (target == header):
+                continue
+            counter, limit = _COUNTERS[compare]
+            #One step of the counter per iteration, before the compare, and
+            #nothing else (not even a call) changing the counter or the limit
+            steps = [(start, name) for start in body for _, name, _ in self.blocks[start].instructions
+                     if name not in self.costs or self.blocks[start].callee is not None
+                     or counter in self.costs[name].writes or limit in self.costs[name].writes]
+            if len(steps) != 1 or steps[0][1] not in _STEPS or _STEPS[steps[0][1]][0] != counter:
+                continue
+            start, name = steps[0]
+            if start not in dom[latch]:
+                continue
+            entering = _meet(out.get(p) for p in preds[header] if p not in body)
+            if not entering or counter not in entering or limit not in entering:
+                continue
+            count = ((entering[limit] - entering[counter]) * _STEPS[name][1]) & 0xFFFF or 0x10000
+            return count, count
+        return None
+
+    #-------------------------------------------------------------------------
+    # Results
+    #-------------------------------------------------------------------------
+    def program(self):
+        """(low, high) clocks from the start state to stop, as NanoISS.run()."""
+        return _add((self.start_clocks, self.start_clocks), self.routine(0))
+
+    def handler(self, n, from_stop=False):
+        """(low, high) clocks of INTn: entry, vector jmp and ISR up to the end of reti.
+
+        The interrupt is taken in fetch_decode (or in stop with `from_stop`),
+        which decides where reti goes and its clocks.
+        """
+        vector = self.isa.vectors[n]
+        if vector not in self.blocks:
+            raise ValueError(f"INT{n} vector {vector:#05x} has no jmp")
+        entry = irq_entry(self.isa, from_stop)
+        self._from_stop = from_stop
+        try:
+            return _add((entry, entry), self.routine(vector))
+        finally:
+            self._from_stop = False
+
+    def name(self, address):
+        names = [name for name, a in self.labels.items() if a == address]
+        return names[0] if names else f"{address:#05x}"
+
+    def report(self):
+        """Routines, loops and blocks with their (low, high) clocks."""
+        def text(bounds):
+            low, high = bounds
+            return f"{low}" if low == high else f"{low}..{'unbounded' if high == UNBOUNDED else high}"
+        lines = [f"program        {text(self.program())}"]
+        for n, vector in sorted(self.isa.vectors.items()):
+            if vector in self.blocks:
+                lines.append(f"INT{n} handler   {text(self.handler(n))}")
+        for (entry, from_stop), bounds in sorted(self._routines.items()):
+            if not from_stop:
+                lines.append(f"routine {self.name(entry):<12}{text(bounds)}")
+        for header, loop in sorted(self.loops.items()):
+            count = text(loop.iterations) if loop.iterations else "?"
+            lines.append(f"loop {self.name(header):<15}{count} x {text(loop.iteration)}"
+                         f" = {', '.join(text(b) for b in loop.exits.values())}")
+        for start, block in sorted(self.blocks.items()):
+            last = block.instructions[-1][1]
+            edges = ", ".join(f"{'exit' if s is None else self.name(s)}: {text(_add(block.body, c))}"
+                              for s, c in block.edges.items())
+            lines.append(f"block {self.name(start):<14}{len(block.instructions):>3} ins, {last:<8} {edges}")
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from nano_asm import AsmError, assemble_file
+
+    if len(sys.argv) < 2:
+        sys.exit("usage: python nano_cycles.py program.asm [label=iterations ...]")
+    try:
+        image = assemble_file(sys.argv[1])
+    except AsmError as e:
+        sys.exit(f"{sys.argv[1]}: {e}")
+    bounds = {}
+    for arg in sys.argv[2:]:
+        key, count = arg.split("=")
+        bounds[key if key in image.labels else int(key, 0)] = int(count)
+    print(NanoCycles(image, bounds).report())
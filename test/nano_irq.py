@@ -0,0 +1,260 @@
+#nano_irq.py
+#=============================================================================
+# Estimulos programados en EINT0..2 y latencias de las interrupciones
+#=============================================================================
+#
+# NanoIrqStimulus drives EINT0..2 (uio[4:6]) from a schedule of edges and
+# follows every edge through edge_detector, int_ctrl and the ini_iss path of
+# my_cpu. Schedules are lists of clocks (from the start of drive()) built by
+# periodic(), poisson() and bursty(), one per line:
+#
+#     irq = NanoIrqStimulus(dut, clk_period=10, unit="us")
+#     irq.start()
+#     await irq.drive({0: poisson(40, 100, seed=1), 2: periodic(75, 50)})
+#     await irq.drain(timeout_cycles=1000)
+#     irq.stop()
+#     dut._log.info(irq.report())
+#
+# Every EINT pulse is `width` clocks high, from a falling edge of clk, and
+# the edges of a line must be more than `width` clocks apart. When the flag
+# of the line in int_ctrl (the ack of the edge detector, set in set_int<n>_F)
+# rises the oldest pending edge is acknowledged, and it is served when the
+# CPU fetches at the vector of the line. Edges are lost when they are merged
+# with the acknowledged one (pending when the flag rises), when their pulse
+# ends while the flag is set (the ack keeps the detector clear) and when the
+# flag is cleared before the CPU gets to the vector. For every served edge
+# two latencies are kept, in clocks from the EINT rising edge:
+#
+#     entry   to the fetch_decode of the first instruction at the vector
+#     reti    to the fetch_decode of the reti of the ISR
+#
+# max_period() searches the shortest period of a periodic schedule that
+# loses no edge, the highest interrupt rate the program sustains.
+#
+# The monitor reads state_reg/IP_reg of my_cpu and the flags of int_ctrl, so
+# it only works with the RTL model (not with GATES=yes).
+#=============================================================================
+
+import numpy as np
+
+import cocotb
+from cocotb.triggers import ClockCycles, Event, FallingEdge, First, ReadOnly, Timer
+from cocotb.utils import get_sim_steps, get_sim_time
+
+from nano_isa import get_isa
+from nano_pins import MSK_EINT0
+
+KINDS = ("entry", "reti")
+
+
+def periodic(period, count, phase=0):
+    """`count` edges every `period` clocks, the first one at `phase`."""
+    if period < 1:
+        raise ValueError(f"period of {period} clocks")
+    return [phase + n * period for n in range(count)]
+
+
+def poisson(mean, count, seed=None, minimum=2):
+    """`count` edges with exponential gaps of `mean` clocks (at least `minimum`)."""
+    gaps = np.random.default_rng(seed).exponential(mean, count)
+    return np.cumsum(np.maximum(minimum, np.rint(gaps))).astype(int).tolist()
+
+
+def bursty(size, gap, period, bursts, phase=0):
+    """`bursts` groups of `size` edges `gap` clocks apart, one group every `period` clocks."""
+    if size * gap > period:
+        raise ValueError(f"bursts of {size} edges every {gap} clocks do not fit in {period} clocks")
+    return [phase + b * period + n * gap for b in range(bursts) for n in range(size)]
+
+
+class NanoIrqStimulus:
+    """Scheduled EINT0..2 edges and their interrupt latencies."""
+
+    def __init__(self, dut, clk_period=10, unit="us", width=1, isa=None):
+        if width < 1:
+            raise ValueError(f"EINT pulse of {width} clocks")
+        self.dut = dut
+        self.sys = dut.user_project.my_NanoSys
+        self.cpu = self.sys.my_cpu
+        self.flags = self.sys.my_intctrl.Flg_reg
+        self.isa = isa if isa is not None else get_isa()
+        self.period = get_sim_steps(clk_period, unit)
+        self.width = width
+        states = self.isa.states
+        self._fetch = states["fetch_decode"]
+        self._ini_reti = states["ini_reti"]
+        self._vectors = {address: line for line, address in self.isa.vectors.items()}
+        self._task = None
+        self._idle = Event()                #Set while busy() is False
+        self.clear()
+
+    def clear(self):
+        self.edges = [0, 0, 0]
+        self.served = [0, 0, 0]
+        self.lost = [0, 0, 0]
+        self.latencies = [{kind: [] for kind in KINDS} for _ in range(3)]
+        self._pending = [[], [], []]        #times (steps) of the edges not acknowledged yet
+        self._acked = [None, None, None]    #time of the acknowledged edge of every line
+        self._active = None                 #(line, edge time) of the ISR in progress
+        self._update()
+
+    def start(self):
+        self._task = cocotb.start_soon(self._watch())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def busy(self):
+        return any(self._pending) or any(t is not None for t in self._acked) or self._active is not None
+
+    def _update(self):
+        if self.busy():
+            self._idle.clear()
+        else:
+            self._idle.set()
+
+    #-------------------------------------------------------------------------
+    # Stimulus
+    #-------------------------------------------------------------------------
+    async def drive(self, schedule):
+        """Pulse EINT<line> at the clocks of `schedule` ({line: [clock, ...]})."""
+        events = {}
+        for line, clocks in schedule.items():
+            if line not in (0, 1, 2):
+                raise ValueError(f"EINT{line} does not exist")
+            mask = MSK_EINT0 << line
+            clocks = sorted(clocks)
+            for clock, after in zip(clocks, clocks[1:] + [None]):
+                if clock < 0 or (after is not None and after - clock <= self.width):
+                    raise ValueError(f"EINT{line} edges at clocks {clock}, {after} with pulses of {self.width}")
+                events.setdefault(clock, [0, 0])[0] |= mask
+                events.setdefault(clock + self.width, [0, 0])[1] |= mask
+        dut = self.dut
+        await FallingEdge(dut.clk)
+        now = 0
+        for clock in sorted(events):
+            if clock > now:
+                await ClockCycles(dut.clk, clock - now, rising=False)
+                now = clock
+            rise, fall = events[clock]
+            for line in range(3):
+                if rise & (MSK_EINT0 << line):
+                    self.edges[line] += 1
+                    self._pending[line].append(get_sim_time("step"))
+            self._update()
+            dut.uio_in.value = (dut.uio_in.value.to_unsigned() & ~fall) | rise
+
+    async def drain(self, timeout_cycles=10000):
+        """Wait until every edge is served or lost and the last ISR returned."""
+        if not self.busy():
+            return
+        timeout = ClockCycles(self.dut.clk, timeout_cycles)
+        if await First(self._idle.wait(), timeout) is not timeout:
+            #Set by _watch() in the ReadOnly phase, out of it so the caller can drive the pins
+            await Timer(1, "step")
+            return
+        raise RuntimeError(f"interrupts pending after {timeout_cycles} cycles "
+                           f"(edges {[len(p) for p in self._pending]}, acknowledged {self._acked})")
+
+    #-------------------------------------------------------------------------
+    # Monitor
+    #-------------------------------------------------------------------------
+    async def _watch(self):
+        cpu = self.cpu
+        state = int(cpu.state_reg.value)
+        flags = self.flags.value.to_unsigned()
+        while True:
+            await First(cpu.state_reg.value_change, cpu.IP_reg.value_change, self.flags.value_change)
+            await ReadOnly()
+            now = get_sim_time("step")
+            previous, state = state, int(cpu.state_reg.value)
+            old, flags = flags, self.flags.value.to_unsigned()
+            for line in range(3):
+                bit = 1 << line
+                if flags & bit and not old & bit:
+                    self._ack(line, now)
+                elif old & bit and not flags & bit:
+                    self._release(line, now)
+            if state == self._fetch and previous != self._fetch:
+                line = self._vectors.get(int(cpu.IP_reg.value))
+                if line is not None and self._acked[line] is not None:
+                    self.served[line] += 1
+                    self._active = (line, self._acked[line])
+                    self._acked[line] = None
+                    self._add(line, "entry", self._active[1], now)
+            elif state == self._ini_reti and previous != self._ini_reti and self._active is not None:
+                #The reti was decoded in the clock that just ended
+                self._add(self._active[0], "reti", self._active[1], now - self.period)
+                self._active = None
+            self._update()
+
+    def _ack(self, line, now):
+        #Flag set by the CPU (set_int<n>_F): the oldest pending edge is
+        #acknowledged and the other pending ones were merged with it
+        pending = [t for t in self._pending[line] if t < now]
+        if not pending:
+            return    #Software interrupt
+        self.lost[line] += len(pending) - 1
+        self._pending[line] = [t for t in self._pending[line] if t >= now]
+        self._acked[line] = pending[0]
+
+    def _release(self, line, now):
+        #Flag cleared by the ISR: an acknowledged edge not served yet is lost,
+        #and so are the edges whose pulse ended meanwhile (the ack of the edge
+        #detector kept it clear)
+        if self._acked[line] is not None:
+            self.lost[line] += 1
+            self._acked[line] = None
+        end = self.width * self.period
+        lost = [t for t in self._pending[line] if t + end <= now]
+        self.lost[line] += len(lost)
+        self._pending[line] = [t for t in self._pending[line] if t + end > now]
+
+    def _add(self, line, kind, edge, now):
+        self.latencies[line][kind].append((now - edge) // self.period + 1)
+
+    #-------------------------------------------------------------------------
+    # Results
+    #-------------------------------------------------------------------------
+    def histogram(self, line, kind="entry"):
+        """{clocks: count} of the latencies of a line."""
+        values, counts = np.unique(self.latencies[line][kind], return_counts=True)
+        return dict(zip(values.tolist(), counts.tolist()))
+
+    def percentiles(self, line, kind="entry", q=(50, 90, 99, 100)):
+        """{percentile: clocks} of the latencies of a line (empty without served edges)."""
+        values = self.latencies[line][kind]
+        if not values:
+            return {}
+        return dict(zip(q, np.percentile(values, q, method="higher").astype(int).tolist()))
+
+    def report(self):
+        lines = [f"{'line':<6}{'edges':>7}{'served':>8}{'lost':>6}  latency (clocks) p50/p90/p99/max"]
+        for line in range(3):
+            if not self.edges[line]:
+                continue
+            text = [f"{kind} " + "/".join(str(v) for v in self.percentiles(line, kind).values())
+                    for kind in KINDS if self.latencies[line][kind]]
+            lines.append(f"EINT{line:<2}{self.edges[line]:>7}{self.served[line]:>8}{self.lost[line]:>6}  "
+                         + "  ".join(text))
+        return "\n".join(lines)
+
+    async def max_period(self, line, low, high, count=16, timeout_cycles=10000):
+        """Shortest period (clocks) in [low, high] of `count` periodic edges on
+        `line` with none lost, by bisection; None if even `high` loses edges.
+
+        The program must keep serving the line (the results are cleared).
+        """
+        best = None
+        while low <= high:
+            period = (low + high) // 2
+            self.clear()
+            await self.drive({line: periodic(period, count)})
+            await self.drain(timeout_cycles)
+            if self.lost[line]:
+                low = period + 1
+            else:
+                best, high = period, period - 1
+        return best
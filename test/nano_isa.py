@@ -0,0 +1,196 @@
+#nano_isa.py
+#=============================================================================
+# Tablas del conjunto de instrucciones de Nano_cpu, extraidas del codigo Verilog
+#=============================================================================
+#
+# The opcode and FSM state tables are read from the `localparam` blocks of
+# src/Nano_cpu4Mc_119.v, and the operand format of every instruction from the
+# first state that `fetch_decode` jumps to, so the Python tools follow the
+# RTL whenever an opcode is added or renumbered. spi_states() and
+# spi_transitions() read the FSM of slave_spi4nano from src/Nano_spi.v.
+#
+# This module does not import cocotb and can be used outside the simulator.
+#=============================================================================
+
+import hashlib
+import os
+import re
+
+SRC_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+CPU_SOURCE = os.path.join(SRC_DIR, "Nano_cpu4Mc_119.v")
+SPI_SOURCE = os.path.join(SRC_DIR, "Nano_spi.v")
+
+#Physical code space (see cs_top_rom in Nano_mcsys_4Tiny_fit.v):
+ROM_BOTTOM_SIZE = 0x80
+ROM_TOP_BASE = 0xF80
+ROM_TOP_SIZE = 0x80
+CODE_SPACE = 0x1000
+#Physical data space and stack (my_ram and my_stack):
+RAM_SIZE = 32
+STACK_SIZE = 16
+DATA_SPACE = 0x800
+
+#Operand formats:
+#   caddr: 12 bits code address, high byte first (H[3:0], L)
+#   daddr: 11 bits data address, high byte first (H[2:0], L)
+#   imm16: 16 bits constant, high byte first
+#   imm8:  8 bits constant
+#   port:  8 bits I/O address
+_OPERANDS_BY_STATE = {
+    "load_ha_jmp": ("caddr",),
+    "load_ha_call": ("caddr",),
+    "load_khx": ("imm16",),
+    "load_usp": ("imm8",),
+    "load_hi_movxm": ("daddr",),
+    "load_hi_movmx": ("daddr",),
+    "load_hi_movi": ("daddr",),
+    "load_ioadd": ("port",),
+    "load_iok": ("imm8", "port"),
+}
+
+OPERAND_SIZE = {"caddr": 2, "daddr": 2, "imm16": 2, "imm8": 1, "port": 1}
+
+#Build-time parameters of Nano_cpu and Nano_mcsys_4Tiny (`define NANO_<name>), chosen for the
+#simulation with make MUL_MODE=... SHIFT_MODE=... PREFETCH=... OUT_LATCH=... and exported to the tests, and the tag of
+#their sim_build directory (see the Makefile):
+OPTIONS = {"MUL_MODE": "mul", "SHIFT_MODE": "shift", "PREFETCH": "pf", "OUT_LATCH": "latch"}
+
+#Bits of SR2 consumed by every xmul_exe pass, for each MUL_MODE
+MUL_STEPS = {0: 1, 1: 2, 2: 16}
+
+#Positions shifted by every sxacc_exe pass (at most CNT), for each SHIFT_MODE
+SHIFT_STEPS = {0: 1, 1: 63}
+
+#States that read the first byte of a two bytes operand and the state of the
+#second byte, done in the same clock by the first one with PREFETCH 1
+PREFETCH_PAIRS = {
+    "load_ha_jmp": "load_la_jmp", "load_ha_call": "load_la_call", "load_khx": "load_klx",
+    "load_hi_movxm": "load_li_movxm", "load_hi_movmx": "load_li_movmx", "load_hi_movi": "load_li_movi",
+    "load_iok": "ld_ioadd4k",
+}
+
+_PARAM_RE = re.compile(r"(\w+)\s*=\s*\d+'h([0-9A-Fa-f]+)")
+_DECODE_RE = re.compile(r"(\w+)_code\s*:(.*?)state_next\s*=\s*(\w+)\s*;", re.S)
+
+
+def parse_localparams(path):
+    """Return the `localparam` blocks of a Verilog file as a list of dicts."""
+    with open(path) as f:
+        text = f.read()
+    #Comments are removed first because some of them contain ';'
+    text = re.sub(r"//[^\n]*", "", text)
+    blocks = []
+    for match in re.finditer(r"localparam\b(.*?);", text, re.S):
+        blocks.append({name: int(value, 16) for name, value in _PARAM_RE.findall(match.group(1))})
+    return blocks
+
+
+def _block_with(blocks, name):
+    for block in blocks:
+        if name in block:
+            return block
+    raise ValueError(f"localparam {name} not found")
+
+
+class NanoISA:
+    """Opcode, state and operand tables of one Nano_cpu source file."""
+
+    def __init__(self, path=CPU_SOURCE):
+        with open(path) as f:
+            text = f.read()
+        blocks = parse_localparams(path)
+        self.digest = hashlib.sha256(text.encode()).hexdigest()
+        self.states = _block_with(blocks, "fetch_decode")
+        self.state_names = {code: name for name, code in self.states.items()}
+        vectors = _block_with(blocks, "INT0_VEC_ADD")
+        self.vectors = {n: vectors[f"INT{n}_VEC_ADD"] for n in range(3)}
+        codes = _block_with(blocks, "nop_code")
+        self.opcodes = {name[:-len("_code")]: code for name, code in codes.items()}
+        self.names = {code: name for name, code in self.opcodes.items()}
+
+        #First execution state of every opcode, from the `case (code)` of fetch_decode:
+        start = text.index("case (code)")
+        decode = text[start:text.index("endcase", start)]
+        self.first_state = {name: state for name, _, state in _DECODE_RE.findall(decode)}
+
+        self.operands = {}
+        for name in self.opcodes:
+            state = self.first_state.get(name, "stop")
+            if state in _OPERANDS_BY_STATE:
+                self.operands[name] = _OPERANDS_BY_STATE[state]
+            elif re.fullmatch(r"j\w+_exe", state):
+                #Conditional jumps: caddr read by load_ha_jmp or skipped with IP+2
+                self.operands[name] = ("caddr",)
+            else:
+                self.operands[name] = ()
+
+    def size(self, name):
+        """Instruction size in bytes."""
+        return 1 + sum(OPERAND_SIZE[kind] for kind in self.operands[name])
+
+
+def spi_states(path=SPI_SOURCE):
+    """{name: code} of the FSM states of slave_spi4nano."""
+    return _block_with(parse_localparams(path), "idle1")
+
+
+def spi_transitions(path=SPI_SOURCE):
+    """(state, next) pairs of the `case (state_reg)` of slave_spi4nano, self-loops excluded."""
+    states = spi_states(path)
+    with open(path) as f:
+        text = re.sub(r"//[^\n]*", "", f.read())
+    match = re.search(r"^([ \t]*)case\s*\(state_reg\)(.*?)^\1endcase", text, re.S | re.M)
+    if match is None:
+        raise ValueError(f"case (state_reg) not found in {path}")
+    transitions = set()
+    current = None
+    for line in match.group(2).splitlines():
+        label = re.match(r"\s*(\w+)\s*:\s*$", line)
+        if label and label.group(1) in states:
+            current = label.group(1)
+        for target in re.findall(r"state_next\s*=\s*(\w+)\s*;", line):
+            if current is not None and target != current and target in states:
+                transitions.add((current, target))
+    return transitions
+
+
+_isa = None
+
+
+def get_isa():
+    """NanoISA of src/Nano_cpu4Mc_119.v, parsed once."""
+    global _isa
+    if _isa is None:
+        _isa = NanoISA()
+    return _isa
+
+
+def rtl_option(name):
+    """Value of a build-time parameter of the simulated RTL (0 if not selected)."""
+    if name not in OPTIONS:
+        raise ValueError(f"unknown RTL option {name}")
+    return int(os.environ.get(name) or 0)
+
+
+def rtl_build(options=None):
+    """Name of the RTL build of the options ("rtl", "rtl_mul2", "rtl_mul1_shift1", ...), as in the Makefile.
+
+    `options` maps option names to values (e.g. make variables); missing ones
+    are taken from the environment.
+    """
+    options = options or {}
+    name = "rtl"
+    for option, tag in OPTIONS.items():
+        value = int(options.get(option) or rtl_option(option))
+        if value:
+            name += f"_{tag}{value}"
+    return name
+
+
+def rom_addresses():
+    """All the code addresses backed by a physical ROM location."""
+    return list(range(ROM_BOTTOM_SIZE)) + list(range(ROM_TOP_BASE, ROM_TOP_BASE + ROM_TOP_SIZE))
+
+
+def is_rom_address(address):
+    return 0 <= address < ROM_BOTTOM_SIZE or ROM_TOP_BASE <= address < ROM_TOP_BASE + ROM_TOP_SIZE
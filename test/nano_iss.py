@@ -0,0 +1,831 @@
+#nano_iss.py
+#=============================================================================
+# Simulador del conjunto de instrucciones (ISS) de Nano_cpu con precision de
+# ciclo, como modelo de referencia de Nano_mcsys_4Tiny
+#=============================================================================
+#
+# NanoISS executes one FSM state of src/Nano_cpu4Mc_119.v per clock, with the
+# same `state_next` sequencing and the same register updates, so the number of
+# clocks of every instruction (e.g. 18 for umul: fetch_decode plus the 17
+# passes through xmul_exe) is the one of the RTL. Around the CPU it models the
+# memory map of Nano_mcsys_4Tiny in execution mode (MODE=1):
+#
+#     code:  my_bottom_rom (0x000-0x07F) and my_top_rom (0xF80-0xFFF), 128x8
+#            each, addressed by code_add[6:0] (the other addresses are aliases)
+#     data:  my_ram 32x16, addressed by data_add[4:0]
+#     stack: my_stack 16x16, addressed by stk_add[3:0]
+#     I/O:   int_ctrl (port 0: interrupt enables, port 1: interrupt flags)
+#            and the edge detectors of EINT0..2
+#
+# Memories are read asynchronously and written at the falling edge of the
+# clock, so within one clock the writes of the current state are done before
+# the next state is computed. I/O ports other than 0 and 1 are undriven in the
+# RTL ('z'); here they read `io_in[port]` (default 0) and their writes are
+# logged in `io_log`.
+#
+# `mul_mode` follows the MUL_MODE parameter of Nano_cpu (by default the one
+# of the simulation build, see rtl_option() in nano_isa.py): xmul_exe takes
+# 17, 9 or 2 clocks, always with the same registers and flags. In the same
+# way `shift_mode` follows SHIFT_MODE: sxacc_exe takes A[5:0] + 1 clocks with
+# the iterative shifter and 2 (1 for a zero count) with the barrel one. And
+# `prefetch` follows PREFETCH: the operand states of PREFETCH_PAIRS take both
+# bytes in one clock.
+#
+# The register names are the ones of the RTL without the `_reg` suffix, and
+# `state_reg` gives the state code, so the model can be compared against the
+# cocotb handles of my_cpu.
+#
+# This module does not import cocotb and can be used outside the simulator:
+#
+#     python nano_iss.py program.asm
+#=============================================================================
+
+import sys
+
+from nano_isa import (MUL_STEPS, PREFETCH_PAIRS, ROM_BOTTOM_SIZE, ROM_TOP_BASE, ROM_TOP_SIZE, RAM_SIZE, SHIFT_STEPS,
+                      STACK_SIZE, get_isa, is_rom_address, rtl_option)
+
+_MASK33 = (1 << 33) - 1
+_MASK32 = 0xFFFFFFFF
+
+#Architectural registers of Nano_cpu and their widths:
+REGISTERS = (
+    ("IP", 12), ("DP", 11), ("DPB", 11), ("UDP", 11),
+    ("SP", 8), ("USP", 8), ("PP", 8), ("instruction", 8),
+    ("H", 8), ("L", 8), ("A", 16), ("B", 16), ("X", 16), ("Y", 16),
+    ("R", 32), ("ACC", 32), ("WR33", 33), ("SR1", 33), ("SR2", 33),
+    ("F", 8), ("CNT", 6), ("I", 16), ("J", 16), ("N", 16), ("M", 16),
+    ("ISF", 1), ("FDI", 1),
+)
+
+#Conditional jumps: flag bit and level that takes the jump
+_JUMPS = {
+    "jz16": (0, 1), "jn16": (1, 1), "jo16": (2, 1), "jco16": (3, 1),
+    "jz32": (4, 1), "jn32": (5, 1), "jo32": (6, 1), "jco32": (7, 1),
+    "jnz16": (0, 0), "jp16": (1, 0), "jno16": (2, 0), "jnco16": (3, 0),
+    "jnz32": (4, 0), "jp32": (5, 0), "jno32": (6, 0), "jnco32": (7, 0),
+}
+
+
+def _sext33(word):
+    #{17 copies of bit 15, word}
+    return word | 0x1FFFF0000 if word & 0x8000 else word
+
+
+class NanoISS:
+    """Cycle accurate model of Nano_cpu with the memories of Nano_mcsys_4Tiny."""
+
+    def __init__(self, isa=None, mul_mode=None, shift_mode=None, prefetch=None):
+        self.isa = isa if isa is not None else get_isa()
+        self.mul_mode = mul_mode if mul_mode is not None else rtl_option("MUL_MODE")
+        if self.mul_mode not in MUL_STEPS:
+            raise ValueError(f"MUL_MODE {self.mul_mode} not in {sorted(MUL_STEPS)}")
+        self.shift_mode = shift_mode if shift_mode is not None else rtl_option("SHIFT_MODE")
+        if self.shift_mode not in SHIFT_STEPS:
+            raise ValueError(f"SHIFT_MODE {self.shift_mode} not in {sorted(SHIFT_STEPS)}")
+        self.prefetch = prefetch if prefetch is not None else rtl_option("PREFETCH")
+        if self.prefetch not in (0, 1):
+            raise ValueError(f"PREFETCH {self.prefetch} not in [0, 1]")
+        self.bottom_rom = bytearray(ROM_BOTTOM_SIZE)
+        self.top_rom = bytearray(ROM_TOP_SIZE)
+        self.ram = [0] * RAM_SIZE
+        self.stack = [0] * STACK_SIZE
+        self.io_in = {}
+        self.io_log = []
+        self.eint = 0
+        self._decode = self._decode_table()
+        self._handlers = self._handler_table()
+        self._writes = self._write_table()
+        self.reset()
+
+    #-------------------------------------------------------------------------
+    # Loading and state
+    #-------------------------------------------------------------------------
+    def reset(self):
+        """Asynchronous reset of the CPU, int_ctrl and edge detectors (memories are kept)."""
+        for name, _ in REGISTERS:
+            setattr(self, name, 0)
+        self.state = "stop"
+        self.En = 0
+        self.Flg = 0
+        self.edges = 0
+        self._run = False
+        self.cycles = 0
+        self.instructions = 0
+        self.profile = {}
+        self._current = None
+        self._start = 0
+
+    @property
+    def state_reg(self):
+        return self.isa.states[self.state]
+
+    def write_rom(self, address, byte):
+        if not is_rom_address(address):
+            raise ValueError(f"ROM address {address:#05x} has no physical location (0x000-0x07F, 0xF80-0xFFF)")
+        rom = self.top_rom if address >= ROM_TOP_BASE else self.bottom_rom
+        rom[address & 0x7F] = byte & 0xFF
+
+    def read_rom(self, address):
+        return self.top_rom[address & 0x7F] if (address >> 7) == 0x1F else self.bottom_rom[address & 0x7F]
+
+    def load(self, rom=None, ram=None):
+        """Load {address: value} images, e.g. the rom and ram of a NanoImage."""
+        for address, byte in (rom or {}).items():
+            self.write_rom(address, byte)
+        for address, word in (ram or {}).items():
+            if not 0 <= address < RAM_SIZE:
+                raise ValueError(f"RAM address {address:#x} out of range (32 words)")
+            self.ram[address] = word & 0xFFFF
+
+    def set_eint(self, n, level):
+        """Level of the EINTn input pin."""
+        self.eint = (self.eint | (1 << n)) if level else (self.eint & ~(1 << n))
+
+    def registers(self):
+        return {name: getattr(self, name) for name, _ in REGISTERS}
+
+    def set_state(self, state, registers=None, En=None, Flg=None, edges=None):
+        """Place the model in FSM `state` with the given register values.
+
+        Used to take over a CPU that was running elsewhere (e.g. the RTL); an
+        instruction or interrupt entry in progress is profiled from here.
+        """
+        for name, value in (registers or {}).items():
+            setattr(self, name, value)
+        for name, value in (("En", En), ("Flg", Flg), ("edges", edges)):
+            if value is not None:
+                setattr(self, name, value)
+        self.state = state
+        self._run = False
+        self._start = self.cycles
+        self._current = "irq" if state == "ini_iss" else None
+
+    #-------------------------------------------------------------------------
+    # Execution
+    #-------------------------------------------------------------------------
+    def start(self):
+        """One clock pulse on the run input (RUN pin through pulse_generator)."""
+        self._run = True
+
+    def clock(self, n=1):
+        """Advance n clocks."""
+        handlers = self._handlers
+        writes = self._writes
+        for _ in range(n):
+            state = self.state
+            #Falling edge: memory and I/O writes of the current state
+            write = writes.get(state)
+            if write is not None:
+                write()
+            #Rising edge: next state, then the edge detectors of EINT0..2
+            nxt = handlers[state]()
+            self.edges = (~self.edges & self.eint | self.edges & ~self.Flg) & 0x7
+            self._run = False
+            self.state = nxt
+            self.cycles += 1
+            if self._current is not None and (nxt == "fetch_decode" or nxt == "stop"):
+                name = self._current
+                entry = self.profile.get(name)
+                if entry is None:
+                    entry = self.profile[name] = [0, 0]
+                entry[0] += 1
+                entry[1] += self.cycles - self._start
+                self.instructions += 1
+                self._current = None
+
+    def step(self):
+        """Execute up to the end of the current instruction, return the clocks spent."""
+        first = self.cycles
+        self.clock()
+        while self.state != "fetch_decode" and self.state != "stop":
+            self.clock()
+        return self.cycles - first
+
+    def run(self, max_cycles=1000000):
+        """Start the program (if stopped) and run until the stop state.
+
+        Returns the clocks spent from the start state to the stop state.
+        RuntimeError is raised if the program does not stop within `max_cycles`.
+        """
+        if self.state == "stop":
+            self.start()
+            self.clock()
+        first = self.cycles
+        while self.state != "stop":
+            if self.cycles - first >= max_cycles:
+                raise RuntimeError(f"program did not stop in {max_cycles} cycles (IP={self.IP:#05x})")
+            self.clock()
+        return self.cycles - first
+
+    def cycle_report(self):
+        """Table of executed instructions: count, total and average clocks."""
+        lines = [f"{'instruction':<12}{'count':>8}{'clocks':>10}{'clk/ins':>9}"]
+        for name, (count, clocks) in sorted(self.profile.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:<12}{count:>8}{clocks:>10}{clocks / count:>9.2f}")
+        lines.append(f"{'total':<12}{self.instructions:>8}{self.cycles:>10}")
+        return "\n".join(lines)
+
+    #-------------------------------------------------------------------------
+    # Buses of Nano_mcsys_4Tiny
+    #-------------------------------------------------------------------------
+    def _code(self):
+        ip = self.IP
+        return self.top_rom[ip & 0x7F] if (ip >> 7) == 0x1F else self.bottom_rom[ip & 0x7F]
+
+    def _din(self):
+        return self.ram[self.DP & 0x1F]
+
+    def _sin(self):
+        return self.stack[self.SP & 0xF]
+
+    def _ints(self):
+        #int_ctrl: intN = (eintN & En[N]) | Flg[N]
+        return ((self.edges & self.En) | self.Flg) & 0x7
+
+    def _io_i(self):
+        if self.PP == 0:
+            return self.En
+        if self.PP == 1:
+            return self._ints()
+        return self.io_in.get(self.PP, 0) & 0xFF
+
+    def _io_write(self, value):
+        if self.PP == 0:
+            self.En = value
+        elif self.PP == 1:
+            self.Flg = value
+        self.io_log.append((self.cycles, self.PP, value))
+
+    def _write_table(self):
+        def ram(source):
+            def write():
+                self.ram[self.DP & 0x1F] = source() & 0xFFFF
+            return write
+
+        def stack(source, user=False):
+            def write():
+                self.stack[(self.USP if user else self.SP) & 0xF] = source() & 0xFFFF
+            return write
+
+        def io(source):
+            def write():
+                self._io_write(source() & 0xFF)
+            return write
+
+        A = lambda: self.A
+        B = lambda: self.B
+        RL = lambda: self.R & 0xFFFF
+        RH = lambda: self.R >> 16
+        #movrlm_exe is not in the ramwe list of the RTL, so it does not write
+        return {
+            "movam_exe": ram(A), "movaipp_exe": ram(A),
+            "movbm_exe": ram(B), "movbipp_exe": ram(B),
+            "movrlipp_exe": ram(RL),
+            "movrhm_exe": ram(RH), "movrhipp_exe": ram(RH),
+            "ix_sto": ram(lambda: self.UDP),
+            "movxrm": ram(lambda: self.X),
+            "push_ip": stack(lambda: self.IP),
+            "pusha_exe": stack(A), "pushb_exe": stack(B),
+            "pushi_exe": stack(lambda: self.I), "pushj_exe": stack(lambda: self.J),
+            "pushn_exe": stack(lambda: self.N), "pushm_exe": stack(lambda: self.M),
+            "movas_exe": stack(A, True), "movbs_exe": stack(B, True),
+            "movrls_exe": stack(RL, True), "movrhs_exe": stack(RH, True),
+            "push_ip_int": stack(lambda: (self.IP - 1) & 0xFFF),
+            "push_rl": stack(RL), "push_rh": stack(RH),
+            "push_f": stack(lambda: self.F),
+            "outa_exe": io(A),
+            "outk_exe": io(lambda: self.H),
+            "set_int0_F": io(lambda: self.L | 0x01),
+            "set_int1_F": io(lambda: self.L | 0x02),
+            "set_int2_F": io(lambda: self.L | 0x04),
+        }
+
+    #-------------------------------------------------------------------------
+    # fetch_decode
+    #-------------------------------------------------------------------------
+    def _decode_table(self):
+        """Opcode -> (first execution state, action done in fetch_decode)."""
+        s = self
+
+        def setA(f):
+            def act():
+                s.A = f() & 0xFFFF
+            return act
+
+        def setB(f):
+            def act():
+                s.B = f() & 0xFFFF
+            return act
+
+        def setUSP(f):
+            def act():
+                s.USP = f() & 0xFF
+            return act
+
+        def wr33(f):
+            def act():
+                s.WR33 = f() & _MASK33
+            return act
+
+        def mul(signed):
+            def act():
+                s.WR33 = 0
+                s.CNT = 0
+                s.SR1 = _sext33(s.A) if signed else s.A
+                s.SR2 = _sext33(s.B) if signed else s.B
+            return act
+
+        def shift():
+            s.WR33 = s.ACC
+            s.CNT = s.A & 0x3F
+
+        def inc(name, delta):
+            def act():
+                setattr(s, name, (getattr(s, name) + delta) & 0xFFFF)
+            return act
+
+        actions = {
+            "movab": setB(lambda: s.A),
+            "movba": setA(lambda: s.B),
+            "movira": setA(lambda: s.I),
+            "movjra": setA(lambda: s.J),
+            "incir": inc("I", 1), "incjr": inc("J", 1),
+            "decir": inc("I", -1), "decjr": inc("J", -1),
+            "movrla": setA(lambda: s.R & 0xFFFF),
+            "movrha": setA(lambda: s.R >> 16),
+            "movrlb": setB(lambda: s.R & 0xFFFF),
+            "movrhb": setB(lambda: s.R >> 16),
+            "movaccla": setA(lambda: s.ACC & 0xFFFF),
+            "movacclb": setB(lambda: s.ACC & 0xFFFF),
+            "movaccha": setA(lambda: s.ACC >> 16),
+            "movacchb": setB(lambda: s.ACC >> 16),
+            "stospa": setA(lambda: s.SP),
+            "stospb": setB(lambda: s.SP),
+            "stouspa": setA(lambda: s.USP),
+            "stouspb": setB(lambda: s.USP),
+            "ldusp": setUSP(lambda: s.SP),
+            "lduspa": setUSP(lambda: s.A),
+            "lduspb": setUSP(lambda: s.B),
+            "lduspr": setUSP(lambda: s.R),
+            "incusp": setUSP(lambda: s.USP + 1),
+            "decusp": setUSP(lambda: s.USP - 1),
+            "uadd": wr33(lambda: s.A + s.B),
+            "sadd": wr33(lambda: _sext33(s.A) + _sext33(s.B)),
+            "ac": wr33(lambda: s.R + s.ACC),
+            "umul": mul(False), "umac": mul(False),
+            "smul": mul(True), "smac": mul(True),
+            "sracc": shift, "sraacc": shift, "slacc": shift,
+            "nota": wr33(lambda: ~s.A & 0xFFFF),
+            "notb": wr33(lambda: ~s.B & 0xFFFF),
+            "and": wr33(lambda: s.A & s.B),
+            "or": wr33(lambda: s.A | s.B),
+            "xor": wr33(lambda: s.A ^ s.B),
+            "cmpin": wr33(lambda: s.I - s.N),
+            "cmpjm": wr33(lambda: s.J - s.M),
+        }
+
+        def movracc():
+            s.ACC = s.R
+
+        def acc_low(f):
+            def act():
+                s.ACC = (s.ACC & 0xFFFF0000) | f()
+            return act
+
+        def acc_high(f):
+            def act():
+                s.ACC = (f() << 16) | (s.ACC & 0xFFFF)
+            return act
+
+        actions["movracc"] = movracc
+        actions["movaaccl"] = acc_low(lambda: s.A)
+        actions["movbaccl"] = acc_low(lambda: s.B)
+        actions["movaacch"] = acc_high(lambda: s.A)
+        actions["movbacch"] = acc_high(lambda: s.B)
+
+        table = {}
+        for code, name in self.isa.names.items():
+            table[code] = (name, self.isa.first_state.get(name, "stop"), actions.get(name))
+        return table
+
+    #-------------------------------------------------------------------------
+    # FSM states
+    #-------------------------------------------------------------------------
+    def _handler_table(self):
+        s = self
+        ir = self.isa.opcodes
+        vectors = self.isa.vectors
+
+        def stop():
+            if s._run:
+                return "start"
+            if s._ints():
+                s._current = "irq"
+                s._start = s.cycles
+                return "ini_iss"
+            return "stop"
+
+        def start():
+            s.IP = 0
+            s.SP = 0
+            return "fetch_decode"
+
+        def fetch_decode():
+            code = s._code()
+            s.instruction = code
+            s.IP = (s.IP + 1) & 0xFFF
+            s._start = s.cycles
+            if not s.ISF and s._ints():
+                s.FDI = 1
+                s._current = "irq"
+                return "ini_iss"
+            name, nxt, action = s._decode.get(code, ("illegal", "stop", None))
+            s._current = name
+            if action is not None:
+                action()
+            return nxt
+
+        def ip_inc(n=1):
+            s.IP = (s.IP + n) & 0xFFF
+
+        def jump(bit, level):
+            def handler():
+                if (s.F >> bit) & 1 == level:
+                    return "load_ha_jmp"
+                ip_inc(2)
+                return "fetch_decode"
+            return handler
+
+        def load_h(nxt):
+            def handler():
+                s.H = s._code()
+                ip_inc()
+                return nxt
+            return handler
+
+        def load_l(nxt):
+            def handler():
+                s.L = s._code()
+                ip_inc()
+                return nxt(s.instruction) if callable(nxt) else nxt
+            return handler
+
+        def load_la_jmp():
+            s.L = s._code()
+            return "load_ip"
+
+        def fused(first, second):
+            def handler():
+                first()
+                return second()
+            return handler
+
+        def load_ip():
+            s.IP = ((s.H & 0xF) << 8) | s.L
+            return "fetch_decode"
+
+        def sp_step(delta, nxt):
+            def handler():
+                s.SP = (s.SP + delta) & 0xFF
+                return nxt
+            return handler
+
+        def pop_ip():
+            s.IP = s._sin() & 0xFFF
+            return "fetch_decode"
+
+        def by_instruction(mapping, default):
+            codes = {ir[name]: state for name, state in mapping.items()}
+
+            def select(code):
+                return codes.get(code, default)
+            return select
+
+        def point_spx():
+            return by_instruction_pop(s.instruction)
+
+        by_instruction_pop = by_instruction(
+            {"popa": "popa_exe", "popb": "popb_exe", "popi": "popi_exe", "popj": "popj_exe", "popn": "popn_exe"},
+            "popm_exe")
+
+        def set_reg(name, source, nxt="fetch_decode"):
+            def handler():
+                setattr(s, name, source())
+                return nxt
+            return handler
+
+        def hl():
+            return (s.H << 8) | s.L
+
+        def daddr():
+            return ((s.H & 0x7) << 8) | s.L
+
+        def load_dp(mapping, default):
+            select = by_instruction(mapping, default)
+
+            def handler():
+                s.DP = daddr()
+                return select(s.instruction)
+            return handler
+
+        def load_dp_movi():
+            s.DP = s.DPB = daddr()
+            return "load_ix"
+
+        select_ix = by_instruction({
+            "movai": "movam_exe", "movbi": "movbm_exe", "movrli": "movrlm_exe", "movrhi": "movrhm_exe",
+            "movia": "movia_exe", "movib": "movib_exe",
+            "movaipp": "movaipp_exe", "movbipp": "movbipp_exe", "movrlipp": "movrlipp_exe", "movrhipp": "movrhipp_exe",
+            "movippa": "movippa_exe", "movippb": "movippb_exe", "movmmia": "ix_dec_a",
+        }, "ix_dec_b")
+
+        def load_ix():
+            s.DP = s.UDP = s._din() & 0x7FF
+            return select_ix(s.instruction)
+
+        def ix_inc():
+            s.UDP = (s.UDP + 1) & 0x7FF
+            s.DP = s.DPB
+            return "ix_sto"
+
+        def ix_dec(nxt):
+            def handler():
+                s.UDP = (s.UDP - 1) & 0x7FF
+                s.DP = (s.DP - 1) & 0x7FF
+                return nxt
+            return handler
+
+        def ix_dest():
+            s.DP = s.DPB
+            return "ix_sto"
+
+        def movxrm():
+            s.DP = (s.DP + 1) & 0x7FF
+            return "load_y"
+
+        def cmp_xy():
+            s.WR33 = (s.X - s.Y) & _MASK33
+            return "cmp_result"
+
+        def result_flags(w, f3, f7):
+            #Flags of add_result, cmp_result, xmul_exe and sxacc_exe
+            return (
+                (1 if w & 0xFFFF == 0 else 0)
+                | ((w >> 15) & 1) << 1
+                | ((w >> 16) & 1) << 2
+                | f3 << 3
+                | (1 if w & _MASK32 == 0 else 0) << 4
+                | ((w >> 31) & 1) << 5
+                | ((w >> 32) & 1) << 6
+                | f7 << 7
+            )
+
+        acc_codes = (ir["ac"], ir["umac"], ir["smac"])
+
+        def add_result():
+            w = s.WR33
+            a15, b15 = s.A >> 15, s.B >> 15
+            w15, w31 = (w >> 15) & 1, (w >> 31) & 1
+            f3 = 1 if (a15 and b15 and not w15) or (not a15 and not b15 and w15) else 0
+            f7 = 1 if (a15 and b15 and not w31) or (not a15 and not b15 and w31) else 0
+            s.F = result_flags(w, f3, f7)
+            if s.instruction in acc_codes:
+                s.ACC = w & _MASK32
+            else:
+                s.R = w & _MASK32
+            return "fetch_decode"
+
+        def cmp_result():
+            s.F = result_flags(s.WR33, 0, 0)
+            s.R = s.WR33 & _MASK32
+            return "fetch_decode"
+
+        unsigned_mul = (ir["umul"], ir["umac"])
+        mac_codes = (ir["umac"], ir["smac"])
+
+        steps = MUL_STEPS[self.mul_mode]
+
+        def xmul_exe():
+            if s.CNT < 16:
+                #MUL_MODE 1 and 2 do 2 and 16 of these steps in one pass
+                for _ in range(steps):
+                    if s.SR2 & 1:
+                        if s.instruction in unsigned_mul or s.CNT != 15:
+                            s.WR33 = (s.WR33 + s.SR1) & _MASK33
+                        else:
+                            s.WR33 = (s.WR33 + (~s.SR1 & _MASK33) + 1) & _MASK33
+                    s.CNT = (s.CNT + 1) & 0x3F
+                    s.SR1 = (s.SR1 & _MASK32) << 1
+                    s.SR2 = s.SR2 >> 1
+                return "xmul_exe"
+            w = s.WR33
+            a15, b15 = s.A >> 15, s.B >> 15
+            w15, w31 = (w >> 15) & 1, (w >> 31) & 1
+            f3 = 1 if (a15 and b15 and w15) or (not a15 and not b15 and w15) else 0
+            f7 = 1 if (a15 and b15 and w31) or (not a15 and not b15 and w31) else 0
+            s.F = result_flags(w, f3, f7)
+            if s.instruction in mac_codes:
+                s.WR33 = (w + s.ACC) & _MASK33
+                return "add_result"
+            s.R = w & _MASK32
+            return "fetch_decode"
+
+        sracc, sraacc = ir["sracc"], ir["sraacc"]
+
+        shift_steps = SHIFT_STEPS[self.shift_mode]
+
+        def sxacc_exe():
+            if s.CNT == 0:
+                s.F = result_flags(s.WR33, 0, 0)
+                s.R = s.WR33 & _MASK32
+                return "fetch_decode"
+            #SHIFT_MODE 1 does all the CNT steps in one pass
+            for _ in range(min(shift_steps, s.CNT)):
+                w = s.WR33
+                if s.instruction == sracc:
+                    s.WR33 = w >> 1
+                elif s.instruction == sraacc:
+                    s.WR33 = (0x180000000 | ((w >> 1) & 0x7FFFFFFF)) if w & 0x80000000 else w >> 1
+                else:
+                    s.WR33 = (w & _MASK32) << 1
+                s.CNT = (s.CNT - 1) & 0x3F
+            return "sxacc_exe"
+
+        def log_result():
+            z = 1 if s.WR33 & 0xFFFF == 0 else 0
+            s.F = z | z << 4
+            s.R = s.WR33 & _MASK32
+            return "fetch_decode"
+
+        outa = ir["outa"]
+
+        def load_ioadd():
+            s.PP = s._code()
+            ip_inc()
+            return "outa_exe" if s.instruction == outa else "ina_exe"
+
+        def load_usp():
+            s.USP = s._code()
+            ip_inc()
+            return "fetch_decode"
+
+        def ld_ioadd4k():
+            s.PP = s._code()
+            ip_inc()
+            return "outk_exe"
+
+        def ini_iss():
+            s.PP = 0x01
+            s.ISF = 1
+            return "in_intx_F"
+
+        def in_intx_F():
+            s.L = s._io_i()
+            ints = s._ints()
+            if ints & 1:
+                return "set_int0_F"
+            if ints & 2:
+                return "set_int1_F"
+            return "set_int2_F"
+
+        def ld_iss_vec():
+            ints = s._ints()
+            vector = vectors[0] if ints & 1 else (vectors[1] if ints & 2 else vectors[2])
+            s.H = vector >> 8
+            s.L = vector & 0xFF
+            return "push_ip_int" if s.FDI else "load_ip"
+
+        def ini_reti():
+            s.ISF = 0
+            if s.FDI:
+                s.FDI = 0
+                s.SP = (s.SP - 1) & 0xFF
+                return "pop_f"
+            return "stop"
+
+        def pop_rh():
+            word = s._sin()
+            s.H = word >> 8
+            s.L = word & 0xFF
+            return "pop_rl_ini"
+
+        def pop_rl_nres():
+            s.R = (s.H << 24) | (s.L << 16) | s._sin()
+            return "pop_ip_ini"
+
+        fetch = "fetch_decode"
+        handlers = {
+            "stop": stop,
+            "start": start,
+            "fetch_decode": fetch_decode,
+            "load_ha_jmp": load_h("load_la_jmp"),
+            "load_la_jmp": load_la_jmp,
+            "load_ip": load_ip,
+            "load_ha_call": load_h("load_la_call"),
+            "load_la_call": load_l("push_ip"),
+            "push_ip": sp_step(1, "load_ip"),
+            "pop_ip_ini": sp_step(-1, "pop_ip"),
+            "pop_ip": pop_ip,
+            "ini_reti": ini_reti,
+            "dec_spx": sp_step(-1, "point_spx"),
+            "point_spx": point_spx,
+            "load_khx": load_h("load_klx"),
+            "load_klx": load_l(by_instruction(
+                {"movka": "store_ka", "movkb": "store_kb", "movki": "store_ki", "movkj": "store_kj", "movkn": "store_kn"},
+                "store_km")),
+            "load_usp": load_usp,
+            "load_hi_movxm": load_h("load_li_movxm"),
+            "load_li_movxm": load_l("load_dp_movxm"),
+            "load_dp_movxm": load_dp(
+                {"movam": "movam_exe", "movbm": "movbm_exe", "movrlm": "movrlm_exe"}, "movrhm_exe"),
+            "load_hi_movmx": load_h("load_li_movmx"),
+            "load_li_movmx": load_l("load_dp_movmx"),
+            "load_dp_movmx": load_dp(
+                {"movma": "movma_exe", "movmb": "movmb_exe", "incmpm": "load_xpp"}, "load_xmm"),
+            "movma_exe": set_reg("A", s._din),
+            "movmb_exe": set_reg("B", s._din),
+            "load_xpp": set_reg("X", lambda: (s._din() + 1) & 0xFFFF, "movxrm"),
+            "load_xmm": set_reg("X", lambda: (s._din() - 1) & 0xFFFF, "movxrm"),
+            "movxrm": movxrm,
+            "load_y": set_reg("Y", s._din, "cmp_xy"),
+            "cmp_xy": cmp_xy,
+            "load_hi_movi": load_h("load_li_movi"),
+            "load_li_movi": load_l("load_dp_movi"),
+            "load_dp_movi": load_dp_movi,
+            "load_ix": load_ix,
+            "movia_exe": set_reg("A", s._din),
+            "movib_exe": set_reg("B", s._din),
+            "ix_inc": ix_inc,
+            "ix_sto": lambda: fetch,
+            "movippa_exe": set_reg("A", s._din, "ix_inc"),
+            "movippb_exe": set_reg("B", s._din, "ix_inc"),
+            "ix_dec_a": ix_dec("movmmia_exe"),
+            "movmmia_exe": set_reg("A", s._din, "ix_dest"),
+            "ix_dec_b": ix_dec("movmmib_exe"),
+            "movmmib_exe": set_reg("B", s._din, "ix_dest"),
+            "ix_dest": ix_dest,
+            "movsa_exe": set_reg("A", lambda: s.stack[s.USP & 0xF]),
+            "movsb_exe": set_reg("B", lambda: s.stack[s.USP & 0xF]),
+            "add_result": add_result,
+            "cmp_result": cmp_result,
+            "xmul_exe": xmul_exe,
+            "sxacc_exe": sxacc_exe,
+            "log_result": log_result,
+            "load_ioadd": load_ioadd,
+            "ina_exe": set_reg("A", s._io_i),
+            "load_iok": load_h("ld_ioadd4k"),
+            "ld_ioadd4k": ld_ioadd4k,
+            "ini_iss": ini_iss,
+            "in_intx_F": in_intx_F,
+            "ld_iss_vec": ld_iss_vec,
+            "push_ip_int": sp_step(1, "push_rl"),
+            "push_rl": sp_step(1, "push_rh"),
+            "push_rh": sp_step(1, "push_f"),
+            "push_f": sp_step(1, "load_ip"),
+            "pop_f": set_reg("F", lambda: s._sin() & 0xFF, "pop_rh_ini"),
+            "pop_rh_ini": sp_step(-1, "pop_rh"),
+            "pop_rh": pop_rh,
+            "pop_rl_ini": sp_step(-1, "pop_rl_nres"),
+            "pop_rl_nres": pop_rl_nres,
+        }
+        for name, (bit, level) in _JUMPS.items():
+            handlers[name + "_exe"] = jump(bit, level)
+        for reg in "ABIJNM":
+            handlers[f"store_k{reg.lower()}"] = set_reg(reg, hl)
+        for reg in "abijnm":
+            handlers[f"push{reg}_exe"] = sp_step(1, fetch)
+            handlers[f"pop{reg}_exe"] = set_reg(reg.upper(), s._sin)
+        for name in ("movam_exe", "movbm_exe", "movrlm_exe", "movrhm_exe",
+                     "movas_exe", "movbs_exe", "movrls_exe", "movrhs_exe", "outa_exe", "outk_exe"):
+            handlers[name] = lambda: fetch
+        for name in ("movaipp_exe", "movbipp_exe", "movrlipp_exe", "movrhipp_exe"):
+            handlers[name] = lambda: "ix_inc"
+        for n in range(3):
+            handlers[f"set_int{n}_F"] = lambda: "ld_iss_vec"
+        if self.prefetch:
+            #The second byte comes from code_nxt in the same clock
+            for first, second in PREFETCH_PAIRS.items():
+                handlers[first] = fused(handlers[first], handlers[second])
+
+        missing = set(self.isa.states) - set(handlers)
+        if missing:
+            raise ValueError(f"FSM states without model: {sorted(missing)}")
+        return handlers
+
+
+if __name__ == "__main__":
+    from nano_asm import AsmError, assemble_file
+
+    if len(sys.argv) != 2:
+        sys.exit("usage: python nano_iss.py program.asm")
+    try:
+        image = assemble_file(sys.argv[1])
+    except AsmError as e:
+        sys.exit(f"{sys.argv[1]}: {e}")
+    iss = NanoISS()
+    iss.load(image.rom, image.ram)
+    cycles = iss.run()
+    print(f"stopped after {cycles} clocks, IP={iss.IP:#05x}")
+    print(" ".join(f"{name}={getattr(iss, name):#x}" for name in ("A", "B", "R", "ACC", "F", "I", "J", "N", "M", "SP", "USP")))
+    print(iss.cycle_report())
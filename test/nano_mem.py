@@ -0,0 +1,147 @@
+#nano_mem.py
+#=============================================================================
+# Acceso directo (backdoor) a las memorias sync_ram de Nano_mcsys_4Tiny
+#=============================================================================
+#
+# The memories are read and written through the cocotb handles of the `ram`
+# arrays, in zero simulated time and without touching the SPI pins, so it
+# only works with the RTL model (not with GATES=yes).
+#
+#     CPU code space (12 bits address, 256 bytes):
+#
+#     -----+---------------+
+#    0x000 |               |
+#          | my_bottom_rom |  add[6:0], cs_top_rom = 0
+#    0x07F |               |
+#     -----|---------------|
+#    0x080 |               |
+#          | (bottom alias)|  not accepted by this module
+#    0xF7F |               |
+#     -----|---------------|
+#    0xF80 |               |
+#          |  my_top_rom   |  add[6:0], cs_top_rom = 1 (INT vectors)
+#    0xFFF |               |
+#     -----+---------------+
+#
+#     CPU data space: my_ram, 32x16 (add[4:0])
+#     CPU stack:      my_stack, 16x16 (add[3:0])
+#=============================================================================
+
+from cocotb.handle import Immediate
+
+from nano_isa import RAM_SIZE, ROM_BOTTOM_SIZE, ROM_TOP_BASE, ROM_TOP_SIZE, STACK_SIZE, rom_addresses
+
+
+def _items(data, start):
+    #Accept {address: value} mappings or sequences stored from `start`
+    if hasattr(data, "items"):
+        return sorted(data.items())
+    return [(start + i, value) for i, value in enumerate(data)]
+
+
+class NanoMemory:
+    """Backdoor loader and dumper for ROM, RAM and stack of the Nano system."""
+
+    def __init__(self, dut):
+        nano = dut.user_project.my_NanoSys
+        self.dut = dut
+        self.top_rom = nano.my_top_rom.ram
+        self.bottom_rom = nano.my_bottom_rom.ram
+        self.ram = nano.my_ram.ram
+        self.stack = nano.my_stack.ram
+
+    #-------------------------------------------------------------------------
+    # Code space
+    #-------------------------------------------------------------------------
+    def _rom_word(self, address):
+        #Same chip select as cs_top_rom in Nano_mcsys_4Tiny_fit.v
+        if ROM_TOP_BASE <= address < ROM_TOP_BASE + ROM_TOP_SIZE:
+            return self.top_rom[address & 0x7F]
+        if 0 <= address < ROM_BOTTOM_SIZE:
+            return self.bottom_rom[address]
+        raise ValueError(f"ROM address {address:#05x} has no physical location (0x000-0x07F, 0xF80-0xFFF)")
+
+    def write_rom(self, address, byte):
+        self._rom_word(address).value = Immediate(byte & 0xFF)
+
+    def read_rom(self, address):
+        return self._rom_word(address).value.to_unsigned()
+
+    def load_rom(self, data, start=0):
+        for address, byte in _items(data, start):
+            self.write_rom(address, byte)
+
+    def dump_rom(self, addresses=None):
+        return {a: self.read_rom(a) for a in (rom_addresses() if addresses is None else addresses)}
+
+    #-------------------------------------------------------------------------
+    # Data space
+    #-------------------------------------------------------------------------
+    def _ram_word(self, address):
+        if not 0 <= address < RAM_SIZE:
+            raise ValueError(f"RAM address {address:#x} out of range (32 words)")
+        return self.ram[address]
+
+    def write_ram(self, address, word):
+        self._ram_word(address).value = Immediate(word & 0xFFFF)
+
+    def read_ram(self, address):
+        return self._ram_word(address).value.to_unsigned()
+
+    def load_ram(self, data, start=0):
+        for address, word in _items(data, start):
+            self.write_ram(address, word)
+
+    def dump_ram(self):
+        return [self.read_ram(a) for a in range(RAM_SIZE)]
+
+    #-------------------------------------------------------------------------
+    # Stack (only reachable by the CPU)
+    #-------------------------------------------------------------------------
+    def _stack_word(self, address):
+        if not 0 <= address < STACK_SIZE:
+            raise ValueError(f"Stack address {address:#x} out of range (16 words)")
+        return self.stack[address]
+
+    def write_stack(self, address, word):
+        self._stack_word(address).value = Immediate(word & 0xFFFF)
+
+    def read_stack(self, address):
+        return self._stack_word(address).value.to_unsigned()
+
+    def load_stack(self, data, start=0):
+        for address, word in _items(data, start):
+            self.write_stack(address, word)
+
+    def dump_stack(self):
+        return [self.read_stack(a) for a in range(STACK_SIZE)]
+
+    #-------------------------------------------------------------------------
+    def clear(self):
+        """Zero every location of the four memories."""
+        self.load_rom(dict.fromkeys(rom_addresses(), 0))
+        self.load_ram([0] * RAM_SIZE)
+        self.load_stack([0] * STACK_SIZE)
+
+    async def load(self, rom=None, ram=None, spi=None):
+        """Load ROM and/or RAM images through the backdoor.
+
+        If a NanoSpiMaster is given (MODE=0), every loaded location is read
+        back through slave_spi4nano and a mismatch raises AssertionError.
+        """
+        rom = dict(_items(rom, 0)) if rom is not None else {}
+        ram = dict(_items(ram, 0)) if ram is not None else {}
+        self.load_rom(rom)
+        self.load_ram(ram)
+        if spi is None:
+            return
+        errors = []
+        for address, byte in rom.items():
+            got = await spi.read_rom(address)
+            if got != byte & 0xFF:
+                errors.append(f"ROM[{address:#05x}]: expected {byte & 0xFF:#04x}, SPI read {got:#04x}")
+        for address, word in ram.items():
+            got = await spi.read_ram(address)
+            if got != word & 0xFFFF:
+                errors.append(f"RAM[{address:#04x}]: expected {word & 0xFFFF:#06x}, SPI read {got:#06x}")
+        assert not errors, "Backdoor load not seen through SPI:\n" + "\n".join(errors)
@@ -0,0 +1,127 @@
+#nano_multi.py
+#=============================================================================
+# Reparto de programas y estimulos entre las copias de tb_multi.v
+#=============================================================================
+#
+# With make MULTI=N the toplevel is tb_multi (gen_tb_multi.py), N copies of
+# the project with their own pins on a common clock, and the tests are the
+# ones of test_multi.py. NanoMulti finds the slots and deals jobs to them:
+# every job runs on the next free slot, the slots run concurrently, and the
+# results come back in the order of the jobs:
+#
+#     multi = NanoMulti(dut, clk_period=10, unit="us")
+#     await multi.start()
+#     results = await multi.run_programs([image0, image1, ...])
+#     results[1]["cycles"], results[1]["registers"]["R"], results[1]["ram"] ...
+#
+# map() runs any coroutine job(slot, item); a slot handle has the pins of tb.v
+# (clk, rst_n, ena, ui_in, uio_in, uo_out, uio_out) and user_project, so the
+# helpers written for the dut of tb.v (NanoMemory, NanoWaits, NanoSpiMaster,
+# NanoSnapshot, ...) take it. The helpers that use the tasks of tb.v (the
+# stimulus replay and NanoSpiTbMaster) do not.
+#
+# run_programs() backdoor loads every program, so it only works with the RTL
+# model (not with GATES=yes).
+#=============================================================================
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import ClockCycles, FallingEdge
+
+from nano_batch import STOPPED, TIMEOUT
+from nano_iss import REGISTERS
+from nano_mem import NanoMemory
+from nano_pins import MSK_MODE_TO_ON, MSK_RUN_TO_ON
+from nano_waits import NanoWaits
+
+
+class NanoMulti:
+    """Jobs dealt to the Nano systems of tb_multi.v."""
+
+    def __init__(self, dut, clk_period=10, unit="us"):
+        self.dut = dut
+        self.clk_period = clk_period
+        self.unit = unit
+        self.slots = []
+        while hasattr(dut, f"slot{len(self.slots)}"):
+            self.slots.append(getattr(dut, f"slot{len(self.slots)}"))
+        if not self.slots:
+            raise ValueError("the toplevel has no slots (simulate tb_multi.v with make MULTI=N)")
+        self.jobs = [0] * len(self.slots)   #Jobs run by every slot
+
+    def __len__(self):
+        return len(self.slots)
+
+    async def start(self):
+        """Start the clock and reset every slot."""
+        cocotb.start_soon(Clock(self.dut.clk, self.clk_period, unit=self.unit).start())
+        for slot in self.slots:
+            slot.ena.value = 1
+        for slot in self.slots:
+            cocotb.start_soon(self.reset(slot))
+        await ClockCycles(self.dut.clk, 3)
+
+    async def reset(self, slot):
+        """Reset one slot, with its pins low."""
+        slot.ui_in.value = 0
+        slot.uio_in.value = 0
+        slot.rst_n.value = 0
+        await ClockCycles(slot.clk, 2)
+        slot.rst_n.value = 1
+
+    async def map(self, job, items):
+        """Run `await job(slot, item)` for every item on the next free slot and
+        return the results in the order of `items`."""
+        items = list(items)
+        results = [None] * len(items)
+        queue = iter(enumerate(items))
+
+        async def worker(index):
+            slot = self.slots[index]
+            for i, item in queue:
+                results[i] = await job(slot, item)
+                self.jobs[index] += 1
+
+        workers = [cocotb.start_soon(worker(index)) for index in range(len(self.slots))]
+        for task in workers:
+            await task
+        return results
+
+    async def run_program(self, slot, image, max_cycles=100000):
+        """Reset `slot`, backdoor load an image (an assembled program or a
+        (rom, ram) pair) and run it (MODE=1).
+
+        Returns {"status", "cycles", "registers", "ram", "stack"}: status is
+        STOPPED, or TIMEOUT (the clocks waited in cycles) when the program
+        does not stop in `max_cycles`.
+        """
+        rom, ram = (image.rom, image.ram) if hasattr(image, "rom") else image
+        await self.reset(slot)
+        mem = NanoMemory(slot)
+        mem.clear()
+        await mem.load(rom=rom, ram=ram)
+        cpu = slot.user_project.my_NanoSys.my_cpu
+        slot.ui_in.value = MSK_MODE_TO_ON
+        await ClockCycles(slot.clk, 16)
+        waits = NanoWaits(slot, clk_period=self.clk_period, unit=self.unit, signal=cpu.state_reg)
+        slot.ui_in.value = MSK_MODE_TO_ON | MSK_RUN_TO_ON
+        await waits.wait_state_change(timeout_cycles=16)
+        await FallingEdge(slot.clk)
+        status = STOPPED
+        try:
+            cycles = await waits.wait_until_stop(timeout_cycles=max_cycles)
+        except RuntimeError:
+            status, cycles = TIMEOUT, max_cycles
+        return {
+            "status": status,
+            "cycles": cycles,
+            "registers": {name: int(getattr(cpu, name + "_reg").value) for name, _ in REGISTERS},
+            "ram": mem.dump_ram(),
+            "stack": mem.dump_stack(),
+        }
+
+    async def run_programs(self, images, max_cycles=100000):
+        """run_program() of every image on the next free slot, results in order."""
+        async def job(slot, image):
+            return await self.run_program(slot, image, max_cycles)
+        return await self.map(job, images)
@@ -0,0 +1,95 @@
+#nano_pins.py
+#=============================================================================
+# Definiciones de pines de tt_um_galaguna_NanoSys_fit para los testbenches
+#=============================================================================
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import ClockCycles
+
+#!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
+#Masks definitions according to the pinout:
+#!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
+#
+# Inputs:
+#   ui[0]: "OUT_CTRL0"
+#   ui[1]: "OUT_CTRL1"
+#   ui[2]: "OUT_CTRL2"
+#   ui[3]: "SPI_SCK"
+#   ui[4]: "SPI_MOSI"
+#   ui[5]: "SPI_CS"
+#   ui[6]: "RUN"
+#   ui[7]: "MODE"
+#
+# Outputs:
+#   uo[0..7]: "OUT8B0..7"
+#
+# Bidirectional pins as otputs:
+#   uio[0]: "OUT4B0"
+#   uio[1]: "OUT4B1"
+#   uio[2]: "OUT4B2"
+#   uio[3]: "OUT4B3"
+#   uio[7]: "SPI_MISO"
+#
+# Bidirectional pins as inputs:
+#   uio[4]: "EINT0"
+#   uio[5]: "EINT1"
+#   uio[6]: "EINT2"
+
+MSK_OUT_CTRL = 0x07
+MSK_SPI_SCK_TO_ON = 0x08
+MSK_SPI_SCK_TO_OFF = 0xF7
+MSK_SPI_MOSI_TO_ON = 0x10
+MSK_SPI_MOSI_TO_OFF = 0xEF
+MSK_SPI_CS_TO_ON = 0x20
+MSK_SPI_CS_TO_OFF = 0xDF
+MSK_RUN_TO_ON = 0x40
+MSK_RUN_TO_OFF = 0xBF
+MSK_MODE_TO_ON = 0x80
+MSK_MODE_TO_OFF = 0x7F
+
+MSK_OUT_CTRL_TO_0 = 0xF8
+
+MSK_OUT4B = 0x0F
+MSK_EINT0 = 0x10
+MSK_EINT1 = 0x20
+MSK_EINT2 = 0x40
+MSK_SPI_MISO = 0x80
+
+#Idle levels of the SPI master (SCK, MOSI and CS high):
+SPI_IDLE = MSK_SPI_SCK_TO_ON | MSK_SPI_MOSI_TO_ON | MSK_SPI_CS_TO_ON
+
+#!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
+# OUT8b and OUT4B setting
+#!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
+#   +--------+-------------+--------------------+
+#   |out_ctrl|    OUT8B    |       OUT4B        |
+#   +--------+-------------+--------------------+
+#   |   0    |  State_reg  |     R_reg[3:0]     |
+#   +--------+-------------+--------------------+
+#   |   1    |  State_reg  |     R_reg[7:4]     |
+#   +--------+-------------+--------------------+
+#   |   2    |  State_reg  |     R_reg[11:8]    |
+#   +--------+-------------+--------------------+
+#   |   3    |  State_reg  |     R_reg[15:12]   |
+#   +--------+-------------+--------------------+
+#   |   4    | R_reg[7:0]  |     F_reg[3:0]     |
+#   +--------+-------------+--------------------+
+#   |   5    | R_reg[15:8] |     F_reg[3:0]     |
+#   +--------+-------------+--------------------+
+#   |   6    | R_reg[23:16]|     F_reg[7:4]     |
+#   +--------+-------------+--------------------+
+#   |   7    | R_reg[31:24]|     F_reg[7:4]     |
+#   +--------+-------------+--------------------+
+
+
+async def reset_nano(dut, clk_period=10, unit="us"):
+    """Start the clock (100 KHz by default), enable the project and reset it with the pins low."""
+    cocotb.start_soon(Clock(dut.clk, clk_period, unit=unit).start())
+    dut._log.info("Reset")
+    dut.ena.value = 1
+    dut.ui_in.value = 0
+    dut.uio_in.value = 0
+    dut.rst_n.value = 0
+    await ClockCycles(dut.clk, 2)
+    dut.rst_n.value = 1
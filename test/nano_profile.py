@@ -0,0 +1,192 @@
+#nano_profile.py
+#=============================================================================
+# Perfil de ciclos por instruccion y por direccion de los programas de Nano
+# ejecutados en el RTL
+#=============================================================================
+#
+# NanoProfiler watches `state_reg` and `IP_reg` of my_cpu (waking only when
+# one of them changes, like NanoCosim) and gives every clock to the
+# instruction being executed: its opcode (`instruction_reg` after the
+# fetch_decode clock) and its address. The clocks of every state are kept,
+# so multi-state sequences (load_ha_jmp -> load_la_jmp -> load_ip, xmul_exe,
+# ...) are split by state. The interrupt entry (ini_iss ... push_f, including
+# the fetch_decode clock it replaces) is profiled as "irq", with the same
+# conventions as NanoISS.profile:
+#
+#     opcodes     {name: [count, clocks]}
+#     addresses   {address: [name, count, clocks]}
+#     states      {name: {state: clocks}}
+#     folded      {"frames;...;name@address;state": clocks}
+#
+# `folded` follows call/ret and irq/reti to build the call stack, with the
+# code labels of the program (NanoImage.labels) as frame names and INT0..2
+# for the interrupt vectors, and is written by write_folded() in the format
+# of flamegraph.pl ("frame;frame;... clocks" per line):
+#
+#     profiler = NanoProfiler(dut, labels=image.labels)
+#     profiler.start()
+#     ... run the program ...
+#     profiler.stop()
+#     profiler.write_json("profile.json")
+#     profiler.write_folded("profile.folded")   #flamegraph.pl profile.folded
+#     dut._log.info(profiler.report())
+#=============================================================================
+
+import json
+from bisect import bisect_right
+
+import cocotb
+from cocotb.triggers import First, ReadOnly
+from cocotb.utils import get_sim_steps, get_sim_time
+
+from nano_isa import get_isa
+
+
+class NanoProfiler:
+    """Clocks per opcode, per address, per state and per call stack of my_cpu."""
+
+    def __init__(self, dut, labels=None, clk_period=10, unit="us", isa=None):
+        self.dut = dut
+        self.cpu = dut.user_project.my_NanoSys.my_cpu
+        self.isa = isa if isa is not None else get_isa()
+        self.period = get_sim_steps(clk_period, unit)
+        labels = sorted((address, name) for name, address in (labels or {}).items())
+        self._label_addresses = [address for address, _ in labels]
+        self._label_names = [name for _, name in labels]
+        self._vectors = {address: f"INT{n}" for n, address in self.isa.vectors.items()}
+        states = self.isa.states
+        self._stop = states["stop"]
+        self._start = states["start"]
+        self._fetch = states["fetch_decode"]
+        self._ini_iss = states["ini_iss"]
+        self._task = None
+        self.clear()
+
+    def clear(self):
+        self.opcodes = {}
+        self.addresses = {}
+        self.states = {}
+        self.folded = {}
+        self.instructions = 0
+        self.clocks = 0
+        self._stack = []
+
+    def start(self):
+        self._task = cocotb.start_soon(self._watch())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def frame(self, address):
+        """Name of the code at `address`: interrupt vector or closest label before it."""
+        if address in self._vectors:
+            return self._vectors[address]
+        i = bisect_right(self._label_addresses, address) - 1
+        return self._label_names[i] if i >= 0 else f"{address:#05x}"
+
+    #-------------------------------------------------------------------------
+    async def _watch(self):
+        cpu = self.cpu
+        state = int(cpu.state_reg.value)
+        ip = int(cpu.IP_reg.value)
+        last = get_sim_time("step")
+        current = None    #[name, address, {state: clocks}, clocks] of the instruction
+        while True:
+            await First(cpu.state_reg.value_change, cpu.IP_reg.value_change)
+            await ReadOnly()
+            now = get_sim_time("step")
+            clocks = (now - last) // self.period
+            last = now
+            previous, state = state, int(cpu.state_reg.value)
+            changed, ip = ip != int(cpu.IP_reg.value), int(cpu.IP_reg.value)
+            if previous == self._stop:
+                if state == self._stop:
+                    continue
+                #RUN (start) or an interrupt: only the clock that left stop
+                #belongs to the interrupt entry
+                self._stack = [self.frame(0) if state == self._start else "stop"]
+                current = ["start" if state == self._start else "irq", ip, {}, 0]
+                if state == self._start:
+                    continue
+                clocks = 1
+            if current is not None:
+                if current[0] is None:
+                    current[0] = ("irq" if state == self._ini_iss
+                                  else self.isa.names.get(int(cpu.instruction_reg.value), "illegal"))
+                self._add(current, previous, clocks)
+            if state == self._stop or (state == self._fetch and (previous != self._fetch or changed)):
+                if current is not None:
+                    self._finish(current, ip)
+                current = [None, ip, {}, 0] if state == self._fetch else None
+
+    def _add(self, current, state, clocks):
+        name, address, states, _ = current
+        state = self.isa.state_names.get(state, f"{state:#04x}")
+        states[state] = states.get(state, 0) + clocks
+        current[3] += clocks
+        self.clocks += clocks
+        key = ";".join(self._stack + [f"{name}@{address:#05x}", state])
+        self.folded[key] = self.folded.get(key, 0) + clocks
+
+    def _finish(self, current, ip):
+        name, address, states, clocks = current
+        if name != "start":
+            entry = self.opcodes.get(name)
+            if entry is None:
+                entry = self.opcodes[name] = [0, 0]
+            entry[0] += 1
+            entry[1] += clocks
+            self.instructions += 1
+            per_state = self.states.setdefault(name, {})
+            for state, n in states.items():
+                per_state[state] = per_state.get(state, 0) + n
+        if name != "start" and name != "irq":
+            entry = self.addresses.get(address)
+            if entry is None:
+                entry = self.addresses[address] = [name, 0, 0]
+            entry[1] += 1
+            entry[2] += clocks
+        #Call stack for the folded profile
+        if name == "call" or name == "irq":
+            self._stack.append(self.frame(ip))
+        elif (name == "ret" or name == "reti") and len(self._stack) > 1:
+            self._stack.pop()
+
+    #-------------------------------------------------------------------------
+    # Results
+    #-------------------------------------------------------------------------
+    def to_json(self):
+        return json.dumps({
+            "clocks": self.clocks,
+            "instructions": self.instructions,
+            "opcodes": {name: {"count": count, "clocks": clocks}
+                        for name, (count, clocks) in self.opcodes.items()},
+            "addresses": {f"{address:#05x}": {"instruction": name, "count": count, "clocks": clocks}
+                          for address, (name, count, clocks) in sorted(self.addresses.items())},
+            "states": self.states,
+        }, indent=1)
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            f.write(self.to_json() + "\n")
+
+    def write_folded(self, path):
+        """Folded stacks for flamegraph.pl / speedscope, one "stack clocks" per line."""
+        with open(path, "w") as f:
+            for stack, clocks in sorted(self.folded.items()):
+                f.write(f"{stack} {clocks}\n")
+
+    def report(self, top=10):
+        """Hot spots: the `top` opcodes and addresses with the most clocks."""
+        total = max(self.clocks, 1)
+        lines = [f"{self.instructions} instructions, {self.clocks} clocks",
+                 f"{'instruction':<12}{'count':>8}{'clocks':>10}{'clk/ins':>9}{'share':>8}"]
+        for name, (count, clocks) in sorted(self.opcodes.items(), key=lambda item: -item[1][1])[:top]:
+            lines.append(f"{name:<12}{count:>8}{clocks:>10}{clocks / count:>9.2f}{clocks / total:>8.1%}")
+        lines.append(f"{'address':<20}{'count':>8}{'clocks':>10}{'share':>8}")
+        for address, (name, count, clocks) in sorted(self.addresses.items(), key=lambda item: -item[1][2])[:top]:
+            where = f"{address:#05x} {name} ({self.frame(address)})"
+            lines.append(f"{where:<20}{count:>8}{clocks:>10}{clocks / total:>8.1%}")
+        return "\n".join(lines)
@@ -0,0 +1,249 @@
+#nano_replay.py
+#=============================================================================
+# Estimulos precompilados para los pines de tt_um_galaguna_NanoSys_fit,
+# reproducidos por tb.v
+#=============================================================================
+#
+# NanoStimulus compiles high level actions (SPI frames and loads, MODE, RUN,
+# OUT_CTRL, EINT pulses and waits) into a list of pin vectors indexed by the
+# falling edges of clk, with the same SPI timing as NanoSpiMaster. NanoReplay
+# writes them to a memory file that tb.v loads and applies at the falling
+# edges, so the pins change at the speed of the simulator and Python only
+# wakes at the checkpoints and at the end:
+#
+#     stimulus = NanoStimulus()
+#     stimulus.spi_load(image.rom, image.ram)
+#     response = stimulus.spi_read(SPI_RAM_BASE + 0x10)
+#     stimulus.mode(1)
+#     stimulus.pulse_run()
+#     replay = NanoReplay(dut)
+#     miso = await replay.play(stimulus)
+#     word = miso[response] & 0xFFFF
+#
+# MISO is sampled by tb.v into replay_miso just before the SCK rising edges
+# of the frames compiled with sample=True; the last bit of each of them is a
+# checkpoint where NanoReplay reads the word. checkpoint() adds checkpoints
+# of its own, for wait_checkpoint().
+#
+# Only the pins are driven, so the replay works on the RTL and on the gate
+# level netlist. tb.v takes the pins while replay_run is set, so Python must
+# not write ui_in/uio_in while a replay runs; wait_done() writes the last
+# entry back to them.
+#=============================================================================
+
+import os
+import tempfile
+
+from cocotb.triggers import FallingEdge
+
+from nano_pins import (
+    MSK_EINT0,
+    MSK_MODE_TO_ON,
+    MSK_OUT_CTRL,
+    MSK_RUN_TO_ON,
+    MSK_SPI_CS_TO_ON,
+    MSK_SPI_MOSI_TO_ON,
+    MSK_SPI_SCK_TO_ON,
+    SPI_IDLE,
+)
+from nano_spi import SPI_BURST, SPI_DUMMY, SPI_RAM_BASE, SPI_ROM_BASE, _runs, spi_word
+
+#Fields of a replay_mem entry of tb.v
+_MARK = 1 << 31
+_SAMPLE = 1 << 30
+_MAX_DELAY = (1 << 14) - 1
+REPLAY_DEPTH = 65536
+
+_SPI_PINS = MSK_SPI_SCK_TO_ON | MSK_SPI_MOSI_TO_ON | MSK_SPI_CS_TO_ON
+
+
+class NanoStimulus:
+    """Pin vectors of ui_in/uio_in, one per falling edge of clk that changes them."""
+
+    def __init__(self, ui=SPI_IDLE, uio=0, sck_div=8, cs_gap=4, burst_gap=8):
+        if sck_div < 8 or sck_div % 2:
+            raise ValueError("sck_div must be an even number >= 8 (f_sck <= clk/8)")
+        if burst_gap < 8:
+            raise ValueError("burst_gap must be >= 8 clk cycles")
+        if cs_gap < 1:
+            raise ValueError("cs_gap must be >= 1 clk cycle")
+        self.half = sck_div // 2
+        self.cs_gap = cs_gap
+        self.burst_gap = burst_gap
+        self.ui = ui
+        self.uio = uio
+        self.clock = 0            #Falling edges from the start of the replay
+        self.entries = []         #[clock, ui, uio, flags]
+        self.marks = 0
+        self.reads = []           #Mark of the last bit of every sampled frame
+        self._set()
+
+    def _set(self, sample=False, mark=False):
+        flags = (_SAMPLE if sample else 0) | (_MARK if mark else 0)
+        if self.entries and self.entries[-1][0] == self.clock:
+            entry = self.entries[-1]
+            entry[1], entry[2] = self.ui, self.uio
+            entry[3] |= flags
+        else:
+            self.entries.append([self.clock, self.ui, self.uio, flags])
+        if mark:
+            self.marks += 1
+
+    def wait(self, clocks):
+        """Keep the pins for `clocks` falling edges."""
+        if clocks < 0:
+            raise ValueError(f"wait of {clocks} clocks")
+        self.clock += clocks
+
+    def pins(self, ui=None, uio=None):
+        """Set ui_in and/or uio_in at the current clock."""
+        self.ui = self.ui if ui is None else ui & 0xFF
+        self.uio = self.uio if uio is None else uio & 0xFF
+        self._set()
+
+    def checkpoint(self):
+        """Checkpoint at the current clock, returns its number for wait_checkpoint()."""
+        self._set(mark=True)
+        return self.marks
+
+    #-------------------------------------------------------------------------
+    # Control pins
+    #-------------------------------------------------------------------------
+    def mode(self, on):
+        self.pins(ui=(self.ui | MSK_MODE_TO_ON) if on else (self.ui & ~MSK_MODE_TO_ON))
+
+    def pulse_run(self, clocks=2):
+        """RUN high for `clocks` clocks."""
+        self.pins(ui=self.ui | MSK_RUN_TO_ON)
+        self.wait(clocks)
+        self.pins(ui=self.ui & ~MSK_RUN_TO_ON)
+
+    def out_ctrl(self, value):
+        self.pins(ui=(self.ui & ~MSK_OUT_CTRL) | (value & MSK_OUT_CTRL))
+
+    def pulse_eint(self, line, clocks=1):
+        """EINT<line> high for `clocks` clocks."""
+        if line not in (0, 1, 2):
+            raise ValueError(f"EINT{line} does not exist")
+        self.pins(uio=self.uio | (MSK_EINT0 << line))
+        self.wait(clocks)
+        self.pins(uio=self.uio & ~(MSK_EINT0 << line))
+
+    #-------------------------------------------------------------------------
+    # SPI (same frames and timing as NanoSpiMaster)
+    #-------------------------------------------------------------------------
+    def _shift(self, word, nbits, sample):
+        base = self.ui & ~_SPI_PINS
+        for i in range(nbits - 1, -1, -1):
+            self.ui = base | (MSK_SPI_MOSI_TO_ON if (word >> i) & 1 else 0)
+            self._set()
+            self.wait(self.half)
+            self.ui |= MSK_SPI_SCK_TO_ON
+            self._set(sample=sample, mark=sample and i == 0)
+            self.wait(self.half)
+        if sample:
+            self.reads.append(self.marks)
+
+    def spi_frame(self, word, nbits=32, sample=False, words=()):
+        """One SPI frame (and the 16 bits words of a burst); returns the index
+        of its first MISO word in the result of NanoReplay.play() when sampled."""
+        first = len(self.reads)
+        #Like NanoSpiMaster.transfer(), the frame starts at the next falling edge
+        self.wait(1)
+        self._shift(word, nbits, sample)
+        for extra in words:
+            self.wait(self.burst_gap)
+            self._shift(extra, 16, sample)
+        self.pins(ui=self.ui | SPI_IDLE)
+        burst = words or word & (SPI_BURST << 16)
+        self.wait(self.cs_gap + (self.burst_gap if burst else 0))
+        return first if sample else None
+
+    def spi_write(self, address, data):
+        self.spi_frame(spi_word(address, data))
+
+    def spi_read(self, address):
+        """Single read: command and response frames; returns the index of the response."""
+        self.spi_frame(spi_word(address, read=True))
+        return self.spi_frame(SPI_DUMMY, sample=True)
+
+    def spi_load(self, rom=None, ram=None):
+        """Code and data images ({address: value}), one burst per run of addresses."""
+        for start, run in _runs(rom or {}):
+            run = [byte & 0xFF for byte in run]
+            pairs = [(run[i] << 8) | run[i + 1] for i in range(0, len(run) - 1, 2)]
+            if pairs:
+                self.spi_frame(spi_word(SPI_BURST | SPI_ROM_BASE + start, pairs[0]), words=pairs[1:])
+            if len(run) % 2:
+                self.spi_write(SPI_ROM_BASE + start + len(run) - 1, run[-1])
+        for start, run in _runs(ram or {}):
+            self.spi_frame(spi_word(SPI_BURST | SPI_RAM_BASE + start, run[0]), words=run[1:])
+
+    #-------------------------------------------------------------------------
+    def words(self):
+        """replay_mem entries of tb.v."""
+        words, last = [], 0
+        for clock, ui, uio, flags in self.entries:
+            delay = clock - last
+            while delay > _MAX_DELAY:
+                words.append((_MAX_DELAY << 16) | (ui_prev << 8) | uio_prev)
+                delay -= _MAX_DELAY
+            words.append(flags | (max(delay, 1) << 16) | (ui << 8) | uio)
+            last, ui_prev, uio_prev = clock, ui, uio
+        if len(words) > REPLAY_DEPTH:
+            raise ValueError(f"{len(words)} entries do not fit in replay_mem ({REPLAY_DEPTH})")
+        return words
+
+
+class NanoReplay:
+    """Replay of a NanoStimulus by tb.v."""
+
+    def __init__(self, dut):
+        self.dut = dut
+        self.marks = 0
+
+    async def start(self, stimulus):
+        """Load the stimulus in tb.v and start it at the next falling edge of clk."""
+        dut = self.dut
+        fd, path = tempfile.mkstemp(suffix=".hex", prefix="replay_")
+        with os.fdopen(fd, "w") as f:
+            f.write("\n".join(f"{word:08x}" for word in stimulus.words()) + "\n")
+        try:
+            dut.replay_file.value = int.from_bytes(path.encode(), "big")
+            dut.replay_load.value = 0
+            await FallingEdge(dut.clk)
+            dut.replay_load.value = 1
+            dut.replay_count.value = len(stimulus.words())
+            await FallingEdge(dut.clk)
+        finally:
+            os.remove(path)
+        dut.replay_load.value = 0
+        self.marks = dut.replay_mark.value.to_unsigned()
+        dut.replay_run.value = 1
+        await dut.replay_run.value_change
+
+    async def wait_checkpoint(self, number):
+        """Wait until checkpoint `number` (see NanoStimulus.checkpoint()) is applied."""
+        mark = self.dut.replay_mark
+        while mark.value.to_unsigned() - self.marks < number:
+            await mark.value_change
+
+    async def wait_done(self):
+        """Wait for the end of the replay and keep its last pins in ui_in/uio_in."""
+        dut = self.dut
+        run = dut.replay_run
+        while int(run.value):
+            await run.value_change
+        dut.ui_in.value = dut.replay_ui.value.to_unsigned()
+        dut.uio_in.value = dut.replay_uio.value.to_unsigned()
+        await FallingEdge(dut.clk)
+
+    async def play(self, stimulus):
+        """Replay a stimulus to the end, returns the MISO words of its sampled frames."""
+        await self.start(stimulus)
+        miso = []
+        for number in stimulus.reads:
+            await self.wait_checkpoint(number)
+            miso.append(self.dut.replay_miso.value.to_unsigned())
+        await self.wait_done()
+        return miso
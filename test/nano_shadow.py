@@ -0,0 +1,139 @@
+#nano_shadow.py
+#=============================================================================
+# Copia sombra de ROM, RAM y pila a partir de los buses de Nano_mcsys_4Tiny
+#=============================================================================
+#
+# NanoShadow is a passive bus monitor: it follows the write enables of the
+# memories of Nano_mcsys_4Tiny (mxd_rom_we, mxd_ram_we and cpu2stk_we) and, at
+# the rising edge of their clock (mxd_mem_clk or mem_clk), applies the write
+# of the address and data buses to Python copies of the ROM, RAM and stack.
+# Writes by the CPU (MODE=1) and by slave_spi4nano (MODE=0) are both seen, so
+# tests can assert on memory contents at any time without reading them back:
+#
+#     shadow = NanoShadow(dut)
+#     shadow.start()                  #Starts from the current contents
+#     ... SPI load, run a program ...
+#     assert shadow.ram[0x10] == 7
+#     shadow.check()                  #Out of range accesses
+#
+# The monitor only wakes while a write enable is high. Addresses with bits set
+# above the ones wired to a memory (my_ram uses add[4:0], the ROMs add[6:0]
+# and cs_top_rom, my_stack add[3:0]) alias another location: such writes are
+# applied to the aliased location, as the RTL does, and recorded in `errors`.
+# With check_addresses (default) the CPU address buses (IP, DP and SP/USP) are
+# watched too, and an out of range address presented to a memory in MODE=1
+# is recorded once per change of the bus.
+#
+# Backdoor loads (NanoMemory) bypass the buses: call sync() after them. The
+# monitor reads internal signals of Nano_mcsys_4Tiny, so it only works with
+# the RTL model (not with GATES=yes).
+#=============================================================================
+
+import cocotb
+from cocotb.triggers import First, ReadOnly, RisingEdge
+from cocotb.utils import get_sim_time
+
+from nano_isa import RAM_SIZE, ROM_TOP_BASE, STACK_SIZE, is_rom_address
+from nano_mem import NanoMemory
+
+
+def rom_location(address):
+    #Physical code address selected by the 12 bits `address` (cs_top_rom and add[6:0])
+    return (ROM_TOP_BASE if address >> 7 == 0x1F else 0) | (address & 0x7F)
+
+
+class NanoShadow:
+    """Python copies of ROM, RAM and stack kept from the memory buses."""
+
+    def __init__(self, dut, check_addresses=True):
+        nano = dut.user_project.my_NanoSys
+        self.dut = dut
+        self.nano = nano
+        self.mem = NanoMemory(dut)
+        self.check_addresses = check_addresses
+        self._tasks = []
+        self.rom = {}
+        self.ram = [0] * RAM_SIZE
+        self.stack = [0] * STACK_SIZE
+        self.writes = {"rom": 0, "ram": 0, "stack": 0}
+        self.errors = []
+
+    def sync(self):
+        """Take the current contents of the memories (after backdoor loads)."""
+        self.rom = self.mem.dump_rom()
+        self.ram = self.mem.dump_ram()
+        self.stack = self.mem.dump_stack()
+
+    def start(self):
+        self.sync()
+        nano = self.nano
+        self._tasks = [
+            cocotb.start_soon(self._watch_writes(nano.mxd_mem_clk, (
+                ("rom", nano.mxd_rom_we, nano.mxd_rom_add, nano.mxd_rom_din),
+                ("ram", nano.mxd_ram_we, nano.mxd_ram_add, nano.mxd_ram_din)))),
+            cocotb.start_soon(self._watch_writes(nano.mem_clk, (
+                ("stack", nano.cpu2stk_we, nano.cpu2stk_add, nano.cpu2stk_din),))),
+        ]
+        if self.check_addresses:
+            self._tasks.append(cocotb.start_soon(self._watch_addresses()))
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def check(self):
+        """Raise AssertionError with the out of range accesses seen so far."""
+        assert not self.errors, "Out of range memory accesses:\n" + "\n".join(self.errors)
+
+    #-------------------------------------------------------------------------
+    def _error(self, text):
+        self.errors.append(f"{get_sim_time('ns'):.0f} ns: {text}")
+
+    def _write(self, memory, address, data):
+        self.writes[memory] += 1
+        if memory == "rom":
+            location = rom_location(address)
+            if not is_rom_address(address):
+                self._error(f"ROM write at {address:#05x} aliases {location:#05x}")
+            self.rom[location] = data & 0xFF
+        elif memory == "ram":
+            location = address % RAM_SIZE
+            if address >= RAM_SIZE:
+                self._error(f"RAM write at {address:#05x} aliases {location:#04x}")
+            self.ram[location] = data & 0xFFFF
+        else:
+            location = address % STACK_SIZE
+            if address >= STACK_SIZE:
+                self._error(f"Stack write at {address:#04x} aliases {location:#04x}")
+            self.stack[location] = data & 0xFFFF
+
+    async def _watch_writes(self, clock, buses):
+        enables = [we for _, we, _, _ in buses]
+        while True:
+            if not any(int(we.value) for we in enables):
+                await First(*(we.value_change for we in enables))
+                continue
+            #The memories write at the rising edge of their clock
+            await RisingEdge(clock)
+            for memory, we, add, din in buses:
+                if int(we.value):
+                    self._write(memory, add.value.to_unsigned(), din.value.to_unsigned())
+
+    async def _watch_addresses(self):
+        nano = self.nano
+        buses = (("ROM", nano.cpu2rom_add, lambda a: not is_rom_address(a)),
+                 ("RAM", nano.cpu2ram_add, lambda a: a >= RAM_SIZE),
+                 ("Stack", nano.cpu2stk_add, lambda a: a >= STACK_SIZE))
+        last = [None] * len(buses)
+        while True:
+            await First(*(bus.value_change for _, bus, _ in buses))
+            await ReadOnly()
+            if not int(nano.MODE.value):
+                continue    #MODE=0: the buses of slave_spi4nano are used
+            for i, (memory, bus, outside) in enumerate(buses):
+                value = bus.value
+                address = value.to_unsigned() if value.is_resolvable else None
+                if address != last[i] and address is not None and outside(address):
+                    self._error(f"{memory} address {address:#05x} on the CPU bus")
+                last[i] = address
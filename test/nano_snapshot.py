@@ -0,0 +1,76 @@
+#nano_snapshot.py
+#=============================================================================
+# Lectura de State_reg, R_reg y F_reg por los pines OUT8B/OUT4B
+#=============================================================================
+#
+# NanoSnapshot sweeps OUT_CTRL (ui[2:0]) and assembles the registers shown on
+# OUT8B (uo_out) and OUT4B (uio_out[3:0]) in one call, only through the pins,
+# so it works on the RTL, on the gate level netlist and on silicon:
+#
+#     snapshot = NanoSnapshot(dut, clk_period=10, unit="us")
+#     regs = await snapshot.read()      #{"state": ..., "R": ..., "F": ...}
+#
+# The mux of Nano_mcsys_4Tiny is combinational: the state is read with
+# OUT_CTRL=0 and R and F with OUT_CTRL 4..7 (OUT_CTRL 1..3 only repeat
+# nibbles of R), five settings that are swept `settle` apart in the low half
+# of one clock, without any clock edge, so the snapshot is coherent as long as
+# the five fit in half a clock (the default settle is 1/16 of the period).
+#
+# With the observation latch of the RTL (make OUT_LATCH=1) R and F of
+# OUT_CTRL 4..7 are the copy taken in the last clock with OUT_CTRL 0..3:
+# read() lets one rising edge pass after reading the state (always read in
+# the low half of the clock), and then the four reads of R and F can take any
+# time (`settle` of several clocks, as from a
+# slow host) while the CPU runs. `sampled` keeps the simulation time (steps)
+# at which the state was read; the snapshot is the value of the registers at
+# that time.
+#
+# OUT_CTRL is left as it was and the other bits of ui_in are not changed.
+#=============================================================================
+
+from cocotb.triggers import FallingEdge, Timer
+from cocotb.utils import get_sim_steps, get_sim_time
+
+from nano_isa import rtl_option
+from nano_pins import MSK_OUT4B, MSK_OUT_CTRL, MSK_OUT_CTRL_TO_0
+
+
+class NanoSnapshot:
+    """State, R and F of the Nano CPU from the OUT_CTRL mux of the pins."""
+
+    def __init__(self, dut, clk_period=10, unit="us", settle=None, latched=None):
+        self.dut = dut
+        period = get_sim_steps(clk_period, unit)
+        self.settle = settle if settle is not None else max(1, period // 16)
+        #The state is read before the next rising edge in both cases
+        self._state_settle = min(self.settle, max(1, period // 16))
+        self.latched = latched if latched is not None else bool(rtl_option("OUT_LATCH"))
+        if not self.latched and 5 * self.settle >= period // 2:
+            raise ValueError(f"settle of {self.settle} steps does not fit 5 reads in half a clock")
+        self.sampled = None
+
+    async def _show(self, ui, ctrl, settle):
+        self.dut.ui_in.value = ui | ctrl
+        await Timer(settle, "step")
+        return self.dut.uo_out.value.to_unsigned(), self.dut.uio_out.value.to_unsigned() & MSK_OUT4B
+
+    async def read(self):
+        """Sweep OUT_CTRL and return {"state", "R", "F"}."""
+        dut = self.dut
+        await FallingEdge(dut.clk)
+        ui = dut.ui_in.value.to_unsigned()
+        self.sampled = get_sim_time("step")
+        state, _ = await self._show(ui & MSK_OUT_CTRL_TO_0, 0, self._state_settle)
+        if self.latched:
+            #The rising edge takes R and F of the state just read
+            await FallingEdge(dut.clk)
+        R = F = 0
+        for ctrl in (4, 5, 6, 7):
+            out8b, out4b = await self._show(ui & MSK_OUT_CTRL_TO_0, ctrl, self.settle)
+            R |= out8b << 8 * (ctrl - 4)
+            if ctrl == 4 or ctrl == 6:
+                F |= out4b << (4 if ctrl == 6 else 0)
+        dut.ui_in.value = (dut.ui_in.value.to_unsigned() & MSK_OUT_CTRL_TO_0) | (ui & MSK_OUT_CTRL)
+        #OUT_CTRL back on the pins before returning, for the waits on uo_out
+        await Timer(self._state_settle, "step")
+        return {"state": state, "R": R, "F": F}
@@ -0,0 +1,439 @@
+#nano_spi.py
+#=============================================================================
+# Master SPI para Cocotb compatible con el componente slave_spi4nano
+#=============================================================================
+#
+#    |-------------------------------|
+#    |         4 Bytes SPI word      |
+#    |-------------------------------|
+#    | RW  |  Address  |     Data    |
+#    | bit |   bits    |     bits    |
+#    |-----|-----------|-------------|
+#    | b31 | [b30:b16] |  [b15:b00]  |
+#    |-----|-----------|-------------|
+#
+#     SPI 15 bits address map:
+#
+#     -----+-----------+----------
+#    0x0000|           |
+#          |  CPU ROM  |   SPI
+#    0x0FFF|           |   Code
+#     -----|-----------|   space
+#          | Reserved  |
+#    0x3FFF|           |
+#     -----|-----------|---------
+#    0x4000|           |
+#          |  CPU RAM  |   SPI
+#    0x47FF|           |   Data
+#     -----|-----------|   space
+#          | Reserved  |
+#    0x7FFF|           |
+#     -----|-----------|---------
+#
+# Burst commands set bit 13 of the address (SPI_BURST: 0x2000-0x2FFF code,
+# 0x6000-0x67FF data). The 32 bits frame is then only the header of a burst
+# that goes on while CS stays low, with one 16 bits word per location after
+# the first one (two code bytes per word, the lower address in [15:8]):
+#
+#     write:  header+word 0 | word 1 | word 2 | ... CS high
+#     read:   header | CS high | header+word 0 | word 1 | ... CS high
+#
+# The response frame of a single read can carry the next read command (single
+# or burst), so read_pipelined() spends n+1 frames in n single reads instead
+# of 2n; SPI_DUMMY (MOSI high) ends the chain:
+#
+#     read:   cmd 0 | CS high | resp 0 + cmd 1 | CS high | resp 1 + dummy
+#
+# Between the words of a burst SCK stays high for `burst_gap` extra clk
+# cycles, while the slave accesses the memory, and after a burst frame (or
+# a burst read command) CS stays high for them too.
+#
+# The slave samples SCK with the system clock, so SCK can not be faster than
+# f_sck = clk/8 (see Nano_spi.v). The master keeps SCK low and high for half
+# of that period each, changes MOSI together with the SCK falling edge and
+# samples MISO just before the SCK rising edge. All pin changes are made at
+# falling edges of clk, far from the edges where the slave samples the pins,
+# and a single simulator wake-up is spent per SCK half period.
+#
+# NanoSpiTbMaster has the same commands and pin timing, but the bits of each
+# frame are shifted by the SPI master of tb.v: Python only writes the frame
+# word, starts it and wakes when it is done (one wake-up per frame and per
+# word of a burst), and reads the MISO word shifted in by tb.v:
+#
+#     spi = NanoSpiTbMaster(dut, clk_period=10, unit="us")
+#     await spi.load(image.rom, image.ram)
+#     word = await spi.read_ram(0x10)
+#=============================================================================
+
+from cocotb.triggers import ClockCycles, FallingEdge, RisingEdge, Timer
+
+from nano_pins import (
+    MSK_SPI_CS_TO_ON,
+    MSK_SPI_MISO,
+    MSK_SPI_MOSI_TO_ON,
+    MSK_SPI_SCK_TO_ON,
+    SPI_IDLE,
+)
+
+SPI_ROM_BASE = 0x0000
+SPI_ROM_SIZE = 0x1000
+SPI_RAM_BASE = 0x4000
+SPI_RAM_SIZE = 0x0800
+
+SPI_READ = 1 << 31
+SPI_BURST = 0x2000
+SPI_DUMMY = 0xFFFFFFFF
+
+#Shortest run of locations read by a burst in dump()/verify() (shorter runs
+#are single reads chained in the response frames)
+BURST_MIN = 4
+
+_SPI_PINS = MSK_SPI_SCK_TO_ON | MSK_SPI_MOSI_TO_ON | MSK_SPI_CS_TO_ON
+
+
+def spi_word(address, data=0, read=False):
+    """Build the 32 bits SPI command word for slave_spi4nano."""
+    if not 0 <= address <= 0x7FFF:
+        raise ValueError(f"SPI address out of range: {address:#x}")
+    if not 0 <= data <= 0xFFFF:
+        raise ValueError(f"SPI data out of range: {data:#x}")
+    return (SPI_READ if read else 0) | (address << 16) | data
+
+
+class NanoSpiMaster:
+    """Drive the SPI pins of tt_um_galaguna_NanoSys_fit from cocotb.
+
+    ``clk_period``/``unit`` must match the Clock that drives ``dut.clk``.
+    ``sck_div`` is the SCK period in clk cycles (8 is the fastest the slave
+    supports), ``cs_gap`` the clk cycles CS is held high after a frame (the
+    next one starts at the following falling edge of clk) and ``burst_gap``
+    the extra clk cycles SCK is held high between the words of a burst (8 is
+    the least the slave supports).
+    """
+
+    def __init__(self, dut, clk_period=10, unit="us", sck_div=8, cs_gap=4, burst_gap=8):
+        if sck_div < 8 or sck_div % 2:
+            raise ValueError("sck_div must be an even number >= 8 (f_sck <= clk/8)")
+        if burst_gap < 8:
+            raise ValueError("burst_gap must be >= 8 clk cycles")
+        if cs_gap < 1:
+            raise ValueError("cs_gap must be >= 1 clk cycle")
+        self.dut = dut
+        self.unit = unit
+        self.half_period = clk_period * sck_div / 2
+        self.cs_gap = cs_gap
+        self.burst_gap = burst_gap
+        self.frames = 0
+
+    def _ui(self):
+        return self.dut.ui_in.value.to_unsigned()
+
+    async def idle(self, cycles=16):
+        """Put the SPI pins in the idle state and wait some clk cycles."""
+        self.dut.ui_in.value = self._ui() | SPI_IDLE
+        await ClockCycles(self.dut.clk, cycles)
+
+    async def _gap(self, cycles):
+        #`cycles` falling edges of clk after the one of the last pin change:
+        #that edge is the time step of a Timer, so the count starts at the
+        #rising edge that follows it
+        await RisingEdge(self.dut.clk)
+        await ClockCycles(self.dut.clk, cycles, FallingEdge)
+
+    async def _shift(self, ui, word, nbits, sample):
+        #Bits of one word with CS low, ending with SCK high
+        dut = self.dut
+        half = Timer(self.half_period, self.unit)
+        miso = 0
+        for i in range(nbits - 1, -1, -1):
+            #SCK falling edge with the new MOSI bit (CS low):
+            low = ui | (MSK_SPI_MOSI_TO_ON if (word >> i) & 1 else 0)
+            dut.ui_in.value = low
+            await half
+            if sample:
+                miso = (miso << 1) | (1 if dut.uio_out.value.to_unsigned() & MSK_SPI_MISO else 0)
+            #SCK rising edge:
+            dut.ui_in.value = low | MSK_SPI_SCK_TO_ON
+            await half
+        return miso
+
+    async def transfer(self, word, nbits=32, sample=False, words=()):
+        """Shift out one frame (MSB first) and return the word seen on MISO.
+
+        MISO is only sampled if ``sample`` is set, which spares one signal
+        read per bit for the write commands. The 16 bits ``words`` of a burst
+        follow the first word with CS low; then a list with the MISO words of
+        the whole frame is returned.
+        """
+        dut = self.dut
+        await FallingEdge(dut.clk)
+        ui = self._ui() & ~_SPI_PINS
+        miso = [await self._shift(ui, word, nbits, sample)]
+        for extra in words:
+            await self._gap(self.burst_gap)
+            miso.append(await self._shift(ui, extra, 16, sample))
+        #Master SPI final values:
+        dut.ui_in.value = ui | SPI_IDLE
+        burst = words or word & (SPI_BURST << 16)
+        await self._gap(self.cs_gap + (self.burst_gap if burst else 0))
+        self.frames += 1
+        return miso if words else miso[0]
+
+    async def write_word(self, address, data):
+        """Write command: one frame."""
+        await self.transfer(spi_word(address, data))
+
+    async def read_word(self, address):
+        """Read command: one command frame plus one response frame."""
+        await self.transfer(spi_word(address, read=True))
+        response = await self.transfer(SPI_DUMMY, sample=True)
+        if (response >> 16) != (SPI_READ >> 16) | address:
+            raise RuntimeError(
+                f"Unexpected SPI response header {response >> 16:#06x} for address {address:#06x}"
+            )
+        return response & 0xFFFF
+
+    async def write_rom(self, address, byte):
+        """Write one byte in the CPU code space."""
+        if not 0 <= address < SPI_ROM_SIZE:
+            raise ValueError(f"ROM address out of range: {address:#x}")
+        await self.write_word(SPI_ROM_BASE + address, byte & 0xFF)
+
+    async def write_ram(self, address, word):
+        """Write one 16 bits word in the CPU data space."""
+        if not 0 <= address < SPI_RAM_SIZE:
+            raise ValueError(f"RAM address out of range: {address:#x}")
+        await self.write_word(SPI_RAM_BASE + address, word)
+
+    async def read_rom(self, address):
+        if not 0 <= address < SPI_ROM_SIZE:
+            raise ValueError(f"ROM address out of range: {address:#x}")
+        return (await self.read_word(SPI_ROM_BASE + address)) & 0xFF
+
+    async def read_ram(self, address):
+        if not 0 <= address < SPI_RAM_SIZE:
+            raise ValueError(f"RAM address out of range: {address:#x}")
+        return await self.read_word(SPI_RAM_BASE + address)
+
+    #-------------------------------------------------------------------------
+    # Burst commands
+    #-------------------------------------------------------------------------
+    async def write_burst(self, address, words):
+        """Write burst: consecutive 16 bits words from `address`, in one frame."""
+        words = list(words)
+        if words:
+            await self.transfer(spi_word(SPI_BURST | address, words[0]), words=words[1:])
+
+    async def read_burst(self, address, count):
+        """Read burst: `count` consecutive 16 bits words from `address`."""
+        if count <= 0:
+            return []
+        header = (SPI_READ >> 16) | SPI_BURST | address
+        await self.transfer(spi_word(SPI_BURST | address, read=True))
+        response = await self.transfer(SPI_DUMMY, sample=True, words=[0xFFFF] * (count - 1))
+        if count == 1:
+            response = [response]
+        if (response[0] >> 16) != header:
+            raise RuntimeError(
+                f"Unexpected SPI response header {response[0] >> 16:#06x} for address {address:#06x}"
+            )
+        return [response[0] & 0xFFFF] + response[1:]
+
+    async def write_rom_bytes(self, start, data):
+        """Consecutive code bytes, two per word of one burst."""
+        data = [byte & 0xFF for byte in data]
+        if not 0 <= start <= start + len(data) <= SPI_ROM_SIZE:
+            raise ValueError(f"ROM range out of range: {start:#x}+{len(data)}")
+        await self.write_burst(SPI_ROM_BASE + start, [(data[i] << 8) | data[i + 1]
+                                                      for i in range(0, len(data) - 1, 2)])
+        if len(data) % 2:
+            await self.write_rom(start + len(data) - 1, data[-1])
+
+    async def write_ram_words(self, start, words):
+        """Consecutive data words in one burst."""
+        words = list(words)
+        if not 0 <= start <= start + len(words) <= SPI_RAM_SIZE:
+            raise ValueError(f"RAM range out of range: {start:#x}+{len(words)}")
+        await self.write_burst(SPI_RAM_BASE + start, words)
+
+    async def read_rom_bytes(self, start, count):
+        if not 0 <= start <= start + count <= SPI_ROM_SIZE:
+            raise ValueError(f"ROM range out of range: {start:#x}+{count}")
+        words = await self.read_burst(SPI_ROM_BASE + start, (count + 1) // 2)
+        return [b for word in words for b in (word >> 8, word & 0xFF)][:count]
+
+    async def read_ram_words(self, start, count):
+        if not 0 <= start <= start + count <= SPI_RAM_SIZE:
+            raise ValueError(f"RAM range out of range: {start:#x}+{count}")
+        return await self.read_burst(SPI_RAM_BASE + start, count)
+
+    #-------------------------------------------------------------------------
+    # Pipelined reads, dump and verification
+    #-------------------------------------------------------------------------
+    async def read_pipelined(self, reads):
+        """Read commands back to back: `reads` are (SPI address, count) pairs,
+        a burst when count > 1.
+
+        Every command after a single read is sent in the response frame of
+        that read; a burst response can not carry one, so the command after a
+        burst takes a frame of its own. Returns the list of words of every read.
+        """
+        reads = list(reads)
+        results = []
+        pending = None    #(address, count) whose response is the next frame
+        for read in reads + [None]:
+            if read is not None:
+                address, count = read
+                if count <= 0:
+                    raise ValueError(f"SPI read of {count} words at {address:#06x}")
+                word = spi_word(SPI_BURST | address if count > 1 else address, read=True)
+            else:
+                word = SPI_DUMMY
+            if pending is None:
+                if read is not None:
+                    await self.transfer(word)
+            elif pending[1] == 1:
+                results.append(self._check_response(pending, [await self.transfer(word, sample=True)]))
+            else:
+                response = await self.transfer(SPI_DUMMY, sample=True, words=[0xFFFF] * (pending[1] - 1))
+                results.append(self._check_response(pending, response))
+                if read is not None:
+                    await self.transfer(word)
+            pending = read
+        return results
+
+    @staticmethod
+    def _check_response(read, response):
+        address, count = read
+        header = (SPI_READ >> 16) | (SPI_BURST if count > 1 else 0) | address
+        if (response[0] >> 16) != header:
+            raise RuntimeError(
+                f"Unexpected SPI response header {response[0] >> 16:#06x} for address {address:#06x}"
+            )
+        return [response[0] & 0xFFFF] + response[1:]
+
+    async def read_words(self, addresses):
+        """Single reads of SPI addresses, chained in the response frames."""
+        return [words[0] for words in await self.read_pipelined((address, 1) for address in addresses)]
+
+    async def dump(self, rom=(), ram=()):
+        """Read ranges ((start, count) pairs) of the code and data spaces.
+
+        Runs of at least BURST_MIN locations are read by bursts and the shorter
+        ones by chained single reads, all in one pipeline. Returns the
+        {address: byte} of the code and the {address: word} of the data.
+        """
+        reads, places = [], []
+        for space, ranges, base, size in (("rom", rom, SPI_ROM_BASE, SPI_ROM_SIZE),
+                                          ("ram", ram, SPI_RAM_BASE, SPI_RAM_SIZE)):
+            for start, count in ranges:
+                if not 0 <= start <= start + count <= size:
+                    raise ValueError(f"{space.upper()} range out of range: {start:#x}+{count}")
+                if count >= BURST_MIN:
+                    words = (count + 1) // 2 if space == "rom" else count
+                    reads.append((base + start, words))
+                    places.append((space, start, count))
+                else:
+                    for address in range(start, start + count):
+                        reads.append((base + address, 1))
+                        places.append((space, address, 1))
+        code, data = {}, {}
+        for (space, start, count), words in zip(places, await self.read_pipelined(reads)):
+            if space == "ram":
+                data.update(zip(range(start, start + count), words))
+            elif count == 1:
+                code[start] = words[0] & 0xFF
+            else:
+                values = [b for word in words for b in (word >> 8, word & 0xFF)]
+                code.update(zip(range(start, start + count), values))
+        return code, data
+
+    async def verify(self, rom=None, ram=None):
+        """Read back code and data images ({address: value}) and return the
+        ranges that differ, as (space, start, stop) with space "rom" or "ram"
+        and stop excluded; an empty list when the memories match.
+        """
+        rom, ram = rom or {}, ram or {}
+        code, data = await self.dump(rom=[(start, len(run)) for start, run in _runs(rom)],
+                                     ram=[(start, len(run)) for start, run in _runs(ram)])
+        mismatches = []
+        for space, image, read in (("rom", rom, code), ("ram", ram, data)):
+            for address in sorted(image):
+                if read[address] == image[address]:
+                    continue
+                if mismatches and mismatches[-1][0] == space and mismatches[-1][2] == address:
+                    mismatches[-1] = (space, mismatches[-1][1], address + 1)
+                else:
+                    mismatches.append((space, address, address + 1))
+        return mismatches
+
+    async def load(self, rom=None, ram=None):
+        """Write code and data images ({address: value}), one burst per run of addresses."""
+        for start, run in _runs(rom or {}):
+            await self.write_rom_bytes(start, run)
+        for start, run in _runs(ram or {}):
+            await self.write_ram_words(start, run)
+
+
+class NanoSpiTbMaster(NanoSpiMaster):
+    """NanoSpiMaster whose frames are shifted by the SPI master of tb.v.
+
+    Python writes the word in spim_frame, pulses spim_start and waits for
+    spim_done: one wake-up per frame (and per word of a burst) instead of one
+    per SCK half period, with the same pins at the same clocks as
+    NanoSpiMaster, so all its commands work unchanged. MISO is always
+    sampled, in spim_miso. tb.v owns SCK, MOSI and CS from the start of a
+    frame to its end, also between the words of a burst, so Python must not
+    write ui_in then; ui_in gets the idle pins the frame leaves when its
+    last word starts.
+    """
+
+    def __init__(self, dut, clk_period=10, unit="us", sck_div=8, cs_gap=4, burst_gap=8):
+        super().__init__(dut, clk_period, unit, sck_div, cs_gap, burst_gap)
+        if sck_div // 2 > 0xFF or cs_gap + burst_gap > 0xFF:
+            raise ValueError("sck_div, cs_gap and burst_gap do not fit the counters of tb.v")
+        self._set = {}
+        self._write("spim_half", sck_div // 2)
+
+    def _write(self, name, value):
+        #Control registers of tb.v are only written when they change
+        if self._set.get(name) != value:
+            getattr(self.dut, name).value = value
+            self._set[name] = value
+
+    async def _frame(self, word, nbits, pre, post, hold):
+        dut = self.dut
+        self._write("spim_bits", nbits)
+        self._write("spim_pre", pre)
+        self._write("spim_post", post)
+        self._write("spim_hold", hold)
+        dut.spim_frame.value = word
+        dut.spim_start.value = 1
+        if not hold:
+            #The pins the frame leaves, for when tb.v gives them back
+            dut.ui_in.value = self._ui() | SPI_IDLE
+        await RisingEdge(dut.spim_done)
+        return dut.spim_miso.value.to_unsigned() & ((1 << nbits) - 1)
+
+    async def transfer(self, word, nbits=32, sample=False, words=()):
+        #The master of tb.v starts at the next falling edge of clk, the one
+        #NanoSpiMaster waits for, and counts spim_pre from the end of the
+        #previous word of the burst
+        burst = words or word & (SPI_BURST << 16)
+        post = self.cs_gap + (self.burst_gap if burst else 0)
+        miso = [await self._frame(word, nbits, 0, post, bool(words))]
+        for i, extra in enumerate(words):
+            miso.append(await self._frame(extra, 16, self.burst_gap, post, i < len(words) - 1))
+        self.frames += 1
+        return miso if words else miso[0]
+
+
+def _runs(image):
+    #(start, [values]) of the runs of consecutive addresses of an image
+    runs = []
+    for address, value in sorted(image.items()):
+        if runs and runs[-1][0] + len(runs[-1][1]) == address:
+            runs[-1][1].append(value)
+        else:
+            runs.append((address, [value]))
+    return runs
@@ -0,0 +1,80 @@
+#nano_waits.py
+#=============================================================================
+# Esperas por eventos (sin muestreo en cada reloj) sobre el estado del CPU Nano
+#=============================================================================
+#
+# The waits sleep on the value-change trigger of the watched signal (uo_out by
+# default, which shows state_reg while OUT_CTRL is 0..3) and on one Timer for
+# the timeout, so Python only wakes when the state changes and long programs
+# run at the speed of the simulator. Waits return the clocks they lasted
+# (rounded up) and leave in `cycle` the clock of the event, counted from the
+# creation of the NanoWaits object:
+#
+#     waits = NanoWaits(dut, clk_period=10, unit="us")
+#     await waits.wait_state(0x02, timeout_cycles=100)   #Fetch-decode state
+#     clocks = await waits.wait_until_stop(timeout_cycles=10**6)
+#
+# A timeout raises RuntimeError with the last value seen.
+#=============================================================================
+
+from cocotb.triggers import First, ReadOnly, Timer
+from cocotb.utils import get_sim_steps, get_sim_time
+
+STOP_STATE = 0x00
+
+
+class NanoWaits:
+    """Event-driven waits on the state of the Nano CPU."""
+
+    def __init__(self, dut, clk_period=10, unit="us", signal=None):
+        self.dut = dut
+        self.signal = signal if signal is not None else dut.uo_out
+        self.period = get_sim_steps(clk_period, unit)
+        self.origin = get_sim_time("step")
+        self.cycle = self.now()
+
+    def now(self):
+        """Clocks elapsed since this object was created (rounded up)."""
+        return -(-(get_sim_time("step") - self.origin) // self.period)
+
+    def value(self):
+        value = self.signal.value
+        return value.to_unsigned() if value.is_resolvable else None
+
+    async def _wait(self, condition, timeout_cycles, what):
+        start = get_sim_time("step")
+        deadline = start + timeout_cycles * self.period if timeout_cycles is not None else None
+        #The first sample after the writes of this time step (OUT_CTRL ...) are applied
+        await ReadOnly()
+        value = first = self.value()
+        waited = False
+        while not condition(value, first):
+            waited = True
+            change = self.signal.value_change
+            if deadline is None:
+                await change
+            else:
+                remaining = deadline - get_sim_time("step")
+                if remaining <= 0 or isinstance(await First(change, Timer(remaining, "step")), Timer):
+                    raise RuntimeError(f"{what} not seen in {timeout_cycles} cycles ({self.signal._name}={value})")
+            value = self.value()
+        self.cycle = self.now()
+        clocks = -(-(get_sim_time("step") - start) // self.period)
+        if not waited:
+            #Out of the ReadOnly phase, so the caller can drive the pins
+            await Timer(1, "step")
+        return clocks, value
+
+    async def wait_state(self, value, timeout_cycles=None):
+        """Wait until the signal equals `value`, return the clocks waited."""
+        clocks, _ = await self._wait(lambda v, first: v == value, timeout_cycles, f"state {value:#04x}")
+        return clocks
+
+    async def wait_state_change(self, timeout_cycles=None):
+        """Wait until the signal leaves its current value, return the new one."""
+        _, value = await self._wait(lambda v, first: v != first, timeout_cycles, "state change")
+        return value
+
+    async def wait_until_stop(self, timeout_cycles=None):
+        """Wait for the stop state, return the clocks waited."""
+        return await self.wait_state(STOP_STATE, timeout_cycles)
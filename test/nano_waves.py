@@ -0,0 +1,208 @@
+#nano_waves.py
+#=============================================================================
+# Control del volcado de formas de onda de tb.v desde Cocotb
+#=============================================================================
+#
+# tb.v only opens tb.fst when scopes are selected at run time (make DUMP=...):
+#
+#     all   the whole testbench ($dumpvars(0, tb))
+#     io    the pins of tb
+#     cpu   the registers and buses of my_cpu
+#     spi   my_NanoSPI
+#     mem   the four sync_ram (RAM, stack and both ROMs)
+#     on    dump from time 0 (otherwise dumping starts off)
+#
+# NanoWaves switches the dump on and off through the `dump_en` register of
+# tb.v, at given clocks or when the CPU enters a state:
+#
+#     waves = NanoWaves(dut)
+#     cocotb.start_soon(waves.window(start_cycle=500, cycles=200))
+#     cocotb.start_soon(waves.on_state(0x5A, cycles=100))   #ini_iss
+#
+# NanoRingDump keeps in memory only the last `cycles` clocks of a few signals
+# (the pins and the main registers of my_cpu by default), sampled on their
+# value changes, and writes them as a VCD file when a test fails:
+#
+#     ring = NanoRingDump(dut, cycles=2000)
+#     ring.start()
+#     with ring.on_failure("tb_last.vcd"):
+#         ... test body ...
+#=============================================================================
+
+import contextlib
+from collections import deque
+
+import cocotb
+from cocotb.handle import LogicArrayObject, LogicObject
+from cocotb.triggers import ClockCycles
+from cocotb.utils import get_sim_steps, get_sim_time, get_time_from_sim_steps
+
+from nano_waits import NanoWaits
+
+#Signals kept by NanoRingDump when none are given (relative to tb):
+RING_SIGNALS = (
+    "ui_in", "uo_out", "uio_in", "uio_out",
+    "user_project.my_NanoSys.my_cpu.state_reg",
+    "user_project.my_NanoSys.my_cpu.IP_reg",
+    "user_project.my_NanoSys.my_cpu.instruction_reg",
+    "user_project.my_NanoSys.my_cpu.A_reg",
+    "user_project.my_NanoSys.my_cpu.B_reg",
+    "user_project.my_NanoSys.my_cpu.R_reg",
+    "user_project.my_NanoSys.my_cpu.ACC_reg",
+    "user_project.my_NanoSys.my_cpu.F_reg",
+    "user_project.my_NanoSys.my_cpu.SP_reg",
+)
+
+
+class NanoWaves:
+    """Switches the waveform dump of tb.v on and off."""
+
+    def __init__(self, dut, clk_period=10, unit="us"):
+        self.dut = dut
+        self.clk_period = clk_period
+        self.unit = unit
+        self.scopes = sorted(name[len("dump_"):] for name in cocotb.plusargs
+                             if name.startswith("dump_") and name != "dump_on")
+
+    def on(self):
+        self.dut.dump_en.value = 1
+
+    def off(self):
+        self.dut.dump_en.value = 0
+
+    async def window(self, start_cycle, cycles):
+        """Dump from `start_cycle` clocks from now, during `cycles` clocks."""
+        if start_cycle:
+            await ClockCycles(self.dut.clk, start_cycle)
+        self.on()
+        await ClockCycles(self.dut.clk, cycles)
+        self.off()
+
+    async def on_state(self, state, cycles=None, timeout_cycles=None):
+        """Dump from the clock the CPU enters `state`, during `cycles` clocks (or on)."""
+        cpu = self.dut.user_project.my_NanoSys.my_cpu
+        waits = NanoWaits(self.dut, self.clk_period, self.unit, signal=cpu.state_reg)
+        await waits.wait_state(state, timeout_cycles)
+        self.on()
+        if cycles is not None:
+            await ClockCycles(self.dut.clk, cycles)
+            self.off()
+
+
+def _signals(dut, items):
+    #Handles from names relative to tb, handles, or scopes (their direct signals)
+    signals = []
+    for item in items:
+        if isinstance(item, str):
+            handle = dut
+            for part in item.split("."):
+                handle = getattr(handle, part)
+            item = handle
+        if isinstance(item, (LogicObject, LogicArrayObject)):
+            signals.append(item)
+        else:
+            signals += [h for h in item if isinstance(h, (LogicObject, LogicArrayObject))]
+    return signals
+
+
+class NanoRingDump:
+    """Last `cycles` clocks of some signals, written as VCD on demand."""
+
+    def __init__(self, dut, signals=RING_SIGNALS, cycles=1000, clk_period=10, unit="us"):
+        self.dut = dut
+        self.signals = _signals(dut, signals)
+        self.cycles = cycles
+        self.span = cycles * get_sim_steps(clk_period, unit)
+        self._first = {}
+        self._events = {}
+        self._tasks = []
+
+    def start(self):
+        now = get_sim_time("step")
+        for handle in self.signals:
+            self._first[handle._path] = (now, str(handle.value))
+            self._events[handle._path] = deque()
+        self._tasks = [cocotb.start_soon(self._record(handle)) for handle in self.signals]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _record(self, handle):
+        events = self._events[handle._path]
+        while True:
+            await handle.value_change
+            now = get_sim_time("step")
+            events.append((now, str(handle.value)))
+            #Older changes only give the value at the start of the window
+            while len(events) > 1 and events[0][0] < now - self.span:
+                self._first[handle._path] = events.popleft()
+
+    def write(self, path):
+        """Write the recorded window as a VCD file."""
+        end = get_sim_time("step")
+        start = max(end - self.span, min(t for t, _ in self._first.values()))
+        ids = {}
+        lines = ["$timescale 1ps $end"]
+        tree = {}
+        for handle in self.signals:
+            node = tree
+            scopes = handle._path.split(".")
+            for scope in scopes[:-1]:
+                node = node.setdefault(scope, {})
+            node[scopes[-1]] = handle
+        self._vcd_scope(tree, ids, lines)
+        lines.append("$enddefinitions $end")
+
+        changes = []
+        for handle in self.signals:
+            name = handle._path
+            first = self._first[name][1]
+            later = []
+            for t, v in self._events[name]:
+                if t <= start:
+                    first = v
+                else:
+                    later.append((t, ids[name], v))
+            changes += [(start, ids[name], first)] + later
+        changes.sort(key=lambda change: change[0])
+        last = None
+        for time, ident, value in changes:
+            time = round(get_time_from_sim_steps(time, "ps"))
+            if time != last:
+                lines.append(f"#{time}")
+                last = time
+            lines.append(f"{value.lower()}{ident}" if len(value) == 1 else f"b{value.lower()} {ident}")
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def _vcd_scope(self, node, ids, lines):
+        for name, child in node.items():
+            if isinstance(child, dict):
+                lines.append(f"$scope module {name} $end")
+                self._vcd_scope(child, ids, lines)
+                lines.append("$upscope $end")
+            else:
+                ident = ids[child._path] = _vcd_id(len(ids))
+                lines.append(f"$var wire {len(str(child.value))} {ident} {name} $end")
+
+    @contextlib.contextmanager
+    def on_failure(self, path):
+        """Write the VCD file if the block raises (e.g. a failed assert)."""
+        try:
+            yield self
+        except Exception:
+            self.write(path)
+            self.dut._log.info(f"Last {self.cycles} clocks of {len(self.signals)} signals written to {path}")
+            raise
+
+
+def _vcd_id(n):
+    #Printable VCD identifiers: !, ", ..., ~, !!, ...
+    ident = ""
+    n += 1
+    while n:
+        n, digit = divmod(n - 1, 94)
+        ident += chr(33 + digit)
+    return ident
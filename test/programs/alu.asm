@@ -0,0 +1,65 @@
+; alu.asm
+; Sumas, acumulador, logicas, comparaciones y contadores (add_result,
+; log_result y cmp_result) con resultados guardados en RAM.
+
+        movka 0x7FFF
+        movkb 0x0001
+        uadd                ; overflow 16 bits
+        movrla
+        movam r0
+        sadd
+        movrha
+        movam r1
+        movka 0x8000
+        movkb 0x8000
+        sadd                ; catastrophic overflow 16
+        movrha
+        movam r2
+        movkb 0xFFFF
+        movbaccl
+        movbacch
+        movracc
+        ac                  ; ACC = R + ACC
+        movaccla
+        movam r3
+        movacchb
+        movbm r4
+        movka 0x1234
+        movaaccl
+        movaacch
+        ac
+        movka 0x00FF
+        movkb 0x0F0F
+        and
+        movrlb
+        or
+        movrla
+        xor
+        notb
+        nota
+        movrlb
+        movbm r5
+        movki 7
+        movkn 7
+        cmpin               ; Z16
+        movkj 3
+        movkm 9
+        cmpjm               ; negative
+        incir
+        incjr
+        decir
+        decjr
+        movira
+        movjra
+        movab
+        movba
+        stop
+
+        .data
+        .org 0x08
+r0:     .dw 0
+r1:     .dw 0
+r2:     .dw 0
+r3:     .dw 0
+r4:     .dw 0
+r5:     .dw 0
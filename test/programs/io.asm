@@ -0,0 +1,22 @@
+; io.asm
+; Puertos de E/S: int_ctrl (0: habilitaciones, 1: banderas) y un puerto sin
+; dispositivo.
+
+        outk 0x05, 0
+        ina 0
+        movam e0
+        movka 0x0002
+        outa 0
+        ina 0
+        movam e1
+        ina 1
+        movam e2
+        outk 0x33, 7
+        movka 0x77
+        outa 9
+        stop
+
+        .data
+e0:     .dw 0
+e1:     .dw 0
+e2:     .dw 0
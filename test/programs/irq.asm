@@ -0,0 +1,42 @@
+; irq.asm
+; Interrupciones: INT1 e INT2 disparadas por programa (banderas de int_ctrl)
+; e INT0 desde el pin EINT0, con reti que restaura F, R e IP.
+
+        .int0 isr0
+        .int1 isr1
+        .int2 isr2
+        outk 0x01, 0        ; EINT0 enabled
+        movka 0x7FFF
+        movkb 0x0001
+        sadd
+        outk 0x02, 1        ; INT1 by software
+        movka 0x1234
+        movkb 0x0002
+        umul
+        outk 0x04, 1        ; INT2 by software
+        movki 0
+        movkn 20
+loop:   incir
+        cmpin
+        jnz16 loop
+        movkn 0
+        movkm 0
+        movjra
+        movam hits
+        stop
+
+        .org 0xF80
+isr0:   incjr
+        outk 0x00, 1
+        reti
+isr1:   incjr
+        movka 0x1111
+        outk 0x00, 1
+        reti
+isr2:   incjr
+        incjr
+        outk 0x00, 1
+        reti
+
+        .data
+hits:   .dw 0
@@ -0,0 +1,84 @@
+; iss_check.asm
+; Programa de prueba para comparar NanoISS con el RTL: aritmetica, MAC,
+; corrimientos, logicas, direccionamiento indirecto, pila, E/S e INT0.
+
+        .int0 isr
+        outk 0x01, 0        ; EINT0 enabled
+        movka 0x8001
+        movkb 0x7FFE
+        sadd                ; R = A + B
+        jco16 bad
+        jnz16 over
+bad:    stop
+over:   movrlb
+        pusha
+        pushb
+        call sum4
+        popa
+        popb
+        movka 0x1234
+        movkb 0x0056
+        umac
+        movka 0xFFFD
+        movkb 0x0011
+        smac
+        movka 4
+        sraacc
+        movka 3
+        slacc
+        movrhm hi
+        movka 0xF0F0
+        movkb 0x0FF0
+        xor
+        movrla
+        and
+        nota
+        movrlb
+        movaipp dst
+        movbipp dst
+        movmmia dst
+        incmpm cnt
+        decmpm cnt
+        jz16 bad
+        lduspk 3
+        movsa
+        incusp
+        movbs
+        decusp
+        stouspb
+        ldusp
+        outk 0x5A, 2
+        outa 3
+        ina 0
+        movam res
+        stop
+
+sum4:   movki 0
+        movkn 4
+        movka 0
+loop:   movippb ptr
+        uadd
+        movrla
+        incir
+        cmpin
+        jnz16 loop
+        movam total
+        ret
+
+        .org 0xF80
+isr:    pusha
+        incjr
+        outk 0x00, 1        ; clear the interrupt flags
+        popa
+        reti
+
+        .data
+        .org 0x10
+ptr:    .dw table
+dst:    .dw 0x1C
+cnt:    .dw 7, 9
+hi:     .dw 0
+total:  .dw 0
+res:    .dw 0
+        .org 0x18
+table:  .dw 100, 200, 300, 400
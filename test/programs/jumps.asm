@@ -0,0 +1,53 @@
+; jumps.asm
+; Saltos condicionales tomados y no tomados sobre las 8 banderas, jmp y un
+; lazo contado con cmpin.
+
+        movka 0
+        movkb 0
+        uadd                ; Z16, Z32
+        jnz16 bad
+        jz16 j1
+        jmp bad
+j1:     jnz32 bad
+        jz32 j2
+        jmp bad
+j2:     movka 0x7FFF
+        movkb 0x0001
+        sadd                ; N16, F3
+        jp16 bad
+        jn16 j3
+        jmp bad
+j3:     jnco16 bad
+        jco16 j4
+        jmp bad
+j4:     movka 0xFFFF
+        movkb 0x0001
+        uadd                ; carry 16
+        jno16 bad
+        jo16 j5
+        jmp bad
+j5:     jn32 bad
+        jp32 j6
+        jmp bad
+j6:     jo32 bad
+        jno32 j7
+        jmp bad
+j7:     jco32 bad
+        jnco32 j8
+        jmp bad
+j8:     movki 0
+        movkn 5
+        movkj 0
+loop:   incjr
+        incir
+        cmpin
+        jnz16 loop
+        movjra
+        movam count
+        stop
+bad:    movka 0xBAD
+        movam count
+        stop
+
+        .data
+count:  .dw 0
@@ -0,0 +1,43 @@
+; mem.asm
+; Memoria de datos: acceso directo, indirecto, con pos-incremento y
+; pre-decremento, e incmpm/decmpm.
+
+        movma a0
+        movmb a1
+        uadd
+        movam b0
+        movbm b1
+        movrhm b2
+        movrlm b3           ; does not write (movrlm_exe is not in ramwe)
+        movai ptr
+        movbi ptr2
+        movrhi ptr
+        movrli ptr2
+        movia ptr
+        movib ptr2
+        movaipp ptr
+        movbipp ptr
+        movrlipp ptr
+        movrhipp ptr
+        movippa ptr2
+        movippb ptr2
+        movmmia ptr2
+        movmmib ptr2
+        incmpm a0
+        decmpm a1
+        decmpm a1
+        stop
+
+        .data
+a0:     .dw 0x1234
+a1:     .dw 0x0001
+b0:     .dw 0
+b1:     .dw 0
+b2:     .dw 0
+b3:     .dw 0
+ptr:    .dw buf
+ptr2:   .dw buf2
+        .org 0x10
+buf:    .dw 0, 0, 0, 0, 0, 0
+        .org 0x18
+buf2:   .dw 0xA1, 0xA2, 0xA3, 0xA4, 0xA5, 0xA6
@@ -0,0 +1,38 @@
+; mul.asm
+; Multiplicaciones y MAC con y sin signo (xmul_exe) con operandos positivos,
+; negativos y extremos.
+
+        movka 0xFFFF
+        movkb 0xFFFF
+        umul
+        movrla
+        movam p0
+        smul
+        movrha
+        movam p1
+        movka 0x8000
+        movkb 0x8000
+        smul
+        movracc
+        movka 0x8000
+        movkb 0x7FFF
+        smac
+        movaccha
+        movam p2
+        movka 0x1234
+        movkb 0x5678
+        umac
+        movkb 0xFFFE
+        smac
+        movka 0
+        umul
+        movacclb
+        movbm p3
+        stop
+
+        .data
+        .org 0x04
+p0:     .dw 0
+p1:     .dw 0
+p2:     .dw 0
+p3:     .dw 0
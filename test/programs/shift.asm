@@ -0,0 +1,34 @@
+; shift.asm
+; Corrimientos del acumulador (sxacc_exe): logico y aritmetico a la derecha y
+; a la izquierda, con cuentas 0, 1, 15 y 33.
+
+        movka 0x8421
+        movaacch
+        movkb 0x1248
+        movbaccl
+        movka 0
+        sracc
+        movka 1
+        sracc
+        movrha
+        movam s0
+        movka 15
+        sraacc
+        movrlb
+        movbm s1
+        movka 33
+        slacc
+        movka 4
+        slacc
+        movracc
+        movka 1
+        sraacc
+        movrha
+        movam s2
+        stop
+
+        .data
+        .org 0x02
+s0:     .dw 0
+s1:     .dw 0
+s2:     .dw 0
@@ -0,0 +1,48 @@
+; stack.asm
+; Pila del CPU: push/pop de todos los registros, call/ret anidados y acceso por
+; USP (movas, movsa, ...).
+
+        movka 0x1111
+        movkb 0x2222
+        movki 0x3333
+        movkj 0x4444
+        movkn 0x5555
+        movkm 0x6666
+        pusha
+        pushb
+        pushi
+        pushj
+        pushn
+        pushm
+        call f1
+        popa
+        popb
+        popi
+        popj
+        popn
+        popm
+        stospa
+        stospb
+        ldusp
+        decusp
+        movsa
+        movrls
+        movrhs
+        incusp
+        movas
+        movbs
+        lduspk 9
+        stouspa
+        lduspa
+        lduspb
+        lduspr
+        stouspb
+        movsb
+        stop
+
+f1:     movka 0xAAAA
+        call f2
+        ret
+f2:     movkb 0xBBBB
+        uadd
+        ret
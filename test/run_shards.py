@@ -0,0 +1,203 @@
+#run_shards.py
+#=============================================================================
+# Ejecucion de la regresion de Cocotb en paralelo, repartida en shards
+#=============================================================================
+#
+# The tests of test.py are split in shards that run as separate simulator
+# processes (one `make` each, with COCOTB_TEST_FILTER selecting the shard):
+#
+#  1. The simulator is compiled once in sim_build/<rtl|gl>.
+#  2. Every shard gets its own SIM_BUILD (a copy of the compiled image, with
+#     timestamps newer than the sources so make does not compile it again),
+#     results file and waveform file.
+#  3. The shard results are merged in results.xml, so the CI check
+#     `! grep failure results.xml` works as with a plain `make`.
+#
+#     python run_shards.py [-j JOBS] [-n SHARDS] [make variables...]
+#     python run_shards.py -j 8 SIM=verilator
+#
+# Tests are dealt to the shards longest first, using the wall times of the
+# previous run (sim_build/shard_times.json) when they exist. With
+# NANO_COVERAGE=file every shard collects its coverage (nano_coverage.py) in
+# its SIM_BUILD and the shard files are merged into `file`:
+#
+#     python run_shards.py -j 8 NANO_COVERAGE=coverage.json
+#     python nano_coverage.py report coverage.json
+#=============================================================================
+
+import argparse
+import ast
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+from nano_coverage import NanoCoverage
+from nano_isa import rtl_build
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+#Compiled image of every simulator (target of the cocotb makefiles)
+_IMAGES = {"icarus": "sim.vvp", "verilator": "Vtop"}
+
+
+def discover_tests(module="test"):
+    """Names of the @cocotb.test() coroutines of a test module, in file order."""
+    with open(os.path.join(HERE, module + ".py")) as f:
+        tree = ast.parse(f.read())
+    names = []
+    for node in tree.body:
+        if isinstance(node, ast.AsyncFunctionDef):
+            for decorator in node.decorator_list:
+                target = decorator.func if isinstance(decorator, ast.Call) else decorator
+                if ast.unparse(target) == "cocotb.test":
+                    names.append(node.name)
+    return names
+
+
+def make_shards(tests, count, times=None):
+    """Deal the tests to `count` shards, longest first (by the previous times)."""
+    times = times or {}
+    shards = [[] for _ in range(min(count, len(tests)))]
+    load = [0.0] * len(shards)
+    for name in sorted(tests, key=lambda t: -times.get(t, 0.0)):
+        i = load.index(min(load))
+        shards[i].append(name)
+        load[i] += times.get(name, 1.0)
+    return [shard for shard in shards if shard]
+
+
+def merge_results(paths, output):
+    """Merge the JUnit files of the shards into one file.
+
+    cocotb lists the tests excluded by COCOTB_TEST_FILTER as skipped, so for
+    every test the result of the shard that ran it is kept.
+    """
+    merged = ET.Element("testsuites", name="results")
+    suite = ET.SubElement(merged, "testsuite", name="all", package="all")
+    cases = {}
+    for path in paths:
+        for case in ET.parse(path).getroot().iter("testcase"):
+            key = (case.get("classname"), case.get("name"))
+            if key not in cases or cases[key].find("skipped") is not None:
+                cases[key] = case
+    suite.extend(cases.values())
+    ET.ElementTree(merged).write(output, encoding="unicode", xml_declaration=True)
+    return merged
+
+
+def build_dir(variables):
+    """sim_build directory of the compiled simulator for the make variables."""
+    if variables.get("GATES") == "yes":
+        return os.path.join("sim_build", "gl")
+    return os.path.join("sim_build", rtl_build(variables))
+
+
+def _copy_build(source, target):
+    #All the files with the same time, newer than the sources: make sees the
+    #copy as up to date even if the simulator left old timestamps in `source`
+    shutil.copytree(source, target, symlinks=True)
+    now = time.time()
+    for root, _, files in os.walk(target):
+        for name in files:
+            os.utime(os.path.join(root, name), (now, now), follow_symlinks=False)
+
+
+def _make(args, env=None, log=None):
+    return subprocess.run(["make", "-C", HERE] + args, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parallel cocotb regression of test.py")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="parallel simulator processes")
+    parser.add_argument("-n", "--shards", type=int, default=None, help="number of shards (default: jobs)")
+    parser.add_argument("--module", default="test", help="cocotb test module")
+    parser.add_argument("variables", nargs="*", help="make variables, e.g. SIM=verilator GATES=yes")
+    args = parser.parse_args(argv)
+
+    variables = dict(v.split("=", 1) for v in args.variables)
+    coverage = variables.pop("NANO_COVERAGE", None)
+    make_variables = [v for v in args.variables if not v.startswith("NANO_COVERAGE=")]
+    sim = variables.get("SIM", os.environ.get("SIM", "icarus"))
+    build = build_dir(variables)
+    tests = discover_tests(args.module)
+    times_file = os.path.join(HERE, "sim_build", "shard_times.json")
+    times = {}
+    if os.path.exists(times_file):
+        with open(times_file) as f:
+            times = json.load(f)
+    shards = make_shards(tests, args.shards or args.jobs, times)
+
+    #1. One compilation
+    start = time.time()
+    image = _IMAGES.get(sim)
+    if image is not None:
+        if _make(make_variables + [f"SIM_BUILD={build}", f"{build}/{image}"]).returncode:
+            sys.exit("compilation failed")
+    print(f"compiled in {time.time() - start:.1f} s, {len(tests)} tests in {len(shards)} shards")
+
+    #2. Shards
+    def run(index):
+        name = f"shard{index}"
+        shard_build = os.path.join("sim_build", name)
+        shutil.rmtree(os.path.join(HERE, shard_build), ignore_errors=True)
+        if image is not None:
+            _copy_build(os.path.join(HERE, build), os.path.join(HERE, shard_build))
+        #Quoted for the shell line of the cocotb makefiles, and without '$' for make
+        pattern = r"\.(" + "|".join(map(re.escape, shards[index])) + r")\Z"
+        env = dict(os.environ, COCOTB_TEST_FILTER=f"'{pattern}'")
+        results = os.path.join(shard_build, "results.xml")
+        shard_variables = list(make_variables)
+        if coverage:
+            shard_variables.append("NANO_COVERAGE=" + os.path.join(HERE, shard_build, "coverage.json"))
+        with open(os.path.join(HERE, shard_build + ".log"), "w") as log:
+            _make(shard_variables + [f"SIM_BUILD={shard_build}", f"COCOTB_RESULTS_FILE={results}",
+                                     f"DUMP_FILE={name}.fst", "COCOTB_TEST_MODULES=" + args.module], env, log)
+        return os.path.join(HERE, results)
+
+    os.makedirs(os.path.join(HERE, "sim_build"), exist_ok=True)
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        paths = list(pool.map(run, range(len(shards))))
+
+    #3. Merged results
+    missing = [p for p in paths if not os.path.exists(p)]
+    merged = merge_results([p for p in paths if p not in missing], os.path.join(HERE, "results.xml"))
+    failed = []
+    ran = 0
+    for case in merged.iter("testcase"):
+        if case.find("skipped") is not None:
+            continue
+        ran += 1
+        if case.find("failure") is not None or case.find("error") is not None:
+            failed.append(case.get("name"))
+        times[case.get("name")] = float(case.get("time", 0.0))
+    with open(times_file, "w") as f:
+        json.dump(times, f, indent=1)
+
+    print(f"{ran} tests, {len(failed)} failed, {len(missing)} shards without results, {time.time() - start:.1f} s")
+    for name in failed:
+        print(f"FAIL {name}")
+    for path in missing:
+        print(f"no results: {path} (see {os.path.dirname(path)}.log)")
+
+    #4. Merged coverage
+    if coverage:
+        shard_files = [os.path.join(os.path.dirname(p), "coverage.json") for p in paths]
+        shard_files = [p for p in shard_files if os.path.exists(p)]
+        if shard_files:
+            merged_coverage = NanoCoverage.load(shard_files[0])
+            for path in shard_files[1:]:
+                merged_coverage.merge(NanoCoverage.load(path))
+            merged_coverage.save(os.path.join(HERE, coverage))
+            print(f"coverage of {len(shard_files)} shards in {coverage}")
+            print(merged_coverage.report(uncovered=False))
+    return 1 if failed or missing or ran != len(tests) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,12 +7,52 @@
 module tb ();
 
   // Dump the signals to a FST file. You can view it with gtkwave or surfer.
+  // Nothing is dumped unless scopes are selected with plusargs (make DUMP="cpu spi",
+  // see the Makefile), and then only while dump_en is 1 (driven by nano_waves.py,
+  // or from time 0 with +dump_on).
+  reg dump_en = 1'b0;
+  reg dumping = 1'b0;
+  reg [8*128-1:0] dump_file;
+
   initial begin
-     $dumpfile("tb.fst");
-    $dumpvars(0, tb);
+    if ($test$plusargs("dump_all") || $test$plusargs("dump_cpu") || $test$plusargs("dump_spi") ||
+        $test$plusargs("dump_mem") || $test$plusargs("dump_io")) begin
+      if (!$value$plusargs("dump_file=%s", dump_file))
+        dump_file = "tb.fst";
+      $dumpfile(dump_file);
+      if ($test$plusargs("dump_all"))
+        $dumpvars(0, tb);
+      if ($test$plusargs("dump_io"))
+        $dumpvars(1, tb);
+`ifndef GL_TEST
+      if ($test$plusargs("dump_cpu"))
+        $dumpvars(1, tb.user_project.my_NanoSys.my_cpu);
+      if ($test$plusargs("dump_spi"))
+        $dumpvars(0, tb.user_project.my_NanoSys.my_NanoSPI);
+      if ($test$plusargs("dump_mem")) begin
+        $dumpvars(1, tb.user_project.my_NanoSys.my_ram);
+        $dumpvars(1, tb.user_project.my_NanoSys.my_stack);
+        $dumpvars(1, tb.user_project.my_NanoSys.my_top_rom);
+        $dumpvars(1, tb.user_project.my_NanoSys.my_bottom_rom);
+      end
+`endif
+      if ($test$plusargs("dump_on"))
+        dump_en = 1'b1;
+      else
+        $dumpoff;
+      dumping = 1'b1;
+    end
     #1;
   end
 
+  always @(dump_en)
+    if (dumping) begin
+      if (dump_en)
+        $dumpon;
+      else
+        $dumpoff;
+    end
+
   // Wire up the inputs and outputs:
   reg clk;
   reg rst_n;
@@ -27,6 +67,167 @@ module tb ();
   wire VGND = 1'b0;
 `endif
 
+  // Stimulus replay (nano_replay.py): entries of replay_mem are applied to
+  // the pins (replay_ui/replay_uio, see the mux below) at falling edges of
+  // clk, without waking Python on every pin change. An entry is
+  // {mark, sample, delay[13:0], ui_in[7:0], uio_in[7:0]}: it is applied `delay` falling edges after the previous one (the first
+  // one, after replay_run is set), `sample` shifts uio_out[7] (SPI MISO) into
+  // replay_miso just before, and `mark` counts it in replay_mark afterwards.
+  // Python writes the entries to a file named in replay_file, loads it with a
+  // rising edge of replay_load, sets replay_count and replay_run, and the
+  // replay clears replay_run after the last entry. While replay_run is clear
+  // replay_ui/replay_uio follow ui_in/uio_in, so the pins do not change when
+  // it is set; NanoReplay.wait_done() writes the last entry back to them.
+  reg [31:0] replay_mem [0:65535];
+  reg [8*256-1:0] replay_file;
+  reg replay_load = 1'b0;
+  reg replay_run = 1'b0;
+  reg [16:0] replay_count = 17'd0;
+  reg [16:0] replay_index = 17'd0;
+  reg [13:0] replay_wait = 14'd0;
+  reg [31:0] replay_mark = 32'd0;
+  reg [31:0] replay_miso = 32'd0;
+  reg [7:0] replay_ui = 8'd0;
+  reg [7:0] replay_uio = 8'd0;
+  wire [31:0] replay_entry = replay_mem[replay_index[15:0]];
+
+  always @(posedge replay_load)
+    $readmemh(replay_file, replay_mem);
+
+  always @(negedge clk)
+    if (!replay_run) begin
+      replay_index <= 17'd0;
+      replay_wait <= 14'd0;
+      replay_ui <= ui_in;
+      replay_uio <= uio_in;
+    end else if (replay_wait + 14'd1 >= replay_entry[29:16]) begin
+      replay_ui <= replay_entry[15:8];
+      replay_uio <= replay_entry[7:0];
+      if (replay_entry[30])
+        replay_miso <= {replay_miso[30:0], uio_out[7]};
+      if (replay_entry[31])
+        replay_mark <= replay_mark + 32'd1;
+      replay_wait <= 14'd0;
+      replay_index <= replay_index + 17'd1;
+      if (replay_index + 17'd1 >= replay_count)
+        replay_run <= 1'b0;
+    end else
+      replay_wait <= replay_wait + 14'd1;
+
+  // SPI master (NanoSpiTbMaster of nano_spi.py): one frame of spim_bits
+  // bits of spim_frame (MSB first) per pulse of spim_start, with the pin
+  // timing of NanoSpiMaster: MOSI changes with SCK low, MISO (uio_out[7]) is
+  // shifted into spim_miso just before SCK rises, each level lasts spim_half
+  // clk cycles. The first bit goes out at the falling edge of clk that takes
+  // spim_start or, with spim_pre, spim_pre falling edges after the one that
+  // set spim_done: the next word of a burst, started as soon as the previous
+  // one is done, keeps SCK high spim_pre more clk cycles. After the last bit
+  // CS stays low if spim_hold is set (next word of a burst); otherwise the
+  // pins go idle and spim_post clk cycles pass. Then spim_done is set, until
+  // the next spim_start. Only ui_in[5:3] (SCK, MOSI, CS) are driven, from
+  // spim_pins while spim_own is set (see the mux below): from the falling
+  // edge that takes spim_start to the end of the frame, also between the
+  // words of a burst. NanoSpiTbMaster sets ui_in to the pins it leaves.
+  localparam SPIM_IDLE = 3'd0, SPIM_PRE = 3'd1, SPIM_LOW = 3'd2, SPIM_HIGH = 3'd3, SPIM_POST = 3'd4;
+  reg [31:0] spim_frame = 32'd0;
+  reg [5:0] spim_bits = 6'd32;
+  reg [7:0] spim_half = 8'd4;
+  reg [7:0] spim_pre = 8'd0;
+  reg [7:0] spim_post = 8'd4;
+  reg spim_hold = 1'b0;
+  reg spim_start = 1'b0;
+  reg spim_done = 1'b0;
+  reg spim_own = 1'b0;
+  reg [31:0] spim_miso = 32'd0;
+  reg [2:0] spim_state = SPIM_IDLE;
+  reg [31:0] spim_sr = 32'd0;
+  reg [5:0] spim_left = 6'd0;
+  reg [7:0] spim_cnt = 8'd0;
+  reg [2:0] spim_pins = 3'b111;                   // CS, MOSI, SCK
+
+  task spim_bit;
+    begin
+      spim_pins <= {1'b0, spim_sr[31], 1'b0};     // CS low, MOSI, SCK low
+      spim_sr <= spim_sr << 1;
+      spim_left <= spim_left - 6'd1;
+      spim_cnt <= spim_half;
+      spim_state <= SPIM_LOW;
+    end
+  endtask
+
+  always @(negedge clk)
+    case (spim_state)
+      SPIM_IDLE:
+        if (spim_start) begin
+          spim_start <= 1'b0;
+          spim_done <= 1'b0;
+          spim_own <= 1'b1;
+          if (spim_pre <= 8'd1) begin
+            spim_pins <= {1'b0, spim_frame[spim_bits[4:0] - 5'd1], 1'b0};
+            spim_sr <= spim_frame << (6'd33 - spim_bits);
+            spim_left <= spim_bits - 6'd1;
+            spim_cnt <= spim_half;
+            spim_state <= SPIM_LOW;
+          end else begin
+            if (!spim_own)
+              spim_pins <= ui_in[5:3];              // Kept until the first bit
+            spim_sr <= spim_frame << (6'd32 - spim_bits);
+            spim_left <= spim_bits;
+            spim_cnt <= spim_pre - 8'd1;            // This edge is the first one
+            spim_state <= SPIM_PRE;
+          end
+        end
+      SPIM_PRE:
+        if (spim_cnt > 8'd1)
+          spim_cnt <= spim_cnt - 8'd1;
+        else
+          spim_bit;
+      SPIM_LOW:
+        if (spim_cnt > 8'd1)
+          spim_cnt <= spim_cnt - 8'd1;
+        else begin
+          spim_miso <= {spim_miso[30:0], uio_out[7]};
+          spim_pins[0] <= 1'b1;                     // SCK high
+          spim_cnt <= spim_half;
+          spim_state <= SPIM_HIGH;
+        end
+      SPIM_HIGH:
+        if (spim_cnt > 8'd1)
+          spim_cnt <= spim_cnt - 8'd1;
+        else if (spim_left != 6'd0)
+          spim_bit;
+        else if (spim_hold) begin
+          spim_done <= 1'b1;
+          spim_state <= SPIM_IDLE;
+        end else begin
+          spim_pins <= 3'b111;                      // Idle: CS, MOSI and SCK high
+          spim_cnt <= spim_post;
+          if (spim_post == 8'd0) begin
+            spim_done <= 1'b1;
+            spim_own <= 1'b0;
+            spim_state <= SPIM_IDLE;
+          end else
+            spim_state <= SPIM_POST;
+        end
+      SPIM_POST:
+        if (spim_cnt > 8'd1)
+          spim_cnt <= spim_cnt - 8'd1;
+        else begin
+          spim_done <= 1'b1;
+          spim_own <= 1'b0;
+          spim_state <= SPIM_IDLE;
+        end
+      default:
+        spim_state <= SPIM_IDLE;
+    endcase
+
+  // Owner of the input pins: the replay while replay_run is set, the SPI
+  // master (ui_in[5:3]) while it owns them, otherwise ui_in/uio_in, which
+  // only Python writes.
+  wire [7:0] ui_pins = replay_run ? replay_ui :
+                       spim_own ? {ui_in[7:6], spim_pins, ui_in[2:0]} : ui_in;
+  wire [7:0] uio_pins = replay_run ? replay_uio : uio_in;
+
   // Replace tt_um_example with your module name:
   tt_um_galaguna_NanoSys_fit user_project (
 
@@ -36,9 +237,9 @@ module tb ();
       .VGND(VGND),
 `endif
 
-      .ui_in  (ui_in),    // Dedicated inputs
+      .ui_in  (ui_pins),  // Dedicated inputs
       .uo_out (uo_out),   // Dedicated outputs
-      .uio_in (uio_in),   // IOs: Input path
+      .uio_in (uio_pins), // IOs: Input path
       .uio_out(uio_out),  // IOs: Output path
       .uio_oe (uio_oe),   // IOs: Enable path (active high: 0=input, 1=output)
       .ena    (ena),      // enable - goes high when design is selected
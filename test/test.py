@@ -3,6 +3,19 @@
 # Codigo de verificacion con Cocotb para NanoCpuSys
 #=============================================================================
 # Actualizacion para operar con cocotb 2.0 y versiones posteriores
+# Comandos SPI generados con el master de nano_spi.py (o con el de tb.v)
+# Programas de prueba ensamblados con nano_asm.py y comparados con nano_iss.py
+# Co-simulacion en lockstep con nano_cosim.py
+# Esperas por eventos de nano_waits.py en lugar de muestrear cada reloj
+# Volcado de formas de onda por ventanas con nano_waves.py (make DUMP=...)
+# Perfil de ciclos por instruccion con nano_profile.py
+# Estimacion estatica de ciclos con nano_cycles.py
+# Lectura de State_reg, R_reg y F_reg por los pines con nano_snapshot.py
+# Latencias de interrupciones con estimulos programados de nano_irq.py
+# Copia sombra de las memorias desde sus buses con nano_shadow.py
+# Estimulos precompilados reproducidos por tb.v con nano_replay.py
+# Puntos de control del estado completo con nano_checkpoint.py
+# Cobertura de opcodes, estados y transiciones con nano_coverage.py (make NANO_COVERAGE=...)
 #=============================================================================
 #=============================================================================
 # Author: Gerardo A. Laguna S.
@@ -11,483 +24,70 @@
 # 12.dic.2025
 #=============================================================================
 
-import cocotb
-from cocotb.clock import Clock
-from cocotb.triggers import ClockCycles
-
-
-@cocotb.test()
-async def test_project(dut):
-    dut._log.info("Start")
-
-    # Set the clock period to 10 us (100 KHz)
-    clock = Clock(dut.clk, 10, unit="us")
-    cocotb.start_soon(clock.start())
-
-    # Reset
-    dut._log.info("Reset")
-    dut.ena.value = 1
-    dut.ui_in.value = 0
-    dut.uio_in.value = 0
-    dut.rst_n.value = 0
-    await ClockCycles(dut.clk, 2)
-    dut.rst_n.value = 1
-
-    dut._log.info("Test project behavior")
-
-    #!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
-    #Masks definitions according to the pinout:
-    #!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
-    #
-    # Inputs:
-    #   ui[0]: "OUT_CTRL0"
-    #   ui[1]: "OUT_CTRL1"
-    #   ui[2]: "OUT_CTRL2"
-    #   ui[3]: "SPI_SCK"
-    #   ui[4]: "SPI_MOSI"
-    #   ui[5]: "SPI_CS"
-    #   ui[6]: "RUN"
-    #   ui[7]: "MODE"
-    #
-    # Outputs:
-    #   uo[0]: "OUT8B0"
-    #   uo[1]: "OUT8B1"
-    #   uo[2]: "OUT8B2"
-    #   uo[3]: "OUT8B3"
-    #   uo[4]: "OUT8B4"
-    #   uo[5]: "OUT8B5"
-    #   uo[6]: "OUT8B6"
-    #   uo[7]: "OUT8B7"
-    #
-    # Bidirectional pins as otputs:
-    #   uio[0]: "OUT4B0"
-    #   uio[1]: "OUT4B1"
-    #   uio[2]: "OUT4B2"
-    #   uio[3]: "OUT4B3"
-    #   uio[7]: "SPI_MISO"
-
-    # Bidirectional pins as inputs:
-    #   uio[4]: "EINT0"
-    #   uio[5]: "EINT1"
-    #   uio[6]: "EINT2"
-
-    MSK_SPI_SCK_TO_ON = 0x08
-    MSK_SPI_SCK_TO_OFF = 0xF7
-    MSK_SPI_MOSI_TO_ON = 0x10
-    MSK_SPI_MOSI_TO_OFF = 0xEF
-    MSK_SPI_CS_TO_ON = 0x20
-    MSK_SPI_CS_TO_OFF = 0xDF
-    MSK_RUN_TO_ON = 0x40
-    MSK_RUN_TO_OFF = 0xBF
-    MSK_MODE_TO_ON = 0x80
-    MSK_MODE_TO_OFF = 0x7F
-
-    #!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
-    # OUT8b and OUT4B setting
-    #!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
-    #   +--------+-------------+--------------------+
-    #   |out_ctrl|    OUT8B    |       OUT4B        |
-    #   +--------+-------------+--------------------+
-    #   |   0    |  State_reg  |     R_reg[3:0]     | 
-    #   +--------+-------------+--------------------+
-    #   |   1    |  State_reg  |     R_reg[7:4]     | 
-    #   +--------+-------------+--------------------+
-    #   |   2    |  State_reg  |     R_reg[11:8]    |
-    #   +--------+-------------+--------------------+
-    #   |   3    |  State_reg  |     R_reg[15:12]   |
-    #   +--------+-------------+--------------------+
-    #   |   4    | R_reg[7:0]  |     F_reg[3:0]     |
-    #   +--------+-------------+--------------------+
-    #   |   5    | R_reg[15:8] |     F_reg[3:0]     | 
-    #   +--------+-------------+--------------------+
-    #   |   6    | R_reg[23:16]|     F_reg[7:4]     |
-    #   +--------+-------------+--------------------+
-    #   |   7    | R_reg[31:24]|     F_reg[7:4]     |
-    #   +--------+-------------+--------------------+
-
-    MSK_OUT_CTRL_TO_0 = 0xF8
-
-    #!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
-    #!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
-
+import os
+import tempfile
+import time
 
+import cocotb
+import numpy as np
+import pytest
+from cocotb.triggers import ClockCycles, FallingEdge
+from cocotb.utils import get_sim_steps, get_sim_time
+
+from nano_pins import MSK_EINT0, MSK_MODE_TO_ON, MSK_OUT_CTRL_TO_0, MSK_RUN_TO_ON, MSK_RUN_TO_OFF
+from nano_pins import reset_nano as reset_pins
+from nano_asm import assemble, assemble_file
+from nano_batch import REGISTERS as BATCH_REGISTERS, STOPPED, NanoBatch
+from nano_checkpoint import NanoCheckpoint
+from nano_cosim import NanoCosim
+from nano_coverage import CATEGORIES, NanoCoverage
+from nano_cycles import NanoCycles
+from nano_isa import MUL_STEPS, SHIFT_STEPS, get_isa
+from nano_irq import NanoIrqStimulus, bursty, periodic, poisson
+from nano_iss import REGISTERS, NanoISS
+from nano_mem import NanoMemory
+from nano_profile import NanoProfiler
+from nano_replay import NanoReplay, NanoStimulus
+from nano_shadow import NanoShadow
+from nano_snapshot import NanoSnapshot
+from nano_spi import SPI_BURST, SPI_RAM_BASE, SPI_READ, SPI_ROM_BASE, NanoSpiMaster, NanoSpiTbMaster, spi_word
+from nano_waits import NanoWaits
+from nano_waves import NanoRingDump, NanoWaves
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "programs")
+
+#Gate level simulation (make GATES=yes): the netlist has only the pins, so the
+#tests that use the hierarchy of my_NanoSys (backdoor, models, monitors) are skipped
+GATES = os.environ.get("GATES") == "yes"
+
+#Coverage of the whole run with make NANO_COVERAGE=file, restarted by every reset
+suite_coverage = (NanoCoverage(path=os.environ["NANO_COVERAGE"])
+                  if os.environ.get("NANO_COVERAGE") and not GATES else None)
+
+
+async def reset_nano(dut):
+    #Clock of 10 us (100 KHz) and reset (nano_pins.py), with the suite coverage restarted
+    if suite_coverage is not None:
+        suite_coverage.start(dut)
+    await reset_pins(dut, clk_period=10, unit="us")
+
+
+async def program_by_spi(dut):
     #+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
     #+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
     # Programing mode (MODE=0) with OUT_CTRL=0 (OUT8B = State_reg, OUT4B = R_reg[3:0])
     #+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
     #+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
-    #Master SPI initial values:  
-    dut.ui_in.value  = MSK_SPI_SCK_TO_ON | MSK_SPI_CS_TO_ON | MSK_SPI_MOSI_TO_ON
-    await ClockCycles(dut.clk, 16)
-
-    #+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
-    # Sequence of ROM write SPI commands to store Nano intructions
-    #+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
-    #
-    #    |-------------------------------|
-    #    |         4 Bytes SPI word      |
-    #    |-------------------------------|
-    #    | RW  |  Address  |     Data    |                                                        
-    #    | bit |   bits    |     bits    |                                                    
-    #    |-----|-----------|-------------|
-    #    | b31 | [b30:b16] |  [b15:b00]  |
-    #    |-----|-----------|-------------|
-    #
-    #+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
-    #     SPI 15 bits address map:
-    #
-    #     -----+-----------+----------
-    #    0x0000|           |                                                                  
-    #          |  CPU ROM  |   SPI                                                              
-    #    0x0FFF|           |   Code                                                          
-    #     -----|-----------|   space
-    #          |           |                                                             
-    #          | Reserved  |                                                             
-    #    0x3FFF|           |                                                             
-    #     -----|-----------|---------
-    #    0x4000|           |    
-    #          |  CPU RAM  |   SPI                                                              
-    #    0x47FF|           |   Data                                                          
-    #     -----|-----------|   space
-    #          |           |                                                             
-    #          | Reserved  |                                                             
-    #    0x7FFF|           |                                                                 
-    #     -----|-----------|---------
-    #    
-    #+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+    #Master SPI initial values:
+    spi = NanoSpiMaster(dut, clk_period=10, unit="us")
+    await spi.idle()
 
     #+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
     # Write STOP intruction (0xFF) in loc 0x00 of CPU space code
-    # SPI command word: 00000000000000000000000011111111 
+    # SPI command word: 00000000000000000000000011111111
     #+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
-       #SCK period #1:
-    dut.ui_in.value = dut.ui_in.value.integer &   MSK_SPI_CS_TO_OFF  &   MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-    
-    #SCK period #2:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #3:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #4:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #5:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #6:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #7:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #8:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #9:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #10:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #11:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #12:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #13:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #14:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #15:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #16:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #17:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #18:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #19:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #20:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #21:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #22:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #23:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #24:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #25:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_MOSI_TO_ON
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #26:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_MOSI_TO_ON
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #27:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_MOSI_TO_ON
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #28:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_MOSI_TO_ON
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #29:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_MOSI_TO_ON
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #30:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_MOSI_TO_ON
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #31:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_MOSI_TO_ON
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #32:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_MOSI_TO_ON
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    ###Last SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    #Master SPI final values:
-    dut.ui_in.value = MSK_SPI_CS_TO_ON  | MSK_SPI_MOSI_TO_ON | MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
+    await spi.write_rom(0x000, 0xFF)
     await ClockCycles(dut.clk, 16)
 
     expected_state = 0x00    #Stop state
@@ -495,339 +95,122 @@ async def test_project(dut):
 
     #+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
     # Write NOP intruction (0x0) in loc 0x01 of CPU space code
-    # SPI command word: 00000000000000010000000000000000 
+    # SPI command word: 00000000000000010000000000000000
     #+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
-       #SCK period #1:
-    dut.ui_in.value = dut.ui_in.value.integer &   MSK_SPI_CS_TO_OFF  &   MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-    
-    #SCK period #2:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #3:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #4:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #5:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #6:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #7:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #8:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #9:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #10:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #11:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #12:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #13:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #14:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #15:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #16:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_MOSI_TO_ON
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #17:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #18:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #19:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #20:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #21:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #22:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #23:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #24:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #25:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #26:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #27:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #28:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #29:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #30:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #31:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    #SCK period #32:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_MOSI_TO_OFF
-    await ClockCycles(dut.clk, 1)
-    ###SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    ###SCK rising edge:
-    dut.ui_in.value = dut.ui_in.value.integer |  MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
-    ###Last SCK falling edge:
-    dut.ui_in.value = dut.ui_in.value.integer &  MSK_SPI_SCK_TO_OFF
-    await ClockCycles(dut.clk, 4)
-    #Master SPI final values:
-    dut.ui_in.value = MSK_SPI_CS_TO_ON  | MSK_SPI_MOSI_TO_ON | MSK_SPI_SCK_TO_ON
-    await ClockCycles(dut.clk, 4)
-
+    await spi.write_rom(0x001, 0x00)
     await ClockCycles(dut.clk, 16)
 
     expected_state = 0x00    #Stop state
     assert dut.uo_out.value == expected_state
+    return spi
+
+
+@cocotb.test()
+async def test_spi_write(dut):
+    await reset_nano(dut)
+    await program_by_spi(dut)
+    if not GATES:
+        mem = NanoMemory(dut)
+        assert mem.read_rom(0x000) == 0xFF and mem.read_rom(0x001) == 0x00
+
+
+@cocotb.test()
+async def test_spi_readback(dut):
+    await reset_nano(dut)
+    spi = await program_by_spi(dut)
+
+    #+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+    # Read back the coded program through SPI_MISO
+    #+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+    assert await spi.read_rom_bytes(0x000, 2) == [0xFF, 0x00]
+
+
+@cocotb.test(skip=GATES)
+async def test_spi_burst(dut):
+    #Burst writes and reads (two code bytes or one data word per 16 bits
+    #word), checked through the backdoor, against one frame per location
+    await reset_nano(dut)
+    spi = NanoSpiMaster(dut, clk_period=10, unit="us")
+    await spi.idle()
+    mem = NanoMemory(dut)
+    mem.clear()
+    rng = np.random.default_rng(15)
+    code = [int(b) for b in rng.integers(0, 0x100, 21)]
+    data = [int(w) for w in rng.integers(0, 0x10000, 9)]
+
+    start = get_sim_time("us")
+    await spi.write_rom_bytes(0x005, code)
+    burst = get_sim_time("us") - start
+    await spi.write_ram_words(0x03, data)
+    assert [mem.read_rom(0x005 + i) for i in range(len(code))] == code
+    assert [mem.read_ram(0x03 + i) for i in range(len(data))] == data
+    assert await spi.read_rom_bytes(0x005, len(code)) == code
+    assert await spi.read_rom_bytes(0x006, 4) == code[1:5]
+    assert await spi.read_ram_words(0x03, len(data)) == data
+    #Neighbours untouched:
+    assert mem.read_rom(0x004) == 0 and mem.read_rom(0x005 + len(code)) == 0
+    assert mem.read_ram(0x02) == 0 and mem.read_ram(0x03 + len(data)) == 0
+
+    #Top ROM and one frame per location:
+    await spi.load(rom={0xFFA: 0x12, 0xFFB: 0x34, 0xFFC: 0x56, 0xFFD: 0x78})
+    assert [mem.read_rom(a) for a in range(0xFFA, 0xFFE)] == [0x12, 0x34, 0x56, 0x78]
+    start = get_sim_time("us")
+    for offset, byte in enumerate(code):
+        await spi.write_rom(0x005 + offset, byte)
+    single = get_sim_time("us") - start
+    dut._log.info(f"SPI load of {len(code)} code bytes: {burst:.0f} us in a burst, "
+                  f"{single:.0f} us one frame per byte")
+    assert single > 3 * burst
+
+
+@cocotb.test(skip=GATES)
+async def test_spi_dump(dut):
+    #Read back through MISO: single reads chained in the response frames,
+    #against one command frame and one response frame per read, and the
+    #mismatching ranges of verify()
+    await reset_nano(dut)
+    spi = NanoSpiMaster(dut, clk_period=10, unit="us")
+    await spi.idle()
+    mem = NanoMemory(dut)
+    mem.clear()
+    image = assemble_file(os.path.join(PROGRAMS, "iss_check.asm"))
+    rom = dict(image.rom)
+    rom.update({0xFF8: 0x5A, 0xFFB: 0xA5})
+    ram = dict(image.ram)
+    ram.update({0x1C: 0x1234, 0x1E: 0xBEEF})
+    await spi.load(rom, ram)
+    assert await spi.verify(rom, ram) == []
+    code, data = await spi.dump(rom=[(0xFF8, 4)], ram=[(0x1C, 3)])
+    assert code == {0xFF8: 0x5A, 0xFF9: 0, 0xFFA: 0, 0xFFB: 0xA5}
+    assert data == {0x1C: 0x1234, 0x1D: 0, 0x1E: 0xBEEF}
+
+    addresses = [SPI_RAM_BASE + a for a in (0x1E, 0x1C, 0x1D)] + [SPI_ROM_BASE + a for a in (0xFFB, 0xFF8)]
+    frames, start = spi.frames, get_sim_time("us")
+    assert await spi.read_words(addresses) == [0xBEEF, 0x1234, 0, 0xA5, 0x5A]
+    chained, chained_frames = get_sim_time("us") - start, spi.frames - frames
+    frames, start = spi.frames, get_sim_time("us")
+    assert [await spi.read_word(a) for a in addresses] == [0xBEEF, 0x1234, 0, 0xA5, 0x5A]
+    single, single_frames = get_sim_time("us") - start, spi.frames - frames
+    assert (chained_frames, single_frames) == (len(addresses) + 1, 2 * len(addresses))
+    dut._log.info(f"SPI read of {len(addresses)} words: {chained:.0f} us chained, {single:.0f} us one command per read")
+    assert single > 1.5 * chained
+
+    rom_start = min(image.rom) + 2
+    mem.write_rom(rom_start, mem.read_rom(rom_start) ^ 0xFF)
+    mem.write_rom(rom_start + 1, mem.read_rom(rom_start + 1) ^ 0x01)
+    mem.write_rom(0xFFB, 0)
+    mem.write_ram(0x1E, 0xBEEE)
+    assert await spi.verify(rom, ram) == [("rom", rom_start, rom_start + 2), ("rom", 0xFFB, 0xFFC),
+                                          ("ram", 0x1E, 0x1F)]
+
+
+@cocotb.test()
+async def test_project(dut):
+    dut._log.info("Start")
+    await reset_nano(dut)
+
+    dut._log.info("Test project behavior")
+    await program_by_spi(dut)
 
     #+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
     #+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
@@ -837,6 +220,7 @@ async def test_project(dut):
 
     dut.ui_in.value = MSK_MODE_TO_ON & MSK_OUT_CTRL_TO_0
     await ClockCycles(dut.clk, 16)
+    waits = NanoWaits(dut, clk_period=10, unit="us")
 
     #+++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
     # Run the coded program (Just the STOP instruction)
@@ -844,23 +228,910 @@ async def test_project(dut):
 
     dut.ui_in.value = dut.ui_in.value.integer | MSK_RUN_TO_ON	#Press RUN
 
-    while(dut.uo_out.value == 0): #While Stop state
-        await ClockCycles(dut.clk, 1)
+    state = await waits.wait_state_change(timeout_cycles=16)   #Leave the Stop state
 
     expected_state = 0x01   #Start state
+    assert state == expected_state
     assert dut.uo_out.value == expected_state
 
     dut.ui_in.value = dut.ui_in.value.integer &  MSK_RUN_TO_OFF	#Release RUN
 
-    while(dut.uo_out.value == 1): #While Start state
-        await ClockCycles(dut.clk, 1)
+    state = await waits.wait_state_change(timeout_cycles=16)   #Leave the Start state
 
     expected_state = 0x02   #Fetch-decode state
+    assert state == expected_state
     assert dut.uo_out.value == expected_state
 
-    while(dut.uo_out.value == 2): #While Fetch-decode state
-        await ClockCycles(dut.clk, 1)
+    assert await waits.wait_until_stop(timeout_cycles=16) == 1   #STOP executed in one clock
 
     expected_state = 0x00   #Stop state
     assert dut.uo_out.value == expected_state
 
+
+
+@cocotb.test(skip=GATES)
+async def test_backdoor_load(dut):
+    await reset_nano(dut)
+    spi = NanoSpiMaster(dut, clk_period=10, unit="us")
+    await spi.idle()
+
+    #Backdoor load (zero cycles) verified through SPI: nop, nop, stop in the
+    #bottom ROM, one byte behind cs_top_rom and one RAM word.
+    mem = NanoMemory(dut)
+    mem.clear()
+    await mem.load(rom={0x000: 0x00, 0x001: 0x00, 0x002: 0xFF, 0xFFD: 0xA5}, ram={0x1F: 0xBEEF}, spi=spi)
+
+    #SPI writes are seen by the backdoor:
+    await spi.write_ram(0x05, 0x1234)
+    assert mem.read_ram(0x05) == 0x1234
+    assert mem.dump_ram()[0x1F] == 0xBEEF
+    assert mem.read_rom(0xFFD) == 0xA5 and mem.read_rom(0x07D) == 0x00
+
+    #Run the loaded program:
+    dut.ui_in.value = MSK_MODE_TO_ON
+    await ClockCycles(dut.clk, 16)
+    dut.ui_in.value = MSK_MODE_TO_ON | MSK_RUN_TO_ON
+    await ClockCycles(dut.clk, 16)
+    assert dut.uo_out.value == 0x00   #Stop state
+    assert dut.user_project.my_NanoSys.my_cpu.IP_reg.value == 0x003
+
+
+ADD_PROGRAM = """
+        movka 0x1234
+        call save
+        movka 3
+        movkb 4
+        uadd            ; R = A + B
+        movrla
+        movam sum
+        stop
+save:   movam first
+        ret
+
+        .data
+        .org 0x10
+first:  .dw 0
+sum:    .dw 0
+"""
+
+
+@cocotb.test(skip=GATES)
+async def test_assembled_program(dut):
+    await reset_nano(dut)
+    image = assemble(ADD_PROGRAM)
+    mem = NanoMemory(dut)
+    mem.clear()
+    await mem.load(rom=image.rom, ram=image.ram)
+
+    dut.ui_in.value = MSK_MODE_TO_ON
+    await ClockCycles(dut.clk, 16)
+    waits = NanoWaits(dut, clk_period=10, unit="us")
+    dut.ui_in.value = MSK_MODE_TO_ON | MSK_RUN_TO_ON
+    await waits.wait_state_change(timeout_cycles=16)
+    await waits.wait_until_stop(timeout_cycles=200)
+    assert dut.uo_out.value == 0x00   #Stop state
+    assert mem.read_ram(image.symbols["first"]) == 0x1234
+    assert mem.read_ram(image.symbols["sum"]) == 7
+
+
+async def pulse_eint0(dut, eint0):
+    #EINT0 high from falling edge eint0.start to eint0.stop (the current one is 0)
+    if eint0.start:
+        await ClockCycles(dut.clk, eint0.start, rising=False)
+    dut.uio_in.value = MSK_EINT0
+    await ClockCycles(dut.clk, len(eint0), rising=False)
+    dut.uio_in.value = 0
+
+
+async def run_program(dut, rom, ram, eint0=(), max_cycles=100000, cosim=None, profiler=None, shadow=None):
+    """Backdoor load a program, run it (MODE=1) and return its clocks from start to stop.
+
+    EINT0 is held high during the range of clocks `eint0`, counted from the start
+    state. RuntimeError is raised if the program does not stop in `max_cycles`.
+    A NanoCosim given in `cosim`, a NanoProfiler given in `profiler` and a
+    NanoShadow given in `shadow` are started once the program is loaded.
+    """
+    await reset_nano(dut)
+    mem = NanoMemory(dut)
+    mem.clear()
+    await mem.load(rom=rom, ram=ram)
+    if cosim is not None:
+        cosim.start()
+    if profiler is not None:
+        profiler.start()
+    if shadow is not None:
+        shadow.start()
+    cpu = dut.user_project.my_NanoSys.my_cpu
+    dut.ui_in.value = MSK_MODE_TO_ON
+    await ClockCycles(dut.clk, 16)
+    waits = NanoWaits(dut, clk_period=10, unit="us", signal=cpu.state_reg)
+    dut.ui_in.value = MSK_MODE_TO_ON | MSK_RUN_TO_ON
+    await waits.wait_state_change(timeout_cycles=16)
+    await FallingEdge(dut.clk)
+    if eint0:
+        cocotb.start_soon(pulse_eint0(dut, eint0))
+    return await waits.wait_until_stop(timeout_cycles=max_cycles)
+
+
+async def compare_with_iss(dut, image, eint0=(), profiler=None):
+    """Run an image on the RTL and on NanoISS: same clocks from start to stop,
+    same registers and memories. EINT0 is held high during the clocks of `eint0`.
+    """
+    iss = NanoISS()
+    iss.load(image.rom, image.ram)
+    iss.start()
+    iss.clock()
+    iss_cycles = 0
+    while iss.state != "stop":
+        iss.set_eint(0, iss_cycles in eint0)
+        iss.clock()
+        iss_cycles += 1
+
+    rtl_cycles = await run_program(dut, image.rom, image.ram, eint0, 10 * iss_cycles, profiler=profiler)
+    assert rtl_cycles == iss_cycles
+    cpu = dut.user_project.my_NanoSys.my_cpu
+    rtl = {name: int(getattr(cpu, name + "_reg").value) for name, _ in REGISTERS}
+    assert rtl == iss.registers()
+    mem = NanoMemory(dut)
+    assert mem.dump_ram() == iss.ram
+    assert mem.dump_stack() == iss.stack
+    return iss
+
+
+@cocotb.test(skip=GATES)
+async def test_iss_matches_rtl(dut):
+    #The same program, with an EINT0 pulse in the middle, on the RTL and on
+    #NanoISS: same clocks from start to stop, same registers and memories.
+    image = assemble_file(os.path.join(PROGRAMS, "iss_check.asm"))
+    await compare_with_iss(dut, image, range(40, 44))
+
+
+#One test per instruction class (programs/*.asm), compared against NanoISS:
+
+@cocotb.test(skip=GATES)
+async def test_class_alu(dut):
+    await compare_with_iss(dut, assemble_file(os.path.join(PROGRAMS, "alu.asm")))
+
+
+@cocotb.test(skip=GATES)
+async def test_class_mul(dut):
+    await compare_with_iss(dut, assemble_file(os.path.join(PROGRAMS, "mul.asm")))
+
+
+@cocotb.test(skip=GATES)
+async def test_class_shift(dut):
+    await compare_with_iss(dut, assemble_file(os.path.join(PROGRAMS, "shift.asm")))
+
+
+@cocotb.test(skip=GATES)
+async def test_class_jumps(dut):
+    image = assemble_file(os.path.join(PROGRAMS, "jumps.asm"))
+    await compare_with_iss(dut, image)
+    assert NanoMemory(dut).read_ram(image.symbols["count"]) == 5
+
+
+@cocotb.test(skip=GATES)
+async def test_class_stack(dut):
+    await compare_with_iss(dut, assemble_file(os.path.join(PROGRAMS, "stack.asm")))
+
+
+@cocotb.test(skip=GATES)
+async def test_class_memory(dut):
+    await compare_with_iss(dut, assemble_file(os.path.join(PROGRAMS, "mem.asm")))
+
+
+@cocotb.test(skip=GATES)
+async def test_class_io(dut):
+    await compare_with_iss(dut, assemble_file(os.path.join(PROGRAMS, "io.asm")))
+
+
+@cocotb.test(skip=GATES)
+async def test_interrupts(dut):
+    #INT1 and INT2 set by the program, INT0 from a pulse on EINT0
+    image = assemble_file(os.path.join(PROGRAMS, "irq.asm"))
+    await compare_with_iss(dut, image, range(150, 153))
+    assert NanoMemory(dut).read_ram(image.symbols["hits"]) == 4
+
+
+@cocotb.test(skip=GATES)
+async def test_batch_matches_rtl(dut):
+    #64 copies of iss_check.asm with random tables (no interrupt): every row
+    #of NanoBatch against NanoISS, and the last one against the RTL.
+    image = assemble_file(os.path.join(PROGRAMS, "iss_check.asm"))
+    table = image.symbols["table"]
+    tables = np.random.default_rng(119).integers(0, 0x10000, (64, 4))
+    batch = NanoBatch(64)
+    batch.load(image.rom, image.ram)
+    batch.ram[:, table:table + 4] = tables
+    batch.run()
+    assert (batch.status == STOPPED).all()
+
+    for row, values in enumerate(tables.tolist()):
+        ram = dict(image.ram)
+        ram.update({table + i: v for i, v in enumerate(values)})
+        iss = NanoISS()
+        iss.load(image.rom, ram)
+        assert iss.run() == batch.cycles[row]
+        assert {name: getattr(iss, name) for name in BATCH_REGISTERS} == batch.registers(row)
+        assert iss.ram == batch.ram[row].tolist()
+        assert iss.stack == batch.stack[row].tolist()
+
+    rtl_cycles = await run_program(dut, image.rom, ram)
+    assert rtl_cycles == batch.cycles[-1]
+    cpu = dut.user_project.my_NanoSys.my_cpu
+    for name in ("A", "B", "I", "J", "N", "M", "R", "ACC", "F", "IP", "SP", "USP"):
+        assert int(getattr(cpu, name + "_reg").value) == getattr(batch, name)[-1], name
+    assert NanoMemory(dut).dump_ram() == batch.ram[-1].tolist()
+
+
+@cocotb.test(skip=GATES)
+async def test_cosim_lockstep(dut):
+    #iss_check.asm with the EINT0 pulse, checked instruction by instruction
+    image = assemble_file(os.path.join(PROGRAMS, "iss_check.asm"))
+    cosim = NanoCosim(dut)
+    await run_program(dut, image.rom, image.ram, range(40, 44), cosim=cosim)
+    await ClockCycles(dut.clk, 2)
+    cosim.check()
+    assert cosim.syncs == 1
+    assert cosim.instructions == cosim.iss.instructions > 0
+
+
+async def corrupt_ram(dut, cycles, address, word):
+    await ClockCycles(dut.clk, cycles)
+    NanoMemory(dut).write_ram(address, word)
+
+
+@cocotb.test(skip=GATES)
+async def test_cosim_reports_divergence(dut):
+    #A RAM word changed behind the CPU's back (after the model took over the
+    #RTL) must be reported at the first instruction that sees it.
+    image = assemble_file(os.path.join(PROGRAMS, "iss_check.asm"))
+    table = image.symbols["table"]
+    cosim = NanoCosim(dut)
+    cocotb.start_soon(corrupt_ram(dut, 40, table + 3, image.ram[table + 3] ^ 0x0100))
+    await run_program(dut, image.rom, image.ram, cosim=cosim)
+    await ClockCycles(dut.clk, 2)
+    assert cosim.divergence is not None and "movippb" in cosim.divergence
+    with pytest.raises(AssertionError):
+        cosim.check()
+
+
+@cocotb.test(skip=GATES)
+async def test_waves_ring_dump(dut):
+    #tb.fst (if selected with make DUMP=...) only gets the clocks after the
+    #first fetch-decode; the ring keeps the last 50 clocks and writes them as
+    #VCD when the test body fails.
+    image = assemble_file(os.path.join(PROGRAMS, "iss_check.asm"))
+    cocotb.start_soon(NanoWaves(dut).on_state(0x02, cycles=100))
+    ring = NanoRingDump(dut, cycles=50)
+    ring.start()
+    path = "tb_last.vcd"
+    with pytest.raises(AssertionError, match="forced failure"):
+        with ring.on_failure(path):
+            cycles = await run_program(dut, image.rom, image.ram)
+            assert cycles < 0, "forced failure"
+    ring.stop()
+    with open(path) as f:
+        text = f.read()
+    os.remove(path)
+    times = [int(line[1:]) for line in text.splitlines() if line.startswith("#")]
+    assert " state_reg $end" in text and " uo_out $end" in text
+    assert 0 < times[-1] - times[0] <= 50 * 10_000_000   #ps
+
+
+@cocotb.test(skip=GATES)
+async def test_profile_matches_iss(dut):
+    #The RTL profile of iss_check.asm (with the EINT0 pulse) gives every
+    #instruction and the interrupt entry the clocks counted by NanoISS
+    image = assemble_file(os.path.join(PROGRAMS, "iss_check.asm"))
+    profiler = NanoProfiler(dut, labels=image.labels)
+    iss = await compare_with_iss(dut, image, range(40, 44), profiler)
+    await ClockCycles(dut.clk, 2)
+    profiler.stop()
+    dut._log.info(profiler.report())
+    assert profiler.opcodes == iss.profile
+    assert profiler.instructions == iss.instructions
+    assert profiler.clocks == sum(profiler.folded.values()) == iss.cycles - 1
+    assert profiler.states["irq"]["ini_iss"] == 1 and "push_f" in profiler.states["irq"]
+    assert any(";INT0;" in stack for stack in profiler.folded)
+    assert any(stack.startswith("0x000;sum4;") for stack in profiler.folded)
+    assert sum(clocks for _, _, clocks in profiler.addresses.values()) + profiler.opcodes["irq"][1] + 1 \
+        == profiler.clocks
+
+
+@cocotb.test(skip=GATES)
+async def test_static_cycles(dut):
+    #Bounds of NanoCycles against the RTL: iss_check.asm with the EINT0 pulse,
+    #profiled to split the INT0 handler from the program, and the straight
+    #line programs of the instruction classes against NanoISS
+    image = assemble_file(os.path.join(PROGRAMS, "iss_check.asm"))
+    cycles = NanoCycles(image)
+    profiler = NanoProfiler(dut, labels=image.labels)
+    iss = await compare_with_iss(dut, image, range(40, 44), profiler)
+    await ClockCycles(dut.clk, 2)
+    profiler.stop()
+    dut._log.info(cycles.report())
+    isr = profiler.opcodes["irq"][1] + sum(c for stack, c in profiler.folded.items() if ";INT0;" in stack)
+    assert cycles.handler(0) == (isr, isr)
+    low, high = cycles.program()
+    assert low <= iss.cycles - 1 - isr == high
+    assert cycles.loops[image.labels["loop"]].iterations == (4, 4)
+
+    for name in ("alu", "mul", "shift", "stack", "mem", "io"):
+        image = assemble_file(os.path.join(PROGRAMS, name + ".asm"))
+        iss = NanoISS()
+        iss.load(image.rom, image.ram)
+        clocks = iss.run()
+        assert NanoCycles(image).program() == (clocks, clocks), name
+
+
+def mul_program(pairs):
+    ops = ("umul", "smul", "umac", "smac")
+    lines = [f"movka {a:#06x}\nmovkb {b:#06x}\n{ops[i % 4]}" for i, (a, b) in enumerate(pairs)]
+    return "\n".join(lines) + "\nstop\n"
+
+
+async def compare_modes(dut, image, option, modes):
+    """Check the build-time modes of an RTL option against its iterative mode 0.
+
+    Every mode of the model (NanoISS keyword `option`) must give, instruction
+    by instruction, the registers and flags of mode 0; the RTL (built with the
+    mode of the environment) is checked in lockstep against the model of its
+    mode and must end with the registers of mode 0. Returns the RTL clocks,
+    the clocks of mode 0 and the mode of the RTL.
+    """
+    for mode in modes:
+        reference, fast = NanoISS(**{option: 0}), NanoISS(**{option: mode})
+        for iss in (reference, fast):
+            iss.load(image.rom, image.ram)
+            iss.start()
+            iss.clock()
+        while reference.state != "stop":
+            reference.step()
+            fast.step()
+            assert fast.registers() == reference.registers(), (option, mode, reference.IP)
+
+    cosim = NanoCosim(dut)
+    rtl_cycles = await run_program(dut, image.rom, image.ram, cosim=cosim)
+    await ClockCycles(dut.clk, 2)
+    cosim.check()
+    reference = NanoISS(**{option: 0})
+    reference.load(image.rom, image.ram)
+    cycles = reference.run()
+    cpu = dut.user_project.my_NanoSys.my_cpu
+    assert {name: int(getattr(cpu, name + "_reg").value) for name, _ in REGISTERS} == reference.registers()
+    return rtl_cycles, cycles, getattr(cosim.iss, option)
+
+
+@cocotb.test(skip=GATES)
+async def test_mul_modes(dut):
+    #Radix 4 and single cycle multipliers (make MUL_MODE=...) against the
+    #iterative one
+    pairs = [(0x8000, 0x8000), (0xFFFF, 0xFFFF), (0x7FFF, 0x8000), (0x0000, 0xFFFF)]
+    pairs += [tuple(p) for p in np.random.default_rng(13).integers(0, 0x10000, (13, 2)).tolist()]
+    image = assemble(mul_program(pairs))
+    rtl_cycles, cycles, mode = await compare_modes(dut, image, "mul_mode", MUL_STEPS)
+    assert rtl_cycles == cycles - len(pairs) * (16 - 16 // MUL_STEPS[mode])
+    dut._log.info(f"MUL_MODE {mode}: {rtl_cycles} clocks, {cycles} with the iterative multiplier")
+
+
+def shift_program(groups):
+    ops = ("sracc", "sraacc", "slacc")
+    lines = []
+    for g, (acc, counts) in enumerate(groups):
+        lines.append(f"movka {acc >> 16:#06x}\nmovaacch\nmovkb {acc & 0xFFFF:#06x}\nmovbaccl")
+        lines += [f"movka {n}\n{ops[(g + j) % 3]}" for j, n in enumerate(counts)]
+    return "\n".join(lines) + "\nstop\n"
+
+
+@cocotb.test(skip=GATES)
+async def test_shift_modes(dut):
+    #Barrel shifter (make SHIFT_MODE=1) against the iterative one, with the
+    #counts at the ends of A[5:0] and around the 32 bits of ACC
+    groups = [(0x80000001, (0, 1, 63)), (0x7FFFFFFF, (31, 32, 33)), (0xFFFFFFFF, (1, 15, 16))]
+    rng = np.random.default_rng(14)
+    groups += [(int(acc), tuple(int(n) for n in rng.integers(0, 64, 3)))
+               for acc in rng.integers(0, 1 << 32, 3, dtype=np.uint64)]
+    image = assemble(shift_program(groups))
+    rtl_cycles, cycles, mode = await compare_modes(dut, image, "shift_mode", SHIFT_STEPS)
+    steps = SHIFT_STEPS[mode]
+    assert rtl_cycles == cycles - sum(n + (-n // steps) for _, counts in groups for n in counts)
+    dut._log.info(f"SHIFT_MODE {mode}: {rtl_cycles} clocks, {cycles} with the iterative shifter")
+
+
+#Straight-line code with every instruction of two bytes operands (the
+#conditional jumps are all taken)
+PREFETCH_PROGRAM = """
+        movka 0x1234
+        movkb 0x5678
+        movki 1
+        movkj 2
+        movkn 3
+        movkm 4
+        movam v0
+        movbm v1
+        movrhm v2
+        movma v1
+        movmb v0
+        incmpm v0
+        decmpm v1
+        movai ptr
+        movia ptr
+        movbipp ptr
+        movippa ptr
+        movmmib ptr
+        call sub
+        outk 0x5A, 2
+        jmp next
+        stop
+next:   cmpin
+        jnz16 equal
+        stop
+equal:  movka 0
+        movkb 0
+        uadd
+        jz16 done
+        stop
+done:   stop
+sub:    movkb 0x0007
+        ret
+
+        .data
+v0:     .dw 0x0102
+v1:     .dw 0x0304
+v2:     .dw 0
+ptr:    .dw buf
+        .org 0x10
+buf:    .dw 0xB0, 0xB1, 0xB2, 0xB3
+"""
+
+
+@cocotb.test(skip=GATES)
+async def test_prefetch(dut):
+    #Operand prefetch (make PREFETCH=1) against one operand byte per clock:
+    #one clock less for every instruction of two bytes operands
+    image = assemble(PREFETCH_PROGRAM)
+    rtl_cycles, cycles, mode = await compare_modes(dut, image, "prefetch", (0, 1))
+    reference = NanoISS(prefetch=0)
+    reference.load(image.rom, image.ram)
+    reference.run()
+    isa = get_isa()
+    fused = sum(count for name, (count, _) in reference.profile.items() if name in isa.opcodes and isa.size(name) == 3)
+    assert rtl_cycles == cycles - mode * fused
+    dut._log.info(f"PREFETCH {mode}: {rtl_cycles} clocks for {reference.instructions} instructions, "
+                  f"{cycles} without prefetch")
+
+
+SNAPSHOT_PROGRAM = """
+        movki 0
+        movkn 60
+        movka 0x1234
+        movkb 0x5679
+loop:   umul
+        movrla
+        sadd
+        movrha
+        incir
+        cmpin
+        jnz16 loop
+        stop
+"""
+
+
+async def record_registers(dut, history):
+    #state, R and F of my_cpu after every falling edge, by simulation time
+    cpu = dut.user_project.my_NanoSys.my_cpu
+    while True:
+        await FallingEdge(dut.clk)
+        history[get_sim_time("step")] = {"state": int(cpu.state_reg.value),
+                                         "R": int(cpu.R_reg.value), "F": int(cpu.F_reg.value)}
+
+
+@cocotb.test(skip=GATES)
+async def test_snapshot(dut):
+    #State, R and F through the OUT_CTRL pins, while the CPU runs and once it
+    #stops; with OUT_LATCH=1 also with reads of R and F spread over clocks
+    image = assemble(SNAPSHOT_PROGRAM)
+    await reset_nano(dut)
+    mem = NanoMemory(dut)
+    mem.clear()
+    await mem.load(rom=image.rom, ram=image.ram)
+    history = {}
+    recorder = cocotb.start_soon(record_registers(dut, history))
+    dut.ui_in.value = MSK_MODE_TO_ON
+    await ClockCycles(dut.clk, 16)
+    waits = NanoWaits(dut, clk_period=10, unit="us")
+    dut.ui_in.value = MSK_MODE_TO_ON | MSK_RUN_TO_ON
+    await waits.wait_state_change(timeout_cycles=16)
+    dut.ui_in.value = MSK_MODE_TO_ON
+
+    readers = [NanoSnapshot(dut, clk_period=10, unit="us")]
+    if readers[0].latched:
+        readers.append(NanoSnapshot(dut, clk_period=10, unit="us", settle=get_sim_steps(35, "us")))
+    seen = set()
+    for gap in (3, 7, 11, 13, 17, 19):
+        for snapshot in readers:
+            await ClockCycles(dut.clk, gap, rising=False)
+            regs = await snapshot.read()
+            assert regs == history[snapshot.sampled]
+            seen.add(regs["state"])
+            if not snapshot.latched:
+                #All the reads in the low half of one clock
+                assert get_sim_time("step") - snapshot.sampled < get_sim_steps(5, "us")
+    assert len(seen) > 1
+
+    await waits.wait_until_stop(timeout_cycles=10000)
+    cpu = dut.user_project.my_NanoSys.my_cpu
+    for snapshot in readers:
+        regs = await snapshot.read()
+        assert regs == {"state": 0x00, "R": int(cpu.R_reg.value), "F": int(cpu.F_reg.value)}
+    await FallingEdge(dut.clk)
+    assert dut.ui_in.value.to_unsigned() == MSK_MODE_TO_ON
+    recorder.cancel()
+
+
+IRQ_PROGRAM = """
+        .int0 isr0
+        .int1 isr1
+        .int2 isr2
+        outk 0x07, 0        ; EINT0..2 enabled
+loop:   incir
+        jmp loop
+
+        .org 0xF80
+isr0:   movkb 0x06
+        jmp clear
+isr1:   movkb 0x05
+        jmp clear
+isr2:   movkb 0x03
+clear:  ina 1               ; Flags of int_ctrl, without the one of the ISR
+        and
+        movrla
+        outa 1
+        incjr
+        reti
+"""
+
+
+@cocotb.test(skip=GATES)
+async def test_irq_latency(dut):
+    #Periodic, Poisson and bursty edges on EINT0..2 against a program that
+    #only loops: latencies to the vector and to reti, lost edges and the
+    #shortest period served without losses
+    image = assemble(IRQ_PROGRAM)
+    await reset_nano(dut)
+    mem = NanoMemory(dut)
+    mem.clear()
+    await mem.load(rom=image.rom, ram=image.ram)
+    dut.ui_in.value = MSK_MODE_TO_ON
+    await ClockCycles(dut.clk, 16)
+    waits = NanoWaits(dut, clk_period=10, unit="us")
+    dut.ui_in.value = MSK_MODE_TO_ON | MSK_RUN_TO_ON
+    await waits.wait_state_change(timeout_cycles=16)
+    dut.ui_in.value = MSK_MODE_TO_ON
+    irq = NanoIrqStimulus(dut, clk_period=10, unit="us")
+    irq.start()
+
+    await irq.drive({0: periodic(97, 20)})
+    await irq.drain()
+    assert irq.edges[0] == irq.served[0] == 20 and irq.lost[0] == 0
+    entry, reti = irq.percentiles(0, "entry"), irq.percentiles(0, "reti")
+    assert 8 <= entry[50] <= entry[100] < reti[50] <= reti[100] < 97
+    assert sum(irq.histogram(0, "reti").values()) == 20
+
+    irq.clear()
+    await irq.drive({0: poisson(120, 40, seed=19), 1: poisson(150, 30, seed=20), 2: periodic(131, 30, 7)})
+    await irq.drain()
+    for line in range(3):
+        assert irq.served[line] > 0
+        assert irq.served[line] + irq.lost[line] == irq.edges[line]
+        assert len(irq.latencies[line]["entry"]) == len(irq.latencies[line]["reti"]) == irq.served[line]
+    dut._log.info("\n" + irq.report())
+
+    irq.clear()
+    await irq.drive({1: bursty(3, 3, 200, 5)})
+    await irq.drain()
+    assert irq.served[1] == 5 and irq.lost[1] == 10
+
+    period = await irq.max_period(2, 4, 200, count=8)
+    assert period is not None
+    irq.clear()
+    await irq.drive({2: periodic(period - 1, 8)})
+    await irq.drain()
+    assert irq.lost[2] > 0
+    dut._log.info(f"EINT2 served without losses every {period} clocks "
+                  f"({100e3 / period:.0f} interrupts/s at 100 kHz)")
+    irq.stop()
+    #Without the monitor the edge is never served
+    await irq.drive({0: [0]})
+    with pytest.raises(RuntimeError, match="pending after 50 cycles"):
+        await irq.drain(timeout_cycles=50)
+
+
+SHADOW_PROGRAM = """
+        movka 0xBEEF
+        movam v0
+        movkb 0x1234
+        call sub
+        movam 0x0025        ; Aliases v1 (my_ram uses add[4:0])
+        movma 0x0030        ; Read of an alias of 0x10
+        stop
+sub:    pushb
+        popa
+        ret
+
+        .data
+        .org 0x04
+v0:     .dw 0
+v1:     .dw 0
+"""
+
+
+@cocotb.test(skip=GATES)
+async def test_shadow_memory(dut):
+    #Shadow copies kept from the buses: SPI writes (MODE=0) and a program
+    #(MODE=1) with pushes, calls and aliased data addresses
+    image = assemble(SHADOW_PROGRAM)
+    await reset_nano(dut)
+    spi = NanoSpiMaster(dut, clk_period=10, unit="us")
+    await spi.idle()
+    mem = NanoMemory(dut)
+    mem.clear()
+    shadow = NanoShadow(dut)
+    shadow.start()
+    await spi.load(image.rom, image.ram)
+    await spi.write_rom(0x0F9, 0x5A)     #Aliases 0x079
+    await spi.write_ram(0x21, 0x0BAD)    #Aliases 0x01
+    assert shadow.writes["rom"] == len(image.rom) + 1 and shadow.writes["ram"] == len(image.ram) + 1
+    assert shadow.rom == mem.dump_rom() and shadow.ram == mem.dump_ram()
+    assert shadow.rom[0x079] == 0x5A and shadow.ram[0x01] == 0x0BAD
+    assert len(shadow.errors) == 2
+    shadow.stop()
+
+    shadow = NanoShadow(dut)
+    await run_program(dut, image.rom, image.ram, shadow=shadow)
+    assert shadow.ram[image.symbols["v0"]] == 0xBEEF
+    assert shadow.ram[image.symbols["v1"]] == 0x1234
+    assert shadow.ram == mem.dump_ram() and shadow.stack == mem.dump_stack() and shadow.rom == mem.dump_rom()
+    assert shadow.writes["stack"] > 0
+    shadow.stop()
+    assert [error.split(": ", 1)[1] for error in shadow.errors] == [
+        "RAM address 0x025 on the CPU bus",
+        "RAM write at 0x025 aliases 0x05",
+        "RAM address 0x030 on the CPU bus",
+    ]
+    with pytest.raises(AssertionError, match="0x030"):
+        shadow.check()
+
+
+@cocotb.test(skip=GATES)
+async def test_stimulus_replay(dut):
+    #SPI load, run and read back compiled to pin vectors and replayed by tb.v,
+    #against the same load with NanoSpiMaster (pin writes from Python)
+    image = assemble(ADD_PROGRAM)
+    await reset_nano(dut)
+    mem = NanoMemory(dut)
+    mem.clear()
+    stimulus = NanoStimulus()
+    stimulus.wait(16)
+    stimulus.spi_load(image.rom, image.ram)
+    loaded = stimulus.checkpoint()
+    stimulus.mode(1)
+    stimulus.wait(16)
+    stimulus.pulse_run()
+    stimulus.wait(200)
+    stimulus.mode(0)
+    stimulus.wait(16)
+    first = stimulus.spi_read(SPI_RAM_BASE + image.symbols["first"])
+    total = stimulus.spi_read(SPI_RAM_BASE + image.symbols["sum"])
+    code = stimulus.spi_read(SPI_ROM_BASE + min(image.rom))
+
+    replay = NanoReplay(dut)
+    wall = time.perf_counter()
+    await replay.start(stimulus)
+    await replay.wait_checkpoint(loaded)
+    assert mem.dump_rom(image.rom) == image.rom and mem.read_ram(image.symbols["sum"]) == 0
+    await replay.wait_done()
+    wall = time.perf_counter() - wall
+    assert dut.uo_out.value == 0x00   #Stop state
+    assert mem.read_ram(image.symbols["sum"]) == 7
+
+    miso = await NanoReplay(dut).play(stimulus)
+    assert miso[first] >> 16 == (SPI_READ >> 16) | SPI_RAM_BASE + image.symbols["first"]
+    assert [miso[i] & 0xFFFF for i in (first, total)] == [0x1234, 7]
+    assert miso[code] & 0xFF == image.rom[min(image.rom)]
+
+    await reset_nano(dut)
+    mem.clear()
+    spi = NanoSpiMaster(dut, clk_period=10, unit="us")
+    start = time.perf_counter()
+    await spi.load(image.rom, image.ram)
+    spi_wall = time.perf_counter() - start
+    dut._log.info(f"{len(stimulus.words())} replayed pin vectors ({stimulus.clock} clocks): {wall:.3f} s "
+                  f"for load, run and reads; {spi_wall:.3f} s for the load from Python")
+
+
+@cocotb.test(skip=GATES)
+async def test_spi_tb_master(dut):
+    #The same load, verification and reads shifted by the SPI master of tb.v
+    #and by NanoSpiMaster: same clocks and results, fewer Python wake-ups
+    image = assemble_file(os.path.join(PROGRAMS, "iss_check.asm"))
+    rom = dict(image.rom)
+    rom.update({0xFFA: 0x12, 0xFFB: 0x34, 0xFFD: 0x78})
+    ram = dict(image.ram)
+    ram.update({0x1C: 0x1234, 0x1E: 0xBEEF})
+    addresses = [SPI_RAM_BASE + 0x1E, SPI_ROM_BASE + 0xFFB, SPI_RAM_BASE + 0x1C]
+    results = []
+    for master in (NanoSpiMaster, NanoSpiTbMaster):
+        await reset_nano(dut)
+        mem = NanoMemory(dut)
+        mem.clear()
+        spi = master(dut, clk_period=10, unit="us")
+        await spi.idle()
+        wall, start = time.perf_counter(), get_sim_time("step")
+        await spi.load(rom, ram)
+        loaded = (mem.dump_rom(rom), [mem.read_ram(a) for a in sorted(ram)])
+        mismatches = await spi.verify(rom, ram)
+        words = await spi.read_words(addresses)
+        single = [await spi.read_rom(0xFFD), await spi.read_ram(0x1E)]
+        code, data = await spi.dump(rom=[(0xFFA, 4)], ram=[(0x1C, 3)])
+        steps, wall = get_sim_time("step") - start, time.perf_counter() - wall
+        results.append((steps, spi.frames, loaded, mismatches, words, single, code, data))
+        dut._log.info(f"{master.__name__}: {spi.frames} frames in {wall:.3f} s")
+    assert results[0] == results[1]
+    steps, frames, loaded, mismatches, words, single, code, data = results[1]
+    assert loaded == (rom, [ram[a] for a in sorted(ram)]) and mismatches == []
+    assert words == [0xBEEF, 0x34, 0x1234] and single == [0x78, 0xBEEF]
+    assert code == {0xFFA: 0x12, 0xFFB: 0x34, 0xFFC: 0, 0xFFD: 0x78}
+    assert data == {0x1C: 0x1234, 0x1D: 0, 0x1E: 0xBEEF}
+
+
+async def record_spi_pins(dut, changes):
+    #(clk cycles from the first change, CS/MOSI/SCK) of the pins seen by the project
+    pins = dut.ui_pins
+    start = None
+    while True:
+        await pins.value_change
+        now = get_sim_time("step")
+        start = now if start is None else start
+        spi = (pins.value.to_unsigned() >> 3) & 0x7
+        if not changes or changes[-1][1] != spi:
+            changes.append(((now - start) // get_sim_steps(10, "us"), spi))
+
+
+@cocotb.test(skip=GATES)
+async def test_spi_timing(dut):
+    #A burst write and a single write by NanoSpiMaster, NanoSpiTbMaster and
+    #a replayed NanoStimulus: the same pins at the same clocks, with SCK high
+    #half + burst_gap cycles between the words and CS high cs_gap + burst_gap
+    #cycles after the burst (plus the wait for the next falling edge)
+    header = spi_word(SPI_BURST | SPI_RAM_BASE + 0x03, 0x1234)
+    words = [0xBEEF, 0x0F0F]
+    timelines = []
+    for master in (NanoSpiMaster, NanoSpiTbMaster, None):
+        await reset_nano(dut)
+        await NanoSpiMaster(dut, clk_period=10, unit="us").idle()
+        changes = []
+        recorder = cocotb.start_soon(record_spi_pins(dut, changes))
+        if master is None:
+            stimulus = NanoStimulus()
+            stimulus.spi_frame(header, words=words)
+            stimulus.spi_write(SPI_RAM_BASE + 0x10, 0x5A5A)
+            await NanoReplay(dut).play(stimulus)
+        else:
+            spi = master(dut, clk_period=10, unit="us")
+            await spi.transfer(header, words=words)
+            await spi.write_word(SPI_RAM_BASE + 0x10, 0x5A5A)
+        recorder.cancel()
+        timelines.append(changes)
+    assert timelines[0] == timelines[1] == timelines[2]
+
+    edges = list(zip([(None, 0b111)] + timelines[0], timelines[0]))   #From the idle pins
+    sck_rises = [t for (_, last), (t, pins) in edges if pins & 1 and not last & 1]
+    sck_falls = [t for (_, last), (t, pins) in edges if last & 1 and not pins & 1]
+    cs = [t for (_, last), (t, pins) in edges if (pins ^ last) & 4]
+    assert len(sck_rises) == 32 + 16 + 16 + 32
+    #SCK high between the words of the burst: 4 clocks (sck_div 8) + burst_gap 8
+    assert sck_falls[32] - sck_rises[31] == 4 + 8 and sck_falls[48] - sck_rises[47] == 4 + 8
+    #CS high after the burst: cs_gap 4 + burst_gap 8, and one clock to the next falling edge
+    assert cs[2] - cs[1] == 4 + 8 + 1
+
+
+@cocotb.test(skip=GATES)
+async def test_checkpoint_restore(dut):
+    #A warm checkpoint after the SPI load (MODE=1, before RUN) and another one
+    #in the middle of the program: every variant forked from them ends as the
+    #program run from reset (NanoISS) and as the run that took the checkpoint
+    image = assemble_file(os.path.join(PROGRAMS, "iss_check.asm"))
+    table = image.symbols["table"]
+    await reset_nano(dut)
+    spi = NanoSpiMaster(dut, clk_period=10, unit="us")
+    await spi.idle()
+    mem = NanoMemory(dut)
+    mem.clear()
+    await spi.load(image.rom, image.ram)
+    dut.ui_in.value = MSK_MODE_TO_ON
+    await ClockCycles(dut.clk, 16, rising=False)
+    checkpoints = NanoCheckpoint(dut)
+    warm = checkpoints.take()
+    cpu = dut.user_project.my_NanoSys.my_cpu
+
+    async def run(middle=None):
+        #RUN from the warm checkpoint (or go on from `middle`) to the stop state
+        waits = NanoWaits(dut, clk_period=10, unit="us", signal=cpu.state_reg)
+        if middle is None:
+            dut.ui_in.value = MSK_MODE_TO_ON | MSK_RUN_TO_ON
+            await waits.wait_state_change(timeout_cycles=16)
+        await waits.wait_until_stop(timeout_cycles=10000)
+        await FallingEdge(dut.clk)
+        return ({name: int(getattr(cpu, name + "_reg").value) for name, _ in REGISTERS},
+                mem.dump_ram(), mem.dump_stack())
+
+    for values in ([1, 2, 3, 4], [0xFFFF, 0x8000, 0x7FFF, 0]):
+        checkpoints.restore(warm)
+        assert checkpoints.differences(warm) == []
+        mem.load_ram(values, start=table)
+        iss = NanoISS()
+        iss.load(image.rom, {**image.ram, **{table + i: v for i, v in enumerate(values)}})
+        iss.run()
+        assert await run() == (iss.registers(), iss.ram, iss.stack)
+
+    checkpoints.restore(warm)
+    dut.ui_in.value = MSK_MODE_TO_ON | MSK_RUN_TO_ON
+    await ClockCycles(dut.clk, 40, rising=False)
+    middle = checkpoints.take()
+    assert middle["registers"]["my_cpu.state_reg"] != 0
+    expected = await run(middle)
+    for _ in range(2):
+        checkpoints.restore(middle)
+        assert await run(middle) == expected
+
+
+@cocotb.test(skip=GATES)
+async def test_coverage(dut):
+    #The instruction class programs and irq.asm with a collector of their
+    #own: every bin hit is in the coverage space, the opcodes are the ones
+    #NanoISS executed, and the counts survive a save, load and merge
+    coverage = NanoCoverage()
+    coverage.start(dut)
+    executed = {}
+    for name, eint0 in (("alu", ()), ("mul", ()), ("shift", ()), ("jumps", ()), ("stack", ()),
+                        ("mem", ()), ("io", ()), ("irq", range(150, 153))):
+        iss = await compare_with_iss(dut, assemble_file(os.path.join(PROGRAMS, name + ".asm")), eint0)
+        await ClockCycles(dut.clk, 2)   #The stop state seen before the next reset
+        for opcode, (count, _) in iss.profile.items():
+            executed[opcode] = executed.get(opcode, 0) + count
+    await reset_nano(dut)
+    spi = NanoSpiMaster(dut, clk_period=10, unit="us")
+    await spi.idle()
+    await spi.write_ram_words(0x04, [0x1234, 0x5678])
+    assert await spi.read_ram_words(0x04, 2) == [0x1234, 0x5678]
+    await ClockCycles(dut.clk, 2)
+    coverage.stop()
+    dut._log.info(coverage.report(uncovered=False))
+
+    assert not any(coverage.unexpected().values())
+    assert set(coverage.opcodes) == set(executed) - {"irq"}
+    assert coverage.opcode_states["irq", "ini_iss"] == executed["irq"]
+    assert coverage.opcodes["call"] == executed["call"]
+    assert {outcome for (name, outcome) in coverage.branches} == {"taken", "not_taken"}
+    assert {(name, bit) for name, bit, _ in coverage.flags} <= \
+        {(name, bit) for name, bits in coverage.space.flag_bits.items() for bit in range(8) if bits >> bit & 1}
+    assert {"do_state", "write_ram", "read_ram"} <= set(coverage.spi_states)
+    assert ("read_ram", "wait_low_o") in coverage.spi_transitions
+
+    missing = coverage.uncovered()
+    assert "uncovered opcodes:" in coverage.report() and missing["opcodes"]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "coverage.json")
+        coverage.save(path)
+        loaded = NanoCoverage.load(path)
+        for category in CATEGORIES:
+            assert getattr(loaded, category) == getattr(coverage, category)
+        merged = NanoCoverage.load(path).merge(loaded)
+    assert merged.runs == 2
+    assert merged.transitions == {key: 2 * n for key, n in coverage.transitions.items()}
+    assert merged.uncovered() == missing
+    other = NanoCoverage(mul_mode=coverage.modes["MUL_MODE"] + 1)
+    with pytest.raises(ValueError):
+        merged.merge(other)
@@ -0,0 +1,109 @@
+#test_multi.py
+#=============================================================================
+# Pruebas con Cocotb de varias copias de NanoCpuSys en un solo simulador
+#=============================================================================
+# Testbench tb_multi.v generado con gen_tb_multi.py (make MULTI=N)
+# Programas repartidos entre las copias con nano_multi.py
+# Resultados comparados con nano_iss.py
+#=============================================================================
+
+import os
+import time
+
+import cocotb
+import numpy as np
+from cocotb.triggers import ClockCycles
+from cocotb.utils import get_sim_time
+
+from nano_asm import assemble, assemble_file
+from nano_batch import STOPPED, TIMEOUT
+from nano_iss import NanoISS
+from nano_mem import NanoMemory
+from nano_multi import NanoMulti
+from nano_spi import NanoSpiMaster
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "programs")
+#The slots are loaded through the backdoor of the RTL model (not GATES=yes)
+GATES = os.environ.get("GATES") == "yes"
+CLASSES = ("alu", "mul", "shift", "jumps", "stack", "mem", "io")
+
+ADD_PROGRAM = """
+        movka 3
+        movkb 4
+        uadd            ; R = A + B
+        movrla
+        movam sum
+        stop
+
+        .data
+        .org 0x10
+sum:    .dw 0
+"""
+
+
+def iss_results(rom, ram):
+    iss = NanoISS()
+    iss.load(rom, ram)
+    cycles = iss.run()
+    return {"status": STOPPED, "cycles": cycles, "registers": iss.registers(),
+            "ram": iss.ram, "stack": iss.stack}
+
+
+@cocotb.test(skip=GATES)
+async def test_multi_matches_iss(dut):
+    #The instruction class programs and copies of iss_check.asm with random
+    #tables, more than one per slot, against NanoISS
+    multi = NanoMulti(dut, clk_period=10, unit="us")
+    await multi.start()
+    images = [assemble_file(os.path.join(PROGRAMS, name + ".asm")) for name in CLASSES]
+    jobs = [(image.rom, image.ram) for image in images]
+    for values in np.random.default_rng(23).integers(0, 0x10000, (2 * len(multi), 4)).tolist():
+        #Every assembly returns its own image
+        image = assemble_file(os.path.join(PROGRAMS, "iss_check.asm"))
+        table = image.symbols["table"]
+        image.ram.update({table + i: v for i, v in enumerate(values)})
+        jobs.append((image.rom, image.ram))
+    assert len({tuple(sorted(ram.items())) for _, ram in jobs[len(images):]}) == 2 * len(multi)
+
+    start, wall = get_sim_time("us"), time.perf_counter()
+    results = await multi.run_programs(jobs)
+    elapsed, wall = get_sim_time("us") - start, time.perf_counter() - wall
+    for job, result in zip(jobs, results):
+        assert result == iss_results(*job)
+    assert sum(multi.jobs) == len(jobs) and min(multi.jobs) > 0
+    serial = sum(result["cycles"] for result in results) * 10
+    dut._log.info(f"{len(jobs)} programs on {len(multi)} slots in {elapsed:.0f} us ({wall:.2f} s), "
+                  f"{serial} us of program clocks, jobs per slot {multi.jobs}")
+
+
+@cocotb.test(skip=GATES)
+async def test_multi_independent_pins(dut):
+    #A different SPI load on every slot at the same time, and a program that
+    #does not stop (TIMEOUT) next to ones that do
+    multi = NanoMulti(dut, clk_period=10, unit="us")
+    await multi.start()
+
+    async def load(slot, n):
+        spi = NanoSpiMaster(slot, clk_period=10, unit="us")
+        await spi.idle()
+        NanoMemory(slot).clear()
+        await spi.write_ram_words(0x04, [n, 0x1000 + n])
+        await spi.write_rom(0x010 + n, n)
+        return await spi.read_ram_words(0x04, 2)
+
+    assert await multi.map(load, range(len(multi))) == [[n, 0x1000 + n] for n in range(len(multi))]
+    for n, slot in enumerate(multi.slots):
+        mem = NanoMemory(slot)
+        assert mem.dump_ram()[4:6] == [n, 0x1000 + n]
+        assert [mem.read_rom(0x010 + m) for m in range(len(multi))] == [n if m == n else 0 for m in range(len(multi))]
+
+    loop = assemble("""
+here:   jmp here
+""")
+    stop = assemble(ADD_PROGRAM)
+    jobs = [loop] + [stop] * (len(multi) - 1)
+    results = await multi.run_programs(jobs, max_cycles=500)
+    assert [result["status"] for result in results] == [TIMEOUT] + [STOPPED] * (len(multi) - 1)
+    for result in results[1:]:
+        assert result["ram"][stop.symbols["sum"]] == 7
+    await ClockCycles(dut.clk, 2)